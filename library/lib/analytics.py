@@ -0,0 +1,410 @@
+"""Book issuance analytics: daily counters, weekly and monthly rollups, and chart series.
+
+Every recorded issuance is added to three tables: the daily
+``BookIssuanceRecord`` and the ``BookIssuanceWeek``/``BookIssuanceMonth``
+rollups.  Each table gets one ``INSERT ... ON CONFLICT DO UPDATE SET
+quantity_issued = quantity_issued + excluded.quantity_issued`` (``ON
+DUPLICATE KEY UPDATE`` on MySQL), so concurrent approvals of the same book
+never lose a count; other backends fall back to an insert that ignores
+conflicts followed by an ``F()`` increment.
+
+With ``ANALYTICS_BUFFER_ISSUANCES`` on, ``record_issuance`` only adds to an
+in-process ``IssuanceBuffer`` that coalesces counts per ``(book, date)``
+and writes them in one transaction every ``ANALYTICS_FLUSH_SECONDS``, or at
+the end of each request when that is 0.  Counts still buffered when a
+process dies are lost, so the buffer is off by default.
+
+``issuance_series`` reads only the table of the requested resolution, so a
+ten-year chart reads about 120 monthly rows per book instead of 3650 daily
+ones, and periods without issuances are filled with zeros on a NumPy date
+range rather than left out of the series.
+
+``rebuild_from_issues`` (``manage.py rebuild_issuance_analytics``)
+recomputes the counters from the ``Issue`` table with one ``GROUP BY
+book, issued_date`` query whose rows are written with chunked
+``bulk_create``, then rebuilds the rollups from the daily counters.
+
+``library_analytics`` covers the whole library for the admin dashboard.
+The database only groups the window's issues into three small columnar
+result sets, counts per ``(issued, due, returned)`` date combination, per
+book with its category, and per reader, so a few thousand rows reach
+Python however many issues there are.  Issues per period, the overdue
+rate, the average loan length and the top books, categories and readers
+are then weighted NumPy operations on those columns.
+``get_library_analytics`` caches the result under the current date.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncMonth, TruncWeek
+
+from .models import Book, BookIssuanceMonth, BookIssuanceRecord, BookIssuanceWeek, Category, Fine, Issue, Reader
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_BUFFER_ISSUANCES = getattr(settings, 'ANALYTICS_BUFFER_ISSUANCES', False)
+ANALYTICS_FLUSH_SECONDS = getattr(settings, 'ANALYTICS_FLUSH_SECONDS', 5)
+ANALYTICS_MAX_DAYS = getattr(settings, 'ANALYTICS_MAX_DAYS', 3660)
+# Without an explicit resolution, the finest one giving at most this many points is used
+ANALYTICS_MAX_POINTS = getattr(settings, 'ANALYTICS_MAX_POINTS', 120)
+LIBRARY_ANALYTICS_TOP = getattr(settings, 'LIBRARY_ANALYTICS_TOP', 10)
+LIBRARY_ANALYTICS_CACHE_SECONDS = getattr(settings, 'LIBRARY_ANALYTICS_CACHE_SECONDS', 24 * 60 * 60)
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def _period_end(resolution, day):
+    if resolution == 'week':
+        return week_start(day) + timedelta(days=6)
+    return (month_start(day) + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+
+
+# resolution -> (table, its date column, start of the period containing a day)
+TABLES = {
+    'day': (BookIssuanceRecord, 'date', lambda day: day),
+    'week': (BookIssuanceWeek, 'period_start', week_start),
+    'month': (BookIssuanceMonth, 'period_start', month_start),
+}
+RESOLUTIONS = tuple(TABLES)
+
+
+REBUILD_BATCH_SIZE = getattr(settings, 'ANALYTICS_REBUILD_BATCH_SIZE', 5000)
+
+# Rows per upsert statement; three parameters each keeps SQLite under its variable limit
+UPSERT_BATCH_SIZE = 300
+
+
+def _upsert_sql(model, field, rows):
+    qn = connection.ops.quote_name
+    table, count = qn(model._meta.db_table), qn('quantity_issued')
+    columns = f"{qn('book_id')}, {qn(model._meta.get_field(field).column)}"
+    sql = f"INSERT INTO {table} ({columns}, {count}) VALUES " + ', '.join(['(%s, %s, %s)'] * rows)
+    if connection.vendor == 'mysql':
+        return sql + f" ON DUPLICATE KEY UPDATE {count} = {count} + VALUES({count})"
+    return sql + f" ON CONFLICT ({columns}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}"
+
+
+def _add_counts(model, field, book_counts, period):
+    if connection.vendor in ('sqlite', 'postgresql', 'mysql'):
+        value = connection.ops.adapt_datefield_value(period)
+        items = list(book_counts.items())
+        with connection.cursor() as cursor:
+            for i in range(0, len(items), UPSERT_BATCH_SIZE):
+                batch = items[i:i + UPSERT_BATCH_SIZE]
+                params = [p for book_id, copies in batch for p in (book_id, value, copies)]
+                cursor.execute(_upsert_sql(model, field, len(batch)), params)
+        return
+    model.objects.bulk_create(
+        [model(book_id=book_id, **{field: period}) for book_id in book_counts],
+        batch_size=500, ignore_conflicts=True,
+    )
+    by_count = defaultdict(list)
+    for book_id, copies in book_counts.items():
+        by_count[copies].append(book_id)
+    for copies, book_ids in by_count.items():
+        model.objects.filter(book_id__in=book_ids, **{field: period}).update(
+            quantity_issued=F('quantity_issued') + copies
+        )
+
+
+def record_issuances(book_counts, on_date):
+    """Add ``{book_id: copies}`` to the daily counters and the rollups for ``on_date``."""
+    for model, field, period_of in TABLES.values():
+        _add_counts(model, field, book_counts, period_of(on_date))
+
+
+class IssuanceBuffer:
+    """Issuance counts per ``(book_id, date)`` waiting to be written by ``flush()``."""
+
+    def __init__(self, flush_seconds=ANALYTICS_FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        # held for a whole flush, so flush() returns only after earlier flushes have committed
+        self._flushing = threading.Lock()
+        self._counts = Counter()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._counts)
+
+    def add(self, book_id, on_date, copies=1):
+        with self._lock:
+            self._counts[(book_id, on_date)] += copies
+            self._schedule()
+
+    def _schedule(self):
+        # called with the lock held
+        if self.flush_seconds and self._timer is None:
+            self._timer = threading.Timer(self.flush_seconds, self._flush_in_thread)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Flushing buffered issuance counts failed; retrying later")
+        finally:
+            connection.close()
+
+    def flush(self):
+        """Write the buffered counts in one transaction. Returns the number of ``(book, date)`` pairs written."""
+        with self._flushing:
+            with self._lock:
+                counts, self._counts = self._counts, Counter()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not counts:
+                return 0
+            by_date = defaultdict(dict)
+            for (book_id, on_date), copies in counts.items():
+                by_date[on_date][book_id] = copies
+            try:
+                with transaction.atomic():
+                    for on_date, book_counts in by_date.items():
+                        record_issuances(book_counts, on_date)
+            except Exception:
+                with self._lock:
+                    self._counts.update(counts)
+                    self._schedule()
+                raise
+            return len(counts)
+
+
+issuance_buffer = IssuanceBuffer()
+if ANALYTICS_BUFFER_ISSUANCES:
+    atexit.register(issuance_buffer.flush)
+
+
+def record_issuance(book_id, on_date, copies=1):
+    """Count ``copies`` issued of a book on ``on_date``, buffered when ``ANALYTICS_BUFFER_ISSUANCES`` is on."""
+    if ANALYTICS_BUFFER_ISSUANCES:
+        issuance_buffer.add(book_id, on_date, copies)
+    else:
+        record_issuances({book_id: copies}, on_date)
+
+
+def _in_range(queryset, field, start, end, book_ids):
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lte': end})
+    if book_ids:
+        queryset = queryset.filter(book_id__in=book_ids)
+    return queryset
+
+
+def _replace(model, field, totals, start, end, book_ids, batch_size, progress):
+    """Delete ``model`` rows in the range and write ``(book_id, period, quantity)`` rows from ``totals``."""
+    _in_range(model.objects.all(), field, start, end, book_ids).delete()
+    rows = (
+        model(book_id=book_id, quantity_issued=quantity, **{field: period})
+        for book_id, period, quantity in totals.iterator(chunk_size=batch_size)
+    )
+    written = 0
+    while batch := list(islice(rows, batch_size)):
+        model.objects.bulk_create(batch)
+        written += len(batch)
+        if progress:
+            progress(model, written)
+    return written
+
+
+def rebuild_from_issues(start=None, end=None, book_ids=None, batch_size=REBUILD_BATCH_SIZE, progress=None):
+    """Recompute the counters from the ``Issue`` table, in one transaction.
+
+    Only issues dated ``start``..``end`` (inclusive; either may be None) and, if given,
+    of ``book_ids`` are counted.  Weeks and months that straddle the range are rebuilt
+    whole from the daily counters.  ``progress(model, rows_written)`` is called after each
+    batch.  Returns ``{model: rows written}``.
+    """
+    written = {}
+    with transaction.atomic():
+        issues = _in_range(Issue.objects.order_by(), 'issued_date', start, end, book_ids)
+        totals = issues.values('book_id', 'issued_date').annotate(n=Count('pk')).values_list('book_id', 'issued_date', 'n')
+        written[BookIssuanceRecord] = _replace(
+            BookIssuanceRecord, 'date', totals, start, end, book_ids, batch_size, progress,
+        )
+        for resolution, trunc in (('week', TruncWeek), ('month', TruncMonth)):
+            model, field, period_of = TABLES[resolution]
+            first = start and period_of(start)
+            daily = _in_range(BookIssuanceRecord.objects.order_by(), 'date', first,
+                              end and _period_end(resolution, end), book_ids)
+            totals = (
+                daily.values('book_id', period=trunc('date'))
+                .annotate(n=Sum('quantity_issued')).values_list('book_id', 'period', 'n')
+            )
+            written[model] = _replace(model, field, totals, first, end and period_of(end), book_ids,
+                                      batch_size, progress)
+    return written
+
+
+def pick_resolution(days):
+    """The finest resolution that keeps a ``days`` long window within ``ANALYTICS_MAX_POINTS``."""
+    if days <= ANALYTICS_MAX_POINTS:
+        return 'day'
+    if days <= ANALYTICS_MAX_POINTS * 7:
+        return 'week'
+    return 'month'
+
+
+def _periods(start, end, resolution):
+    """NumPy array of the period starts from the period holding ``start`` to the one holding ``end``."""
+    if resolution == 'month':
+        return np.arange(np.datetime64(start, 'M'), np.datetime64(end, 'M') + 1).astype('datetime64[D]')
+    step = 7 if resolution == 'week' else 1
+    period_of = TABLES[resolution][2]
+    return np.arange(np.datetime64(period_of(start)), np.datetime64(end) + 1, step)
+
+
+def issuance_series(book, days=90, resolution=None, end_date=None):
+    """Issuances of ``book`` in the last ``days`` days, one value per day, week or month.
+
+    Weeks and months are whole: the first period may start before the window.
+    Returns ``(period starts as datetime64[D] array, counts as int array, resolution)``.
+    """
+    days = min(max(days, 1), ANALYTICS_MAX_DAYS)
+    resolution = resolution or pick_resolution(days)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=days)
+    model, field, period_of = TABLES[resolution]
+
+    periods = _periods(start_date, end_date, resolution)
+    counts = np.zeros(len(periods), dtype=np.int64)
+    rows = np.array(
+        list(model.objects.filter(book=book, **{f'{field}__gte': period_of(start_date), f'{field}__lte': end_date})
+             .values_list(field, 'quantity_issued')),
+        dtype=[('period', 'datetime64[D]'), ('quantity', np.int64)],
+    )
+    if len(rows):
+        counts[np.searchsorted(periods, rows['period'])] = rows['quantity']
+    return periods, counts, resolution
+
+
+def get_book_analytics_data(book, days=90, resolution=None):
+    """Chart data for ``book``: a dense series over the last ``days`` days plus totals."""
+    periods, counts, resolution = issuance_series(book, days, resolution)
+    total = int(counts.sum())
+    # the counts cover whole periods, from the start of the first one up to today
+    covered_days = (date.today() - periods[0].item()).days + 1
+    return {
+        'resolution': resolution,
+        'dates': np.datetime_as_string(periods).tolist(),
+        'quantities': counts.tolist(),
+        'total_issued': total,
+        'avg_per_day': total / covered_days,
+    }
+
+
+def _columns(queryset, dtype):
+    """The rows of a ``values_list`` queryset as a NumPy structured array (None dates become NaT)."""
+    return np.array(list(queryset), dtype=dtype)
+
+
+def _top(ids, counts, limit):
+    """``ids`` and ``counts`` of the ``limit`` largest counts, largest first."""
+    order = np.argsort(-counts, kind='stable')[:limit]
+    return ids[order], counts[order]
+
+
+def _ranked(model, ids, counts, label=str, default=None):
+    found = model.objects.in_bulk(ids.tolist())
+    return [
+        {'id': int(pk), 'name': label(found[pk]) if pk in found else default, 'issues': int(n)}
+        for pk, n in zip(ids.tolist(), counts.tolist())
+    ]
+
+
+def library_analytics(days=90, resolution=None, end_date=None, top=LIBRARY_ANALYTICS_TOP):
+    """Circulation of the whole library over the ``days`` days up to ``end_date``.
+
+    Covers the issues dated in the window: issues per day, week or month, the share
+    returned late or still out past their due date, the average loan length of the
+    returned ones and the ``top`` books, categories and readers.  Fines are those
+    calculated in the window.
+    """
+    days = min(max(days, 1), ANALYTICS_MAX_DAYS)
+    resolution = resolution or pick_resolution(days)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=days)
+    issues = Issue.objects.filter(issued_date__gte=start_date, issued_date__lte=end_date).order_by()
+
+    loans = _columns(
+        issues.values('issued_date', 'due_date', 'returned_date').annotate(n=Count('pk'))
+        .values_list('issued_date', 'due_date', 'returned_date', 'n'),
+        [('issued', 'datetime64[D]'), ('due', 'datetime64[D]'), ('returned', 'datetime64[D]'), ('n', np.int64)],
+    )
+    periods = _periods(start_date, end_date, resolution)
+    per_period = np.bincount(
+        np.searchsorted(periods, loans['issued'], side='right') - 1,
+        weights=loans['n'], minlength=len(periods),
+    ).astype(np.int64)
+    returned = ~np.isnat(loans['returned'])
+    late = np.where(returned, loans['returned'] > loans['due'], loans['due'] < np.datetime64(end_date))
+    loan_days = (loans['returned'][returned] - loans['issued'][returned]).astype(np.int64)
+    total = int(loans['n'].sum())
+
+    by_book = _columns(
+        issues.values('book_id', category=Coalesce('book__category_id', 0)).annotate(n=Count('pk'))
+        .values_list('book_id', 'category', 'n'),
+        [('book', np.int64), ('category', np.int64), ('n', np.int64)],
+    )
+    category_ids, which = np.unique(by_book['category'], return_inverse=True)
+    per_category = np.bincount(which, weights=by_book['n'], minlength=len(category_ids)).astype(np.int64)
+    by_reader = _columns(
+        issues.values('reader_id').annotate(n=Count('pk')).values_list('reader_id', 'n'),
+        [('reader', np.int64), ('n', np.int64)],
+    )
+
+    fines = Fine.objects.filter(calculated_date__gte=start_date, calculated_date__lte=end_date).aggregate(
+        collected=Sum('amount', filter=Q(paid=True)),
+        outstanding=Sum('amount', filter=Q(paid=False)),
+    )
+    return {
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'resolution': resolution,
+        'dates': np.datetime_as_string(periods).tolist(),
+        'issues': per_period.tolist(),
+        'total_issued': total,
+        'avg_per_day': total / (days + 1),
+        'overdue': int(loans['n'][late].sum()),
+        'overdue_rate': float(loans['n'][late].sum() / total) if total else 0.0,
+        'avg_loan_days': float(np.average(loan_days, weights=loans['n'][returned])) if returned.any() else None,
+        'top_books': _ranked(Book, *_top(by_book['book'], by_book['n'], top), label=lambda book: book.name),
+        'top_categories': _ranked(Category, *_top(category_ids, per_category, top), default='Uncategorized'),
+        'top_readers': _ranked(Reader, *_top(by_reader['reader'], by_reader['n'], top), label=lambda reader: reader.name),
+        'fine_revenue': float(fines['collected'] or 0),
+        'fines_outstanding': float(fines['outstanding'] or 0),
+    }
+
+
+def library_analytics_cache_key(days, resolution=None, day=None):
+    return f'lib:library_analytics:{(day or date.today()).isoformat()}:{days}:{resolution or "auto"}'
+
+
+def get_library_analytics(days=90, resolution=None):
+    """``library_analytics`` up to today, computed at most once a day per window and resolution."""
+    today = date.today()
+    key = library_analytics_cache_key(days, resolution, today)
+    data = cache.get(key)
+    if data is None:
+        data = library_analytics(days, resolution, today)
+        cache.set(key, data, LIBRARY_ANALYTICS_CACHE_SECONDS)
+    return data
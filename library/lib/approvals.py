@@ -0,0 +1,121 @@
+"""Batch approval and rejection of pending issue requests.
+
+``approve_request`` checks and issues one request per call, which costs a
+dozen queries each.  ``approve_requests`` applies the same rules to many
+requests at once: the selected requests, their readers and books, the
+readers' open issue and pending request counts and the current stock are
+loaded up front, every decision is made in memory in request order, and
+the resulting ``Issue``, ``Notification`` and ``BookIssuanceRecord`` rows,
+stock changes and request flags are written with bulk statements in a
+single transaction.
+"""
+from collections import Counter, namedtuple
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Count
+
+from . import dashboard, exports
+from .analytics import record_issuances
+from .circulation import MAX_ISSUED_PER_READER, loan_period_due_date, take_stock
+from .models import Book, Issue, IssueRequest
+from .notifications import create_issue_notifications, create_request_rejected_notifications
+
+RequestOutcome = namedtuple('RequestOutcome', ['request', 'approved', 'message'])
+
+
+def _pending_requests(request_ids):
+    return list(
+        IssueRequest.objects.select_for_update(of=('self',))
+        .select_related('reader', 'book')
+        .filter(pk__in=request_ids, approved=False, rejected=False)
+        .order_by('request_date', 'pk')
+    )
+
+
+def _counts_by_reader(queryset):
+    return dict(queryset.order_by().values('reader_id').annotate(n=Count('pk')).values_list('reader_id', 'n'))
+
+
+def approve_requests(request_ids):
+    """Approve the given pending requests in bulk.
+
+    Each request is checked like ``approve_request`` does: it is rejected if
+    the reader is over ``MAX_ISSUED_PER_READER`` (issued plus pending), if
+    they already hold the book, or if no copy is left.  Earlier decisions in
+    the batch count towards later ones.  Returns one ``RequestOutcome`` per
+    pending request, in the order they were processed.
+    """
+    today = date.today()
+    with transaction.atomic():
+        pending = _pending_requests(request_ids)
+        if not pending:
+            return []
+        reader_ids = {req.reader_id for req in pending}
+        book_ids = {req.book_id for req in pending}
+
+        issued = _counts_by_reader(Issue.objects.filter(reader_id__in=reader_ids, returned_date__isnull=True))
+        requested = _counts_by_reader(IssueRequest.objects.filter(reader_id__in=reader_ids, approved=False, rejected=False))
+        held = set(Issue.objects.filter(
+            reader_id__in=reader_ids, book_id__in=book_ids, returned_date__isnull=True
+        ).values_list('reader_id', 'book_id'))
+        stock = dict(Book.objects.select_for_update().filter(pk__in=book_ids).values_list('pk', 'number_in_stock'))
+
+        outcomes, issues, approved, rejected = [], [], [], []
+        for req in pending:
+            reader, book = req.reader, req.book
+            total = issued.get(reader.pk, 0) + requested.get(reader.pk, 0)
+            requested[reader.pk] = requested.get(reader.pk, 0) - 1
+            if total > MAX_ISSUED_PER_READER:
+                message = (
+                    f"Cannot approve request: {reader.name} already has {total} books/pending requests, "
+                    f"which exceeds the limit of {MAX_ISSUED_PER_READER}."
+                )
+            elif (reader.pk, book.pk) in held:
+                message = f"{reader.name} already has '{book.name}' issued."
+            elif stock[book.pk] <= 0:
+                message = f"No copies of '{book.name}' are available."
+            else:
+                issued[reader.pk] = issued.get(reader.pk, 0) + 1
+                held.add((reader.pk, book.pk))
+                stock[book.pk] -= 1
+                issues.append(Issue(reader=reader, book=book, due_date=loan_period_due_date(today, reader.is_staff_member)))
+                approved.append(req.pk)
+                outcomes.append(RequestOutcome(req, True, f"'{book.name}' issued to {reader.name}."))
+                continue
+            rejected.append(req.pk)
+            outcomes.append(RequestOutcome(req, False, message))
+
+        if issues:
+            book_counts = Counter(issue.book_id for issue in issues)
+            take_stock(book_counts)
+            Issue.objects.bulk_create(issues, batch_size=500)
+            exports.touch(Issue)
+            if any(issue.pk is None for issue in issues):
+                # backends that cannot return ids from a bulk insert: the open
+                # (reader, book) pair identifies each new issue
+                new_ids = dict(((r, b), pk) for pk, r, b in Issue.objects.filter(
+                    reader_id__in=reader_ids, book_id__in=book_ids, returned_date__isnull=True
+                ).values_list('pk', 'reader_id', 'book_id'))
+                for issue in issues:
+                    issue.pk = new_ids[(issue.reader_id, issue.book_id)]
+            create_issue_notifications(issues)
+            record_issuances(book_counts, today)
+            IssueRequest.objects.filter(pk__in=approved).update(approved=True)
+        if rejected:
+            IssueRequest.objects.filter(pk__in=rejected).update(rejected=True)
+        dashboard.adjust(
+            {'active_issues': len(issues), 'pending_requests': -len(pending)},
+            Counter(issue.due_date for issue in issues),
+        )
+    return outcomes
+
+
+def reject_requests(request_ids):
+    """Reject the given pending requests and notify their readers. Returns how many were rejected."""
+    with transaction.atomic():
+        pending = _pending_requests(request_ids)
+        IssueRequest.objects.filter(pk__in=[req.pk for req in pending]).update(rejected=True)
+        dashboard.adjust({'pending_requests': -len(pending)})
+        create_request_rejected_notifications(pending)
+    return len(pending)
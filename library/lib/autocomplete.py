@@ -0,0 +1,269 @@
+"""Process-local autocomplete index for the live book search box.
+
+``ajax_search_books`` is called on every keypress, so instead of asking the
+database to rank matches we keep the lower-cased name, author and ISBN of
+every book in memory and return the top ``limit`` book ids; the view only
+hydrates those rows from the database.
+
+Books are stored sorted by name, and each field is packed into a single
+``\\x00``-separated string.  A substring search is then a ``str.find`` scan
+that produces hits already in name order, so each priority group (name
+starts-with, name contains, author starts-with, author contains, ISBN
+starts-with, ISBN contains -- the same ranking as ``search.search_books``)
+stops scanning as soon as enough results are found.  Name prefixes are
+found by bisection.  This keeps memory close to the raw text size, which a
+per-trigram set index does not.
+
+Edits arriving through the Book signals in ``lib/signals.py`` go into a
+small overlay that is merged into the packed arrays once it grows past
+``COMPACT_THRESHOLD``.  The index is built lazily on first use in each
+process and rebuilt every ``AUTOCOMPLETE_REFRESH_SECONDS`` to pick up writes
+made by other processes.  One thread builds at a time: during a refresh the
+others keep querying the current arrays, and only the first build (or one
+after ``invalidate()``) makes them wait.  Edits that arrive while a build is
+reading the books are journaled and replayed onto the new arrays, so a book
+saved during the read is not lost if the read missed it.  Within a
+priority group results are ordered by case-folded name.
+"""
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+from django.conf import settings
+
+AUTOCOMPLETE_REFRESH_SECONDS = getattr(settings, 'AUTOCOMPLETE_REFRESH_SECONDS', 300)
+COMPACT_THRESHOLD = 2000
+
+SEP = '\x00'
+NAME, AUTHOR, ISBN = 0, 1, 2
+
+
+def _entry(name, author, isbn):
+    return (
+        (name or '').lower().replace(SEP, ''),
+        (author or '').lower().replace(SEP, ''),
+        (isbn or '').lower().replace(SEP, ''),
+    )
+
+
+def _priority(q, name, author, isbn):
+    if name.startswith(q):
+        return 0
+    if q in name:
+        return 1
+    if author.startswith(q):
+        return 2
+    if q in author:
+        return 3
+    if isbn.startswith(q):
+        return 4
+    if q in isbn:
+        return 5
+    return None
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load([])
+        self.built_at = None
+        self._journal = None  # (pk, entry or None) edits made while build() reads its rows
+        self._invalidated = False
+
+    @property
+    def building(self):
+        return self._journal is not None
+
+    def __len__(self):
+        return len(self._pks) - len(self._removed) + len(self._pending)
+
+    def _load(self, entries):
+        """Pack sorted ``(name, pk, author, isbn, category_id)`` tuples into the search arrays."""
+        self._pks = array('q', (e[1] for e in entries))
+        self._cats = [e[4] for e in entries]
+        self._blobs = []
+        self._starts = []
+        for field in (0, 2, 3):
+            values = [e[field] for e in entries]
+            self._blobs.append(SEP + SEP.join(values) + SEP)
+            # offset of the first character of each value, plus a sentinel past the end
+            self._starts.append(array('q', accumulate((len(v) + 1 for v in values), initial=1)))
+        self._row_of = {pk: i for i, pk in enumerate(self._pks)}
+        self._pending = {}   # pk -> (name, author, isbn, category_id) added or changed since packing
+        self._removed = set()  # pks whose packed row is stale
+
+    def build(self, rows):
+        """(Re)build from an iterable of ``(pk, name, author, isbn, category_id)``.
+
+        ``rows`` should be lazy (a queryset iterator), so that edits made once it
+        starts being read are journaled and replayed onto the result.
+        """
+        with self._lock:
+            self._journal = []
+            self._invalidated = False
+        try:
+            entries = []
+            for pk, name, author, isbn, category_id in rows:
+                name, author, isbn = _entry(name, author, isbn)
+                entries.append((name, pk, author, isbn, category_id))
+            entries.sort()
+        except BaseException:
+            with self._lock:
+                self._journal = None
+            raise
+        with self._lock:
+            journal, self._journal = self._journal, None
+            self._load(entries)
+            for pk, entry in journal:
+                if entry is None:
+                    self._remove(pk)
+                else:
+                    self._add(pk, entry)
+            # invalidated while reading: the rows may predate a bulk write, so rebuild on next use
+            self.built_at = None if self._invalidated else time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._invalidated = True
+            self.built_at = None
+
+    def _value(self, field, row):
+        starts = self._starts[field]
+        return self._blobs[field][starts[row]:starts[row + 1] - 1]
+
+    def _compact(self):
+        entries = []
+        for row, pk in enumerate(self._pks):
+            if pk not in self._removed:
+                entries.append((self._value(NAME, row), pk, self._value(AUTHOR, row),
+                                self._value(ISBN, row), self._cats[row]))
+        for pk, (name, author, isbn, category_id) in self._pending.items():
+            entries.append((name, pk, author, isbn, category_id))
+        entries.sort()
+        self._load(entries)
+
+    def _add(self, pk, entry):
+        if pk in self._row_of:
+            self._removed.add(pk)
+        self._pending[pk] = entry
+        if len(self._pending) + len(self._removed) > COMPACT_THRESHOLD:
+            self._compact()
+
+    def _remove(self, pk):
+        self._pending.pop(pk, None)
+        if pk in self._row_of:
+            self._removed.add(pk)
+
+    def add(self, pk, name, author, isbn, category_id):
+        entry = _entry(name, author, isbn) + (category_id,)
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((pk, entry))
+            self._add(pk, entry)
+
+    def remove(self, pk):
+        with self._lock:
+            if self._journal is not None:
+                self._journal.append((pk, None))
+            self._remove(pk)
+
+    def _scan(self, field, q, prefix):
+        """Yield packed rows whose ``field`` contains (or starts with) ``q``, in name order."""
+        blob, starts = self._blobs[field], self._starts[field]
+        needle = SEP + q if prefix else q
+        pos = 0
+        while True:
+            pos = blob.find(needle, pos)
+            if pos < 0:
+                return
+            row = bisect_right(starts, pos + 1 if prefix else pos) - 1
+            if row >= len(self._pks):
+                return
+            yield row
+            pos = starts[row + 1] - (1 if prefix else 0)
+
+    def _name_prefix_rows(self, q):
+        row = bisect_left(range(len(self._pks)), q, key=lambda i: self._value(NAME, i))
+        while row < len(self._pks) and self._value(NAME, row).startswith(q):
+            yield row
+            row += 1
+
+    def query(self, q, limit=8, category_id=None):
+        """Return up to ``limit`` matching book ids, best match first."""
+        q = (q or '').lower().replace(SEP, '')
+        with self._lock:
+            groups = (
+                self._name_prefix_rows(q),
+                (r for r in self._scan(NAME, q, False) if not self._value(NAME, r).startswith(q)),
+                (r for r in self._scan(AUTHOR, q, True) if q not in self._value(NAME, r)),
+                (r for r in self._scan(AUTHOR, q, False)
+                 if q not in self._value(NAME, r) and not self._value(AUTHOR, r).startswith(q)),
+                (r for r in self._scan(ISBN, q, True)
+                 if q not in self._value(NAME, r) and q not in self._value(AUTHOR, r)),
+                (r for r in self._scan(ISBN, q, False)
+                 if q not in self._value(NAME, r) and q not in self._value(AUTHOR, r)
+                 and not self._value(ISBN, r).startswith(q)),
+            )
+            ranked = []
+            for prio, rows in enumerate(groups if q else groups[:1]):
+                for row in rows:
+                    if len(ranked) >= limit:
+                        break
+                    pk = self._pks[row]
+                    if pk in self._removed or (category_id is not None and self._cats[row] != category_id):
+                        continue
+                    ranked.append((prio, self._value(NAME, row), pk))
+                if len(ranked) >= limit:
+                    break
+
+            # Books edited since the last compaction are few, so they are checked directly
+            for pk, (name, author, isbn, cat) in self._pending.items():
+                if category_id is not None and cat != category_id:
+                    continue
+                prio = _priority(q, name, author, isbn)
+                if prio is not None:
+                    ranked.append((prio, name, pk))
+            return [pk for _, _, pk in heapq.nsmallest(limit, ranked)]
+
+
+_index = AutocompleteIndex()
+_build_lock = threading.Lock()
+
+
+def _needs_build():
+    built_at = _index.built_at
+    return built_at is None or time.monotonic() - built_at > AUTOCOMPLETE_REFRESH_SECONDS
+
+
+def get_index():
+    """Return the process-wide index, building or refreshing it from the database if needed."""
+    from .models import Book
+
+    # wait for a build in progress only when there is no usable index to query meanwhile
+    if _needs_build() and _build_lock.acquire(blocking=_index.built_at is None):
+        try:
+            if _needs_build():
+                _index.build(
+                    Book.objects.values_list('pk', 'name', 'author', 'isbn', 'category_id').iterator(chunk_size=5000)
+                )
+        finally:
+            _build_lock.release()
+    return _index
+
+
+def index_book(book):
+    if _index.built_at is not None or _index.building:
+        _index.add(book.pk, book.name, book.author, book.isbn, book.category_id)
+
+
+def unindex_book(book_id):
+    if _index.built_at is not None or _index.building:
+        _index.remove(book_id)
+
+
+def invalidate():
+    """Rebuild on next use; cheaper than indexing books one by one after a bulk import."""
+    _index.invalidate()
@@ -0,0 +1,108 @@
+"""Stock-safe issuing and returning of books.
+
+Every path that hands out or takes back a copy (``issue_book``,
+``approve_request``, ``import_issues``, ``return_book``) goes through this
+module.  Stock is changed with a conditional ``UPDATE ... SET
+number_in_stock = number_in_stock - 1 WHERE number_in_stock > 0`` inside the
+same transaction that writes the ``Issue`` row, so two clerks issuing the
+last copy at the same time cannot both succeed, and no other column of the
+book is overwritten.
+"""
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import dashboard, exports
+from .models import Book, Issue
+
+# maximum number of books a reader can have at once (including pending requests)
+MAX_ISSUED_PER_READER = getattr(settings, 'MAX_ISSUED_PER_READER', 5)
+
+
+class CirculationError(Exception):
+    pass
+
+
+class OutOfStock(CirculationError):
+    pass
+
+
+class AlreadyIssued(CirculationError):
+    pass
+
+
+def loan_period_due_date(issued_date, is_staff_member=False):
+    """Staff members keep books ~6 months, everyone else 14 days."""
+    if is_staff_member:
+        return issued_date + timedelta(days=182)
+    return issued_date + timedelta(days=14)
+
+
+def take_copies(book_id, count=1):
+    """Atomically remove `count` copies from stock. Returns False if not enough are available."""
+    return bool(Book.objects.filter(pk=book_id, number_in_stock__gte=count).update(
+        number_in_stock=F('number_in_stock') - count
+    ))
+
+
+def take_stock(book_counts):
+    """Take ``{book_id: copies}`` out of stock with one UPDATE per distinct copy count.
+
+    Raises OutOfStock, leaving the caller to roll back, if any book no
+    longer has enough copies.
+    """
+    by_count = defaultdict(list)
+    for book_id, copies in book_counts.items():
+        by_count[copies].append(book_id)
+    for copies, book_ids in by_count.items():
+        taken = Book.objects.filter(pk__in=book_ids, number_in_stock__gte=copies).update(
+            number_in_stock=F('number_in_stock') - copies
+        )
+        if taken != len(book_ids):
+            raise OutOfStock("Stock changed while the books were being issued. Please try again.")
+
+
+def return_copies(book_id, count=1):
+    Book.objects.filter(pk=book_id).update(number_in_stock=F('number_in_stock') + count)
+
+
+def issue_copy(reader, book, issued_date=None, due_date=None):
+    """Take one copy of `book` from stock and record it as issued to `reader`.
+
+    Raises OutOfStock if no copy is available and AlreadyIssued if the reader
+    already holds an unreturned copy; in both cases nothing is written.
+    """
+    issued_date = issued_date or date.today()
+    with transaction.atomic():
+        if not take_copies(book.pk):
+            raise OutOfStock(f"No copies of '{book.name}' are available.")
+        try:
+            with transaction.atomic():
+                issue = Issue(reader=reader, book=book, issued_date=issued_date)
+                if due_date:
+                    issue.due_date = due_date
+                issue.save()
+        except IntegrityError:
+            # unique_active_issue: the reader already holds this book
+            raise AlreadyIssued(f"{reader.name} already has '{book.name}' issued.")
+    return issue
+
+
+def return_issue(issue, returned_date=None):
+    """Mark `issue` returned and put the copy back in stock. Returns False if it was already returned."""
+    returned_date = returned_date or date.today()
+    with transaction.atomic():
+        closed = Issue.objects.filter(pk=issue.pk, returned_date__isnull=True).update(
+            returned_date=returned_date, updated_at=timezone.now(),
+        )
+        if not closed:
+            return False
+        return_copies(issue.book_id)
+        exports.touch(Issue)
+        dashboard.adjust({'active_issues': -1}, {issue.due_date: -1})
+    issue.returned_date = returned_date
+    return True
@@ -0,0 +1,176 @@
+"""Materialized counters for the admin dashboard.
+
+The dashboard reads one ``DashboardStats`` row instead of counting the
+books, readers, issues, requests and fines on every load.  Each counter
+moves with the rows it counts:
+
+* ``post_save``/``post_delete`` receivers (``lib/signals.py``) add what a
+  row counts for when it is created or deleted.  For issues, requests and
+  fines, whose updates can change what they count for, a ``pre_save``
+  receiver reads the stored row first and the difference is applied.
+  Saves whose ``update_fields`` leave out every counted column
+  (``COUNTED_FIELDS``) skip both the read and the update;
+* paths that write without signals (``bulk_create`` and queryset
+  ``update()`` in ``approvals``, ``circulation``, ``importers`` and
+  ``fines``) call ``adjust()`` with their totals.
+
+Every change is one ``UPDATE ... SET counter = counter + delta`` in the
+transaction that writes the rows, so it commits or rolls back with them.
+The price is a hot row: every transaction that issues, returns, approves
+or fines holds the lock on the single ``DashboardStats`` row from that
+update until it commits, so those transactions run one at a time past
+that point.  Those transactions should stay short; if the lock ever
+becomes the bottleneck, the counters can be split over several rows that
+``get_stats()`` sums.
+
+``overdue_issues`` counts the open issues due before ``overdue_as_of``.
+Issues fall due without any write, so the first ``get_stats()`` on a later
+day adds the open issues that fell due since then, counted on the partial
+``issue_active_due_idx`` index, and moves ``overdue_as_of`` to today.
+
+Writes that bypass both, such as raw SQL or another bulk statement, make
+the counters drift; ``reconcile()`` (``manage.py reconcile_dashboard_stats``)
+recounts everything and reports the difference.
+"""
+from collections import Counter
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Book, DashboardStats, Fine, Issue, IssueRequest, Reader
+
+STATS_PK = 1
+COUNTERS = ('total_books', 'total_readers', 'active_issues', 'overdue_issues', 'pending_requests', 'unpaid_fines')
+
+# models whose rows can change what they count for when updated
+CHANGEABLE = (Issue, IssueRequest, Fine)
+# the columns of those models that _contribution() reads
+COUNTED_FIELDS = frozenset({'returned_date', 'due_date', 'approved', 'rejected', 'paid', 'amount'})
+
+
+def _contribution(row):
+    """What one row counts for: ``({counter: amount}, its due date if it is an open issue)``."""
+    if isinstance(row, Book):
+        return {'total_books': 1}, None
+    if isinstance(row, Reader):
+        return {'total_readers': 1}, None
+    if isinstance(row, Issue):
+        if row.returned_date is None:
+            return {'active_issues': 1}, row.due_date
+        return {}, None
+    if isinstance(row, IssueRequest):
+        return {'pending_requests': int(not row.approved and not row.rejected)}, None
+    return {'unpaid_fines': Decimal('0') if row.paid else Decimal(str(row.amount))}, None
+
+
+def _overdue_delta(due_dates):
+    """SQL for how many of ``{due_date: n}`` fall before the stored ``overdue_as_of``."""
+    whens, total = [], 0
+    for due, n in sorted(due_dates.items()):
+        total += n
+        whens.append(When(overdue_as_of__gt=due, then=Value(total)))
+    # latest date first: an overdue_as_of after it counts every date, and so on down
+    whens.reverse()
+    return Case(*whens, default=Value(0), output_field=IntegerField())
+
+
+def adjust(counts=None, due_dates=None):
+    """Add ``{counter: delta}`` to the stored counters.
+
+    ``due_dates`` is ``{due_date: n}`` for open issues gained (n > 0) or closed or
+    removed (n < 0); those already past ``overdue_as_of`` also move ``overdue_issues``.
+    Does nothing before the row exists, since ``get_stats()`` then counts from scratch.
+    """
+    updates = {name: F(name) + delta for name, delta in (counts or {}).items() if delta}
+    due_dates = {due: n for due, n in (due_dates or {}).items() if n}
+    if due_dates:
+        updates['overdue_issues'] = F('overdue_issues') + _overdue_delta(due_dates)
+    if updates:
+        DashboardStats.objects.filter(pk=STATS_PK).update(**updates)
+
+
+def _counts_untouched(update_fields):
+    return update_fields is not None and COUNTED_FIELDS.isdisjoint(update_fields)
+
+
+def remember(instance, update_fields=None):
+    """Keep what ``instance``'s stored row counts for, for ``row_saved`` to diff against."""
+    if isinstance(instance, CHANGEABLE) and instance.pk is not None and not _counts_untouched(update_fields):
+        stored = type(instance)._default_manager.filter(pk=instance.pk).first()
+        instance._dashboard_before = stored and _contribution(stored)
+
+
+def row_saved(instance, created, update_fields=None):
+    counts, due = _contribution(instance)
+    if not created:
+        if not isinstance(instance, CHANGEABLE) or _counts_untouched(update_fields):
+            return
+        before = getattr(instance, '_dashboard_before', None)
+        instance._dashboard_before = None
+        if before is not None:
+            old_counts, old_due = before
+            counts = {name: counts.get(name, 0) - old_counts.get(name, 0) for name in counts.keys() | old_counts.keys()}
+            due_dates = Counter({due: 1} if due else {})
+            due_dates.subtract({old_due: 1} if old_due else {})
+            adjust(counts, due_dates)
+            return
+    adjust(counts, {due: 1} if due else None)
+
+
+def row_deleted(instance):
+    counts, due = _contribution(instance)
+    adjust({name: -amount for name, amount in counts.items()}, {due: -1} if due else None)
+
+
+def count_all(today=None):
+    """The counters recounted from the tables."""
+    today = today or date.today()
+    open_issues = Issue.objects.filter(returned_date__isnull=True)
+    return {
+        'total_books': Book.objects.count(),
+        'total_readers': Reader.objects.count(),
+        'active_issues': open_issues.count(),
+        'overdue_issues': open_issues.filter(due_date__lt=today).count(),
+        'pending_requests': IssueRequest.objects.filter(approved=False, rejected=False).count(),
+        'unpaid_fines': Fine.objects.filter(paid=False).aggregate(total=Sum('amount'))['total'] or Decimal('0'),
+    }
+
+
+def reconcile(today=None):
+    """Recount every counter and store the counts. Returns ``(stats, {counter: (stored, actual)})`` for drifted counters."""
+    today = today or date.today()
+    with transaction.atomic():
+        # lock the row before counting: writers committing meanwhile wait to apply their deltas
+        stats, _ = DashboardStats.objects.select_for_update().get_or_create(pk=STATS_PK)
+        actual = count_all(today)
+        drift = {
+            name: (getattr(stats, name), value) for name, value in actual.items()
+            if getattr(stats, name) != value
+        }
+        for name, value in actual.items():
+            setattr(stats, name, value)
+        stats.overdue_as_of = today
+        stats.reconciled_at = timezone.now()
+        stats.save()
+    return stats, drift
+
+
+def get_stats(today=None):
+    """The dashboard counters: one primary-key read, plus the overdue catch-up once a day."""
+    today = today or date.today()
+    stats = DashboardStats.objects.filter(pk=STATS_PK).first()
+    if stats is None or stats.overdue_as_of is None:
+        return reconcile(today)[0]
+    if stats.overdue_as_of < today:
+        with transaction.atomic():
+            stats = DashboardStats.objects.select_for_update().get(pk=STATS_PK)
+            if stats.overdue_as_of < today:
+                stats.overdue_issues += Issue.objects.filter(
+                    returned_date__isnull=True, due_date__gte=stats.overdue_as_of, due_date__lt=today,
+                ).count()
+                stats.overdue_as_of = today
+                stats.save(update_fields=['overdue_issues', 'overdue_as_of'])
+    return stats
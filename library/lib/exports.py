@@ -0,0 +1,489 @@
+"""Issue, fine and reader reports for the ``export_*`` views and background jobs.
+
+Each report in ``REPORTS`` declares its queryset, its columns (a
+``values_list()`` field plus a formatter) and how to shorten a row for the
+PDF table.  Rows are read with ``values_list(...).iterator()``, so only the
+exported columns are fetched and never the whole table at once; CSV is
+written row by row, either streamed to the browser (``stream_csv``) or to
+a file.  ``render_export`` writes a report in one of ``FORMATS`` to any
+writable file object, so the same code serves a direct download and an
+export job (see ``lib/jobs.py``).  XLSX uses openpyxl's write-only mode,
+which streams rows into the file instead of building the sheet in memory.
+PDF is laid out one page-sized ``LongTable`` at a time with fixed column
+widths and row heights, so reportlab never measures or splits the whole
+table; the tables are pulled from the row iterator as the layout reaches
+them.
+
+Finished exports are kept in ``EXPORT_CACHE_DIR``, keyed by report, format
+and a stamp of the versions of the tables the report reads.  ``touch()``
+bumps a table's ``TableVersion`` after each committed write (signals cover
+``save()``/``delete()``; bulk writes call it themselves), so a download of
+unchanged data is served from disk, and the stamp doubles as the ETag.
+The directory defaults to one under the system temp directory and is
+created readable by the server user only.
+
+Delta exports (``stream_delta_csv``) list only the rows whose
+``updated_at`` is at or after a point in time, merged in time order with
+the ``Tombstone`` rows of deletions.  Issues and fines also show their
+reader's and book's names, so a row counts as changed when its reader or
+book was updated too (the report's ``related`` models), at the latest of
+those times.  Each export hands out a cursor for the
+next one (``next_cursor``), set ``EXPORT_DELTA_OVERLAP`` seconds before the
+export started so rows written by transactions still open at that moment
+are not missed; rows may appear in two consecutive deltas, so consumers
+apply them as upserts.
+
+Tombstones are kept for ``EXPORT_TOMBSTONE_RETENTION_DAYS`` and then
+deleted by ``prune_tombstones()`` (``manage.py prune_tombstones``, run
+daily from cron).  A delta from before that horizon could miss deletions,
+so ``delta_expired()`` tells the view to send the full report instead.
+"""
+import csv
+import glob
+import hashlib
+import heapq
+import itertools
+import os
+import tempfile
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+
+from .models import Book, Fine, Issue, Reader, TableVersion, Tombstone
+
+try:
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph
+    from reportlab.lib import colors
+    REPORTLAB_AVAILABLE = True
+except ImportError:
+    REPORTLAB_AVAILABLE = False
+
+FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pdf': 'application/pdf',
+}
+
+EXPORT_CHUNK_SIZE = getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+# Cached exports hold reader, issue and fine data: keep them outside the source tree and MEDIA_ROOT
+EXPORT_CACHE_DIR = getattr(settings, 'EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'library-export-cache'))
+EXPORT_DELTA_OVERLAP = getattr(settings, 'EXPORT_DELTA_OVERLAP', 60)
+EXPORT_TOMBSTONE_RETENTION_DAYS = getattr(settings, 'EXPORT_TOMBSTONE_RETENTION_DAYS', 30)
+HEADER_FONT = Font(bold=True)
+
+# ``tables`` lists every model the report reads, so writes to any of them change its stamp; the
+# first one is the model the report lists, whose ``updated_at`` and tombstones drive delta exports.
+# ``related`` is ``(path, model)`` for each related row whose columns the report shows: a change
+# to one of those rows is a change to the listed rows that point at it.
+Report = namedtuple('Report', [
+    'title', 'filename', 'empty_message', 'list_view', 'queryset', 'columns', 'pdf_row', 'tables', 'related',
+])
+
+# A column reads one field of ``values_list()`` (``__`` paths follow relations)
+# and formats it for export.
+Column = namedtuple('Column', ['label', 'field', 'format'])
+
+
+def _returned_date(value):
+    return value or 'Not Returned'
+
+
+def _returned_status(value):
+    return 'Returned' if value else 'Not Returned'
+
+
+def _pdf_fine_row(item):
+    return {**item, 'Amount': f"₹{item['Amount']}"}
+
+
+def _pdf_reader_row(item):
+    address = item['Address']
+    return {**item, 'Address': address[:20] + '...' if len(address) > 20 else address}
+
+
+def _same(value):
+    return value
+
+
+REPORTS = {
+    'issues': Report(
+        'Issues Report', 'issues', "No issues found to export.", 'view_issues',
+        lambda: Issue.objects.order_by('-issued_date'),
+        [
+            Column('Reader Name', 'reader__name', _same),
+            Column('Reader ID', 'reader__reader_id', _same),
+            Column('Book Name', 'book__name', _same),
+            Column('ISBN', 'book__isbn', _same),
+            Column('Issued Date', 'issued_date', _same),
+            Column('Due Date', 'due_date', _same),
+            Column('Returned Date', 'returned_date', _returned_date),
+            Column('Status', 'returned_date', _returned_status),
+        ],
+        dict,
+        (Issue, Reader, Book),
+        (('reader', Reader), ('book', Book)),
+    ),
+    'fines': Report(
+        'Fines Report', 'fines', "No fines found to export.", 'view_fines',
+        lambda: Fine.objects.order_by('-calculated_date'),
+        [
+            Column('Reader Name', 'issue__reader__name', _same),
+            Column('Reader ID', 'issue__reader__reader_id', _same),
+            Column('Book Name', 'issue__book__name', _same),
+            Column('Amount', 'amount', float),
+            Column('Calculated Date', 'calculated_date', _same),
+            Column('Status', 'paid', lambda paid: 'Paid' if paid else 'Unpaid'),
+        ],
+        _pdf_fine_row,
+        (Fine, Issue, Reader, Book),
+        (('issue__reader', Reader), ('issue__book', Book)),
+    ),
+    'readers': Report(
+        'Readers Report', 'readers', "No readers found to export.", 'view_readers',
+        lambda: Reader.objects.order_by('name'),
+        [
+            Column('Reader ID', 'reader_id', _same),
+            Column('Name', 'name', _same),
+            Column('Date of Birth', 'date_of_birth', _same),
+            Column('Phone', 'phone_number', _same),
+            Column('Address', 'address', _same),
+            Column('Status', 'is_active', lambda active: 'Active' if active else 'Inactive'),
+            Column('Role', 'is_staff_member', lambda staff: 'Staff/Teacher' if staff else 'Student'),
+        ],
+        _pdf_reader_row,
+        (Reader,),
+        (),
+    ),
+}
+
+
+def iter_rows(report, progress=None, queryset=None, keys=()):
+    """Yield formatted rows, fetching only the exported columns ``EXPORT_CHUNK_SIZE`` rows at a time.
+
+    ``queryset`` narrows the report's own; the raw values of the ``keys`` fields lead each row.
+    """
+    fields = list(dict.fromkeys([*keys, *(column.field for column in report.columns)]))
+    key_positions = [fields.index(key) for key in keys]
+    positions = [(fields.index(column.field), column.format) for column in report.columns]
+    queryset = report.queryset() if queryset is None else queryset
+    rows = queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    for count, values in enumerate(rows, start=1):
+        yield [values[i] for i in key_positions] + [fmt(values[i]) for i, fmt in positions]
+        if progress and count % 1000 == 0:
+            progress(count)
+
+
+class _Echo:
+    """File-like object whose write() returns the data, for feeding csv.writer into a generator."""
+    def write(self, value):
+        return value
+
+
+def stream_csv(name, stamp=None):
+    """Yield report ``name`` as CSV text, one row at a time, for a StreamingHttpResponse.
+
+    With ``stamp`` the rows are also written to the export cache, which keeps the file only if
+    the whole report was sent.
+    """
+    report = REPORTS[name]
+    writer = csv.writer(_Echo())
+    lines = itertools.chain([writer.writerow(_labels(report))], (writer.writerow(row) for row in iter_rows(report)))
+    if stamp is None:
+        yield from lines
+        return
+    with caching(name, 'csv', stamp) as out:
+        for line in lines:
+            out.write(line.encode('utf-8'))
+            yield line
+    out.close()
+
+
+def _labels(report):
+    return [column.label for column in report.columns]
+
+
+DELTA_LABELS = ['ID', 'Change', 'Changed At']
+_CURSOR_SALT = 'lib.exports.delta_cursor'
+
+
+def parse_since(value):
+    """An aware datetime from an ISO 8601 date or date-time (naive values are in the current time zone).
+
+    Raises ValueError for anything else.
+    """
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Not an ISO 8601 date or date-time: {value!r}")
+        moment = datetime.combine(day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def next_cursor():
+    """Cursor for the delta after an export that starts now; take it before reading any rows."""
+    return signing.dumps((timezone.now() - timedelta(seconds=EXPORT_DELTA_OVERLAP)).isoformat(), salt=_CURSOR_SALT)
+
+
+def parse_cursor(cursor):
+    """The point in time a cursor from ``next_cursor`` stands for. Raises ValueError if it was altered."""
+    try:
+        return datetime.fromisoformat(signing.loads(cursor, salt=_CURSOR_SALT))
+    except (signing.BadSignature, TypeError) as e:
+        raise ValueError("Invalid export cursor") from e
+
+
+def delta_horizon():
+    """The oldest point a delta can start from: tombstones before it may have been pruned."""
+    return timezone.now() - timedelta(days=EXPORT_TOMBSTONE_RETENTION_DAYS)
+
+
+def delta_expired(since):
+    return since < delta_horizon()
+
+
+def prune_tombstones():
+    """Delete tombstones older than ``EXPORT_TOMBSTONE_RETENTION_DAYS``. Returns how many were deleted."""
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=delta_horizon()).delete()
+    return deleted
+
+
+def stream_delta_csv(name, since):
+    """Yield, as CSV, the rows of report ``name`` changed at or after ``since`` and the ids deleted since.
+
+    A row has changed when it or one of the report's ``related`` rows was updated.
+
+    Rows come in the order they changed, led by ``DELTA_LABELS``: the row id, ``upsert`` or
+    ``delete``, and the time of the change.  Deleted rows have only those three values.
+    """
+    report = REPORTS[name]
+    model = report.tables[0]
+    writer = csv.writer(_Echo())
+    yield writer.writerow(DELTA_LABELS + _labels(report))
+    changed = Q(updated_at__gte=since)
+    for path, related in report.related:
+        # an indexed IN per relation rather than a join, so each part can use its index
+        changed |= Q(**{f'{path}__in': related.objects.filter(updated_at__gte=since).values('pk')})
+    changed_at = (
+        Greatest('updated_at', *(f'{path}__updated_at' for path, _ in report.related))
+        if report.related else F('updated_at')
+    )
+    rows = report.queryset().filter(changed).annotate(changed_at=changed_at).order_by('changed_at', 'pk')
+    upserts = (
+        (changed_at, pk, 'upsert', row)
+        for pk, changed_at, *row in iter_rows(report, queryset=rows, keys=('pk', 'changed_at'))
+    )
+    deleted = Tombstone.objects.filter(table=model._meta.db_table, deleted_at__gte=since).order_by('deleted_at', 'pk')
+    deletes = (
+        (deleted_at, object_id, 'delete', [])
+        for object_id, deleted_at in deleted.values_list('object_id', 'deleted_at').iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    # a row deleted and re-created under the same id must come out in that order
+    for changed_at, pk, change, row in heapq.merge(upserts, deletes, key=lambda item: item[0]):
+        yield writer.writerow([pk, change, changed_at.isoformat()] + row)
+
+
+def _write_csv(report, out, progress=None):
+    writer = csv.writer(out)
+    writer.writerow(_labels(report))
+    count = 0
+    for count, row in enumerate(iter_rows(report, progress), start=1):
+        writer.writerow(row)
+    return count
+
+
+def _write_xlsx(report, out, progress=None):
+    """Write rows straight into a write-only workbook; ``out`` must be a seekable binary file."""
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(report.title[:31])
+    header = []
+    for label in _labels(report):
+        cell = WriteOnlyCell(sheet, value=label)
+        cell.font = HEADER_FONT
+        header.append(cell)
+    sheet.append(header)
+    count = 0
+    for count, row in enumerate(iter_rows(report, progress), start=1):
+        sheet.append(row)
+    workbook.save(out)
+    return count
+
+
+PDF_HEADER_HEIGHT = 24
+PDF_ROW_HEIGHT = 14
+PDF_FONT_SIZE = 8
+# Frame padding SimpleDocTemplate puts inside the page margins, top plus bottom.
+_PDF_FRAME_PADDING = 12
+
+if REPORTLAB_AVAILABLE:
+    # Shared by every page's table; range commands only, so applying it costs the same for any row count.
+    PDF_TABLE_STYLE = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('FONTSIZE', (0, 1), (-1, -1), PDF_FONT_SIZE),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ])
+
+    class _StreamingDocTemplate(SimpleDocTemplate):
+        """Takes flowables from ``pending`` as the layout consumes them instead of from one full list."""
+
+        def __init__(self, out, pending, **kwargs):
+            super().__init__(out, **kwargs)
+            self._pending = pending
+            self._story = None
+
+        def build(self, flowables, **kwargs):
+            self._story = flowables
+            super().build(flowables, **kwargs)
+
+        def filterFlowables(self, flowables):
+            # called before each flowable is laid out (also for reportlab's internal page-start
+            # list); keep one queued in the story so build() does not stop early
+            if flowables is self._story and len(flowables) < 2:
+                flowables.extend(itertools.islice(self._pending, 1))
+
+
+def _pdf_cells(report, rows):
+    labels = _labels(report)
+    for row in rows:
+        yield [str(value) for value in report.pdf_row(dict(zip(labels, row))).values()]
+
+
+def _pdf_col_widths(labels, sample):
+    """Column widths from the header and the first page of rows, so every page's table lines up."""
+    widths = [stringWidth(label, 'Helvetica-Bold', 10) for label in labels]
+    for cells in sample:
+        widths = [max(width, stringWidth(cell, 'Helvetica', PDF_FONT_SIZE)) for width, cell in zip(widths, cells)]
+    return [width + 12 for width in widths]
+
+
+def _write_pdf(report, out, progress=None):
+    labels = _labels(report)
+    cells = _pdf_cells(report, iter_rows(report, progress))
+    title = Paragraph(report.title, getSampleStyleSheet()['Title'])
+
+    sample = list(itertools.islice(cells, 100))
+    col_widths = _pdf_col_widths(labels, sample)
+    pagesize = A4
+    if sum(col_widths) > A4[0] - 144 - _PDF_FRAME_PADDING:
+        pagesize = landscape(A4)
+    frame_width = pagesize[0] - 144 - _PDF_FRAME_PADDING
+    if sum(col_widths) > frame_width:
+        col_widths = [width * frame_width / sum(col_widths) for width in col_widths]
+
+    count = 0
+
+    def tables():
+        nonlocal count
+        page_height = pagesize[1] - 144 - _PDF_FRAME_PADDING - PDF_HEADER_HEIGHT
+        first_height = page_height - title.wrap(frame_width, page_height)[1] - title.getSpaceAfter()
+        rows = itertools.chain(sample, cells)
+        size = int(first_height // PDF_ROW_HEIGHT)
+        while True:
+            page = list(itertools.islice(rows, size))
+            if not page:
+                return
+            count += len(page)
+            table = LongTable([labels] + page, colWidths=col_widths,
+                              rowHeights=[PDF_HEADER_HEIGHT] + [PDF_ROW_HEIGHT] * len(page), repeatRows=1)
+            table.setStyle(PDF_TABLE_STYLE)
+            yield table
+            size = int(page_height // PDF_ROW_HEIGHT)
+
+    doc = _StreamingDocTemplate(out, tables(), pagesize=pagesize, title=report.title)
+    doc.build([title])
+    return count
+
+
+WRITERS = {'csv': _write_csv, 'xlsx': _write_xlsx, 'pdf': _write_pdf}
+
+
+def render_export(name, fmt, out, progress=None):
+    """Write report ``name`` as ``fmt`` to ``out``. Returns the number of rows.
+
+    ``out`` must accept text for CSV and bytes for PDF (an ``HttpResponse``
+    accepts both); XLSX needs a seekable binary file.  ``progress(rows)`` is called while
+    the rows are being read.
+    """
+    return WRITERS[fmt](REPORTS[name], out, progress)
+
+
+def touch(*models):
+    """Bump the table versions of ``models`` once the current transaction commits."""
+    tables = [model._meta.db_table for model in models]
+    transaction.on_commit(lambda: _bump(tables))
+
+
+def _bump(tables):
+    if TableVersion.objects.filter(table__in=tables).update(version=F('version') + 1) < len(tables):
+        TableVersion.objects.bulk_create([TableVersion(table=table, version=1) for table in tables],
+                                         ignore_conflicts=True)
+
+
+def version_stamp(name):
+    """Short digest of the versions of every table report ``name`` reads."""
+    tables = sorted(model._meta.db_table for model in REPORTS[name].tables)
+    versions = dict(TableVersion.objects.filter(table__in=tables).values_list('table', 'version'))
+    key = ','.join(f'{table}:{versions.get(table, 0)}' for table in tables)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _cache_path(name, fmt, stamp):
+    return os.path.join(EXPORT_CACHE_DIR, f'{name}-{stamp}.{fmt}')
+
+
+def open_cached(name, fmt, stamp):
+    """The cached export for ``stamp`` opened for reading, or None."""
+    try:
+        return open(_cache_path(name, fmt, stamp), 'rb')
+    except FileNotFoundError:
+        return None
+
+
+@contextmanager
+def caching(name, fmt, stamp):
+    """Yield a binary file to render the export into; it becomes the cached export if the block succeeds.
+
+    The file is left open and rewound for serving, and the caller closes it.  Older versions of
+    the same export are removed.
+    """
+    os.makedirs(EXPORT_CACHE_DIR, mode=0o700, exist_ok=True)
+    fd, partial = tempfile.mkstemp(dir=EXPORT_CACHE_DIR, prefix=f'{name}-', suffix='.part')
+    out = os.fdopen(fd, 'w+b')
+    try:
+        yield out
+        out.flush()
+        # an open file survives the rename and any later cleanup, so it can still be served
+        os.replace(partial, _cache_path(name, fmt, stamp))
+    except BaseException:
+        out.close()
+        os.remove(partial)
+        raise
+    out.seek(0)
+    for path in glob.glob(os.path.join(EXPORT_CACHE_DIR, f'{name}-*.{fmt}')):
+        if path != _cache_path(name, fmt, stamp):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
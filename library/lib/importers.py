@@ -0,0 +1,350 @@
+"""Bulk imports of issue records (CSV) and books (Excel).
+
+``import_issues_csv`` streams the uploaded file instead of reading it into
+memory and works through it ``ISSUE_IMPORT_CHUNK_SIZE`` rows at a time:
+
+* reader ids and ISBNs not seen yet are resolved with chunked ``IN``
+  queries and remembered for the rest of the file;
+* each chunk is validated in memory against the readers' open issues and
+  the current stock, then written in one transaction with ``bulk_create``
+  and one stock ``UPDATE`` per distinct copy count (``circulation.take_stock``);
+* every row that is not imported is written to a CSV error report (line
+  number, reader id, ISBN, status and reason) saved under
+  ``IMPORT_REPORT_DIR`` in the private job storage (``lib/storage.py``).
+
+``import_books_xlsx`` reads the workbook with openpyxl in read-only mode,
+checks each row (required name, author and ISBN, whole copy counts, ratings
+from 1 to 5) and reports the rows it rejects the same way, creates missing
+categories once per chunk and upserts the valid books by ISBN with
+``bulk_create(update_conflicts=True)``.  Because bulk writes skip the Book
+signals, the search and autocomplete indexes, similar-book caches and the
+popular-books pool are refreshed afterwards.
+"""
+import csv
+import io
+import uuid
+from collections import Counter, namedtuple
+from datetime import date
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import IntegrityError, connection, transaction
+from openpyxl import load_workbook
+
+from . import autocomplete, dashboard, exports, popularity, search, similar
+from .analytics import record_issuances
+from .circulation import OutOfStock, loan_period_due_date, take_stock
+from .models import Book, Category, Issue, Reader
+from .storage import job_storage
+
+ISSUE_IMPORT_CHUNK_SIZE = getattr(settings, 'ISSUE_IMPORT_CHUNK_SIZE', 2000)
+IMPORT_REPORT_DIR = 'import_reports'
+LOOKUP_CHUNK_SIZE = 500
+CHUNK_ATTEMPTS = 3
+BOOK_IMPORT_CHUNK_SIZE = getattr(settings, 'BOOK_IMPORT_CHUNK_SIZE', 2000)
+
+BOOK_COLUMNS = ['name', 'isbn', 'author', 'category', 'number_in_stock', 'description', 'rating', 'status']
+BOOK_UPDATE_FIELDS = ['name', 'author', 'category', 'number_in_stock', 'description', 'rating', 'status', 'updated_at']
+ISSUE_REPORT_COLUMNS = ['line', 'reader_id', 'isbn', 'status', 'reason']
+BOOK_REPORT_COLUMNS = ['line', 'isbn', 'name', 'status', 'reason']
+
+ImportResult = namedtuple('ImportResult', ['created', 'skipped', 'errors', 'report_name'])
+BookImportResult = namedtuple('BookImportResult', ['created', 'updated', 'errors', 'report_name'])
+
+
+class ImportFileError(ValueError):
+    """The uploaded file cannot be imported at all (e.g. missing columns)."""
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def lookup(queryset, field, values, *columns):
+    """Map each of ``values`` found in ``field`` to its ``columns`` using chunked IN queries."""
+    found = {}
+    for chunk in chunked(values, LOOKUP_CHUNK_SIZE):
+        for row in queryset.filter(**{f'{field}__in': chunk}).values_list(field, *columns):
+            found[row[0]] = row[1] if len(columns) == 1 else row[1:]
+    return found
+
+
+def text_stream(uploaded):
+    """Decode an uploaded file incrementally, dropping a UTF-8 BOM."""
+    return io.TextIOWrapper(getattr(uploaded, 'file', uploaded), encoding='utf-8-sig', newline='')
+
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def _issue_chunk(candidates, readers, books, today):
+    """Validate and write one chunk. Returns (issued lines, [(line, code, isbn, status, reason)])."""
+    reader_pks = {readers[code][0] for _, code, _, _, _ in candidates}
+    book_pks = {books[isbn] for _, _, isbn, _, _ in candidates}
+    held = set()
+    for chunk in chunked(reader_pks, LOOKUP_CHUNK_SIZE):
+        held.update(Issue.objects.filter(reader_id__in=chunk, returned_date__isnull=True).values_list('reader_id', 'book_id'))
+    stock = {}
+    for chunk in chunked(book_pks, LOOKUP_CHUNK_SIZE):
+        stock.update(Book.objects.select_for_update().filter(pk__in=chunk).values_list('pk', 'number_in_stock'))
+
+    issues, issued_lines, rejected = [], [], []
+    for line, code, isbn, issued_date, due_date in candidates:
+        reader_pk, is_staff = readers[code]
+        book_pk = books[isbn]
+        if (reader_pk, book_pk) in held:
+            rejected.append((line, code, isbn, 'skipped', 'Reader already has this book issued'))
+            continue
+        if stock.get(book_pk, 0) <= 0:
+            rejected.append((line, code, isbn, 'error', 'Book is out of stock'))
+            continue
+        held.add((reader_pk, book_pk))
+        stock[book_pk] -= 1
+        issued_date = issued_date or today
+        if due_date is None:
+            due_date = loan_period_due_date(issued_date, is_staff)
+        issues.append(Issue(reader_id=reader_pk, book_id=book_pk, issued_date=issued_date, due_date=due_date))
+        issued_lines.append(line)
+
+    book_counts = Counter(issue.book_id for issue in issues)
+    take_stock(book_counts)
+    Issue.objects.bulk_create(issues, batch_size=500)
+    exports.touch(Issue)
+    dashboard.adjust({'active_issues': len(issues)}, Counter(issue.due_date for issue in issues))
+    if book_counts:
+        # issued_date is auto_now_add, so bulk_create stored today for every row
+        record_issuances(book_counts, today)
+    return issued_lines, rejected
+
+
+def _import_chunk(candidates, readers, books, today, report):
+    """Write one chunk, retrying if stock changes underneath it. Returns the number of issues created."""
+    for _ in range(CHUNK_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                issued_lines, rejected = _issue_chunk(candidates, readers, books, today)
+            break
+        except (OutOfStock, IntegrityError):
+            # stock or open issues changed concurrently; re-read them and retry the chunk
+            continue
+    else:
+        issued_lines = []
+        rejected = [(line, code, isbn, 'error', 'Stock changed during import, please retry')
+                    for line, code, isbn, _, _ in candidates]
+    report.extend(rejected)
+    return len(issued_lines)
+
+
+def import_issues_csv(uploaded, progress=None):
+    """Import issues from a CSV upload with reader_id, isbn, issued_date and due_date columns.
+
+    Returns an ``ImportResult``; ``report_name`` is the storage name of the
+    error report, or None if every row was imported.  ``progress(rows,
+    errors)`` is called after each chunk.
+    """
+    today = date.today()
+    readers = {}  # reader_id -> (pk, is_staff_member), or None if unknown
+    books = {}    # isbn -> pk, or None if unknown
+    report = []
+    created = 0
+
+    rows = csv.DictReader(text_stream(uploaded))
+    processed = 0
+    for chunk in chunked(enumerate(rows, start=2), ISSUE_IMPORT_CHUNK_SIZE):
+        processed += len(chunk)
+        parsed = []
+        for line, row in chunk:
+            code = (row.get('reader_id') or '').strip()
+            isbn = (row.get('isbn') or '').strip()
+            if not code or not isbn:
+                report.append((line, code, isbn, 'skipped', 'Missing reader_id or isbn'))
+                continue
+            try:
+                issued_date = _parse_date((row.get('issued_date') or '').strip())
+                due_date = _parse_date((row.get('due_date') or '').strip())
+            except ValueError:
+                report.append((line, code, isbn, 'error', 'Dates must be YYYY-MM-DD'))
+                continue
+            parsed.append((line, code, isbn, issued_date, due_date))
+
+        new_codes = {p[1] for p in parsed} - readers.keys()
+        found = lookup(Reader.objects.all(), 'reader_id', new_codes, 'pk', 'is_staff_member')
+        readers.update({code: found.get(code) for code in new_codes})
+        new_isbns = {p[2] for p in parsed} - books.keys()
+        found = lookup(Book.objects.all(), 'isbn', new_isbns, 'pk')
+        books.update({isbn: found.get(isbn) for isbn in new_isbns})
+
+        candidates = []
+        for entry in parsed:
+            line, code, isbn = entry[:3]
+            if readers[code] is None:
+                report.append((line, code, isbn, 'error', 'Unknown reader_id'))
+            elif books[isbn] is None:
+                report.append((line, code, isbn, 'error', 'Unknown isbn'))
+            else:
+                candidates.append(entry)
+        if candidates:
+            created += _import_chunk(candidates, readers, books, today, report)
+        if progress:
+            progress(processed, len(report))
+
+    skipped = sum(1 for row in report if row[3] == 'skipped')
+    return ImportResult(created, skipped, len(report) - skipped, save_report(report) if report else None)
+
+
+def save_report(report, columns=ISSUE_REPORT_COLUMNS):
+    """Write report rows (by default ``(line, reader_id, isbn, status, reason)``) as CSV. Returns the storage name."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    writer.writerows(sorted(report))
+    name = f'{IMPORT_REPORT_DIR}/{uuid.uuid4().hex}.csv'
+    return job_storage().save(name, ContentFile(out.getvalue().encode('utf-8')))
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)  # numeric ISBNs and counts come back as floats
+    return str(value).strip()
+
+
+class InvalidRow(ValueError):
+    """A workbook row that cannot be imported; the message is the report's reason."""
+
+
+def _clean_book_row(row):
+    """The row's values ready for a Book. Raises InvalidRow."""
+    values = {column: _cell_text(row[column]) for column in ('isbn', 'name', 'author')}
+    missing = [column for column, value in values.items() if not value]
+    if missing:
+        raise InvalidRow(f"Missing {', '.join(missing)}")
+    if len(values['isbn']) > 13:
+        raise InvalidRow("ISBN is longer than 13 characters")
+    try:
+        number_in_stock = int(_cell_text(row['number_in_stock']) or 0)
+    except ValueError:
+        raise InvalidRow("number_in_stock must be a whole number") from None
+    if number_in_stock < 0:
+        raise InvalidRow("number_in_stock cannot be negative")
+    try:
+        rating = float(_cell_text(row['rating']) or 4.0)
+    except ValueError:
+        raise InvalidRow("rating must be a number") from None
+    if not 1 <= rating <= 5:
+        raise InvalidRow("rating must be between 1 and 5")
+    status = _cell_text(row['status']).lower() or 'available'
+    if status not in dict(Book.STATUS_CHOICES):
+        raise InvalidRow(f"Unknown status {status!r}")
+    return {
+        **values,
+        'category': _cell_text(row['category']),
+        'number_in_stock': number_in_stock,
+        'description': row['description'] or "No description available",
+        'rating': rating,
+        'status': status,
+    }
+
+
+def _book_from_row(row, category_ids):
+    category = row['category']
+    return Book(
+        isbn=row['isbn'],
+        name=row['name'],
+        author=row['author'],
+        category_id=category_ids[category] if category else None,
+        number_in_stock=row['number_in_stock'],
+        description=row['description'],
+        rating=row['rating'],
+        status=row['status'],
+    )
+
+
+def _ensure_categories(names, category_ids):
+    """Add ids for ``names`` to ``category_ids``, creating the missing categories in one insert."""
+    missing = set(names) - category_ids.keys()
+    if not missing:
+        return
+    Category.objects.bulk_create([Category(name=name) for name in missing], ignore_conflicts=True)
+    category_ids.update(lookup(Category.objects.all(), 'name', missing, 'pk'))
+
+
+def _upsert_books(rows, category_ids):
+    """Upsert one chunk of cleaned rows keyed by ISBN. Returns (created, updated, book ids)."""
+    _ensure_categories({row['category'] for row in rows if row['category']}, category_ids)
+    books = {}
+    for row in rows:
+        book = _book_from_row(row, category_ids)
+        books[book.isbn] = book  # the last row for an ISBN wins, as with update_or_create
+    existing = len(lookup(Book.objects.all(), 'isbn', books, 'pk'))
+
+    conflict_target = {'unique_fields': ['isbn']} if connection.features.supports_update_conflicts_with_target else {}
+    Book.objects.bulk_create(
+        books.values(), batch_size=500,
+        update_conflicts=True, update_fields=BOOK_UPDATE_FIELDS, **conflict_target,
+    )
+    exports.touch(Book)
+    book_ids = list(lookup(Book.objects.all(), 'isbn', books, 'pk').values())
+    created = len(books) - existing
+    dashboard.adjust({'total_books': created})
+    return created, len(rows) - created, book_ids
+
+
+def import_books_xlsx(uploaded, progress=None):
+    """Create or update books from the first sheet of an .xlsx workbook, matched by ISBN.
+
+    Each chunk is committed on its own, so progress is visible while a large
+    workbook is imported; since rows are upserted by ISBN, re-running a file
+    after fixing a bad row is safe.  Rows that fail validation are skipped
+    and listed in an error report (``report_name`` in the returned
+    ``BookImportResult``, None if every row was valid).  Raises
+    ImportFileError if a required column is missing.  ``progress(rows,
+    total)`` is called after each chunk; ``total`` is None if the workbook
+    does not record its size.
+    """
+    workbook = load_workbook(uploaded, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [_cell_text(cell) for cell in next(rows, ())]
+        missing = [c for c in BOOK_COLUMNS if c not in header]
+        if missing:
+            raise ImportFileError(f"Missing required columns: {', '.join(missing)}")
+        position = {column: header.index(column) for column in BOOK_COLUMNS}
+        total = workbook.active.max_row - 1 if workbook.active.max_row else None
+
+        created = updated = 0
+        category_ids = {}
+        report = []
+        processed = 0
+        for chunk in chunked(enumerate(rows, start=2), BOOK_IMPORT_CHUNK_SIZE):
+            processed += len(chunk)
+            records = []
+            for line, values in chunk:
+                if all(value is None for value in values):
+                    continue
+                row = {column: values[i] if i < len(values) else None for column, i in position.items()}
+                try:
+                    records.append(_clean_book_row(row))
+                except InvalidRow as e:
+                    report.append((line, _cell_text(row['isbn']), _cell_text(row['name']), 'error', str(e)))
+            if records:
+                with transaction.atomic():
+                    chunk_created, chunk_updated, book_ids = _upsert_books(records, category_ids)
+                    search.index_books(book_ids)
+                created += chunk_created
+                updated += chunk_updated
+            if progress:
+                progress(processed, total)
+    finally:
+        workbook.close()
+
+    autocomplete.invalidate()
+    for category_id in category_ids.values():
+        similar.invalidate_category(category_id)
+    popularity.refresh_popular_books()
+    return BookImportResult(created, updated, len(report), save_report(report, BOOK_REPORT_COLUMNS) if report else None)
@@ -0,0 +1,282 @@
+"""Database-backed background jobs for long imports and exports.
+
+Views call ``enqueue()`` and redirect to the job page, which polls
+``job_status`` for progress.  ``manage.py run_jobs`` runs the worker: it
+claims queued jobs one at a time with a conditional ``UPDATE`` (so several
+workers can share the table) and runs them on a thread pool.  A handler
+receives the job and a ``JobProgress`` and returns a short message; files
+it produces are stored as the job's ``artifact``.  Progress is written to
+the job row at most every ``JOB_PROGRESS_INTERVAL`` seconds.
+
+The pool has ``default_workers()`` threads unless ``--workers`` says
+otherwise: one on SQLite, which allows a single writer at a time (two
+imports writing at once fail with "database is locked"), and two on
+other databases.
+
+Uploaded inputs, artifacts and import reports hold personal data, so they
+are kept in the private job storage (``lib/storage.py``) rather than under
+``MEDIA_ROOT`` and are downloaded only through the admin-only
+``job_download`` view.  The input file is deleted once its job finishes.
+
+While a job runs, its worker touches ``heartbeat_at`` every
+``JOB_HEARTBEAT_INTERVAL`` seconds.  A worker that dies (killed, deploy,
+crash) leaves its jobs ``running`` with a heartbeat that stops; when a
+worker starts and before each claim, ``fail_stale_jobs()`` marks running
+jobs without a heartbeat for ``JOB_STALE_AFTER`` seconds as failed.  They
+are not re-queued because an issue import that stopped part way would
+import its committed chunks twice; the admin re-runs the job instead.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections, connection
+from django.db.models import Q
+from django.utils import timezone
+
+from . import exports, popularity
+from .exports import REPORTS, render_export
+from .importers import import_books_xlsx, import_issues_csv
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_PROGRESS_INTERVAL = getattr(settings, 'JOB_PROGRESS_INTERVAL', 1.0)
+JOB_HEARTBEAT_INTERVAL = getattr(settings, 'JOB_HEARTBEAT_INTERVAL', 30)
+JOB_STALE_AFTER = getattr(settings, 'JOB_STALE_AFTER', 300)
+
+HANDLERS = {}
+
+
+def handler(kind):
+    """Register the function that runs jobs of ``kind``."""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, params=None, input_file=None, created_by=None):
+    """Queue a job. ``input_file`` is an uploaded file stored alongside it."""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(kind=kind, params=params or {}, created_by=created_by)
+    if input_file is not None:
+        job.input_file.save(os.path.basename(input_file.name), input_file, save=False)
+    job.save()
+    return job
+
+
+def eta_seconds(job):
+    """Estimated seconds left, from the rate so far; None when it cannot be estimated."""
+    if job.status != 'running' or not job.total or not job.processed or not job.started_at:
+        return None
+    elapsed = (timezone.now() - job.started_at).total_seconds()
+    return max(0, round(elapsed / job.processed * (job.total - job.processed)))
+
+
+class JobProgress:
+    def __init__(self, job):
+        self.job = job
+        self._last_write = 0
+
+    def update(self, processed, total=None, errors=None, force=False):
+        fields = {'processed': processed}
+        if total is not None:
+            fields['total'] = total
+        if errors is not None:
+            fields['errors'] = errors
+        for name, value in fields.items():
+            setattr(self.job, name, value)
+        now = time.monotonic()
+        if force or now - self._last_write >= JOB_PROGRESS_INTERVAL:
+            Job.objects.filter(pk=self.job.pk).update(**fields)
+            self._last_write = now
+
+
+def _delete_input(job):
+    if job.input_file:
+        job.input_file.delete(save=False)
+
+
+def fail_stale_jobs():
+    """Mark running jobs whose worker stopped sending heartbeats as failed. Returns how many."""
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=JOB_STALE_AFTER)
+    failed = 0
+    for job in Job.objects.filter(status='running').filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    ):
+        # conditional, so a job another worker already failed (or that finished meanwhile) is left alone
+        if Job.objects.filter(pk=job.pk, status='running', heartbeat_at=job.heartbeat_at).update(
+            status='failed', message="The worker stopped before the job finished; please run it again.",
+            finished_at=now, input_file=None,
+        ):
+            _delete_input(job)
+            failed += 1
+    if failed:
+        logger.warning("Marked %s stale running job(s) as failed", failed)
+    return failed
+
+
+def claim_next():
+    """Mark the oldest queued job as running and return it, or None if the queue is empty."""
+    fail_stale_jobs()
+    while True:
+        job = Job.objects.filter(status='queued').order_by('created_at', 'pk').first()
+        if job is None:
+            return None
+        started_at = timezone.now()
+        if Job.objects.filter(pk=job.pk, status='queued').update(
+            status='running', started_at=started_at, heartbeat_at=started_at,
+        ):
+            job.status, job.started_at, job.heartbeat_at = 'running', started_at, started_at
+            return job
+        # another worker claimed it first
+
+
+def _heartbeat(job, stopped):
+    """Touch ``job.heartbeat_at`` until ``stopped`` is set."""
+    try:
+        while not stopped.wait(JOB_HEARTBEAT_INTERVAL):
+            Job.objects.filter(pk=job.pk, status='running').update(heartbeat_at=timezone.now())
+    except Exception:
+        logger.exception("Heartbeat for job %s failed", job.pk)
+    finally:
+        connection.close()
+
+
+def run_job(job):
+    progress = JobProgress(job)
+    try:
+        message = HANDLERS[job.kind](job, progress) or ''
+    except Exception as e:
+        logger.exception("Job %s failed", job.pk)
+        job.status, job.message = 'failed', str(e)
+    else:
+        job.status, job.message = 'done', message
+    job.finished_at = timezone.now()
+    progress.update(job.processed, job.total, job.errors, force=True)
+    Job.objects.filter(pk=job.pk).update(
+        status=job.status, message=job.message, finished_at=job.finished_at, input_file=None,
+        artifact=job.artifact.name or None, artifact_filename=job.artifact_filename,
+    )
+    _delete_input(job)
+    return job
+
+
+def _run_in_thread(job):
+    stopped = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(job, stopped), daemon=True)
+    heartbeat.start()
+    try:
+        run_job(job)
+    finally:
+        stopped.set()
+        heartbeat.join()
+        connection.close()
+
+
+def default_workers():
+    """Jobs run at the same time when not configured: one on SQLite, whose writes lock the whole database."""
+    return 1 if connection.vendor == 'sqlite' else 2
+
+
+def run_worker(workers=None, poll_interval=1.0, once=False):
+    """Run queued jobs on ``workers`` threads until interrupted (or the queue is empty with ``once``)."""
+    if workers is None:
+        workers = default_workers()
+    elif workers > 1 and connection.vendor == 'sqlite':
+        logger.warning("Running %s jobs at a time on SQLite; concurrent imports may fail with 'database is locked'",
+                       workers)
+    fail_stale_jobs()
+    slots = threading.Semaphore(workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            slots.acquire()
+            close_old_connections()
+            job = claim_next()
+            if job is None:
+                slots.release()
+                if once:
+                    return
+                time.sleep(poll_interval)
+                continue
+            logger.info("Starting job %s (%s)", job.pk, job.kind)
+            pool.submit(_run_in_thread, job).add_done_callback(lambda _: slots.release())
+
+
+def save_artifact(job, f, filename):
+    """Store a produced file as the job's artifact, downloaded as ``filename``."""
+    job.artifact.save(filename, File(f), save=False)
+    job.artifact_filename = filename
+
+
+def _count_lines(field_file):
+    with field_file.open('rb') as f:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+
+
+@handler('import_books')
+def import_books_job(job, progress):
+    with job.input_file.open('rb') as f:
+        result = import_books_xlsx(f, progress=lambda rows, total: progress.update(rows, total))
+    if result.report_name:
+        job.artifact.name = result.report_name
+        job.artifact_filename = 'book_import_report.csv'
+    job.errors = result.errors
+    return (
+        f"Books Imported Successfully! Created: {result.created}, Updated: {result.updated}, "
+        f"Failed: {result.errors} row(s) with invalid data."
+    )
+
+
+@handler('import_issues')
+def import_issues_job(job, progress):
+    progress.update(0, total=max(_count_lines(job.input_file) - 1, 0), force=True)
+    with job.input_file.open('rb') as f:
+        result = import_issues_csv(f, progress=lambda rows, errors: progress.update(rows, errors=errors))
+    if result.report_name:
+        job.artifact.name = result.report_name
+        job.artifact_filename = 'issue_import_report.csv'
+    return (
+        f"Imported {result.created} issue(s); skipped {result.skipped} row(s); "
+        f"{result.errors} row(s) failed due to invalid data."
+    )
+
+
+@handler('export')
+def export_job(job, progress):
+    name, fmt = job.params['report'], job.params['format']
+    filename = f"{REPORTS[name].filename}.{fmt}"
+    stamp = exports.version_stamp(name)
+    cached = exports.open_cached(name, fmt, stamp)
+    if cached is not None:
+        with cached:
+            save_artifact(job, cached, filename)
+        return "Exported from the cache; the data has not changed since the last export."
+
+    progress.update(0, total=REPORTS[name].queryset().count(), force=True)
+    with exports.caching(name, fmt, stamp) as out:
+        if fmt == 'csv':
+            text = io.TextIOWrapper(out, encoding='utf-8', newline='')
+            rows = render_export(name, fmt, text, progress=progress.update)
+            text.detach()
+        else:
+            rows = render_export(name, fmt, out, progress=progress.update)
+    with out:
+        progress.update(rows)
+        save_artifact(job, out, filename)
+    return f"Exported {rows} row(s)."
+
+
+@handler(popularity.REFRESH_JOB)
+def refresh_popular_books_job(job, progress):
+    total = popularity.refresh_popular_books()
+    return f"Popular books pool refreshed: {total} book(s)."
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from lib.fines import accrue_fines
+
+
+class Command(BaseCommand):
+    help = "Create and update fines for all overdue and late-returned issues (run daily from cron)."
+
+    def handle(self, *args, **options):
+        created, updated = accrue_fines()
+        self.stdout.write(self.style.SUCCESS(f"Created {created} fine(s); updated {updated} fine amount(s)."))
@@ -0,0 +1,84 @@
+import random
+import statistics
+import string
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lib import search
+from lib.autocomplete import AutocompleteIndex
+from lib.models import Book
+
+WORDS = [
+    'atomic', 'habits', 'river', 'silent', 'garden', 'python', 'history', 'empire', 'ocean', 'winter',
+    'shadow', 'light', 'code', 'mind', 'journey', 'secret', 'night', 'stone', 'forest', 'city',
+]
+FIRST_NAMES = ['james', 'maya', 'arjun', 'sita', 'li', 'omar', 'anna', 'ravi', 'emma', 'noah']
+LAST_NAMES = ['clear', 'sharma', 'thapa', 'smith', 'garcia', 'chen', 'khan', 'rai', 'brown', 'lee']
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare p50/p99 latency of the in-memory autocomplete index against the ORM search path. "
+        "Synthetic books are created inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--limit', type=int, default=8)
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        for size in options['sizes']:
+            with transaction.atomic():
+                self._run(size, options['queries'], options['limit'], rng)
+                transaction.set_rollback(True)
+
+    def _run(self, size, n_queries, limit, rng):
+        batch = []
+        for i in range(size):
+            name = ' '.join(rng.choice(WORDS) for _ in range(3)).title()
+            author = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}".title()
+            batch.append(Book(name=name, author=author, isbn=f"B{i:012d}"))
+            if len(batch) == 5000:
+                Book.objects.bulk_create(batch)
+                batch = []
+        Book.objects.bulk_create(batch)
+        search.rebuild_index()
+
+        index = AutocompleteIndex()
+        started = time.perf_counter()
+        index.build(Book.objects.values_list('pk', 'name', 'author', 'isbn', 'category_id').iterator(chunk_size=5000))
+        build_seconds = time.perf_counter() - started
+
+        queries = []
+        for _ in range(n_queries):
+            word = rng.choice(WORDS + FIRST_NAMES + LAST_NAMES)
+            start = rng.randrange(len(word))
+            queries.append(word[start:start + rng.randint(1, 6)] or rng.choice(string.ascii_lowercase))
+
+        orm_times, index_times = [], []
+        for q in queries:
+            started = time.perf_counter()
+            list(search.search_books(Book.objects.all(), q)[:limit])
+            orm_times.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            pks = index.query(q, limit=limit)
+            found = Book.objects.in_bulk(pks)
+            [found[pk] for pk in pks if pk in found]
+            index_times.append(time.perf_counter() - started)
+
+        self.stdout.write(f"{size} books (index built in {build_seconds:.2f}s):")
+        for label, samples in (('orm', orm_times), ('index', index_times)):
+            self.stdout.write(
+                f"  {label:<6} p50={statistics.median(samples) * 1000:.2f}ms "
+                f"p99={_percentile(samples, 99) * 1000:.2f}ms"
+            )
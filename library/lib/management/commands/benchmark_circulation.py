@@ -0,0 +1,92 @@
+import threading
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from lib import circulation
+from lib.models import Book, Issue, Reader
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure issue/return throughput of concurrent clerks contending for one book's stock. "
+        "Runs in a throwaway test database, so the configured database is never written to."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, 2, 4, 8])
+        parser.add_argument('--iterations', type=int, default=100, help="issue attempts per thread")
+        parser.add_argument('--stock', type=int, default=3)
+
+    def handle(self, *args, **options):
+        # threads need committed rows, so the synthetic data cannot be rolled back like the other benchmarks
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for threads in options['threads']:
+                self._run(threads, options['iterations'], options['stock'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def _run(self, threads, iterations, stock):
+        book = Book.objects.create(name=f'Contended {threads}', author='Bench', isbn=f'C{threads:012d}', number_in_stock=stock)
+        readers = [
+            Reader.objects.create(
+                reader_id=f'CIRC{threads}-{i}', name=f'Clerk Reader {i}', date_of_birth=date(1990, 1, 1),
+                phone_number=f'8{threads:03d}{i:06d}', address='-',
+            )
+            for i in range(threads)
+        ]
+        counts = {'issued': 0, 'returned': 0, 'out_of_stock': 0, 'busy': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(threads)
+
+        def bump(key):
+            with lock:
+                counts[key] += 1
+
+        def worker(reader):
+            try:
+                start.wait()
+                for _ in range(iterations):
+                    try:
+                        issue = circulation.issue_copy(reader, book)
+                    except circulation.OutOfStock:
+                        bump('out_of_stock')
+                        continue
+                    except circulation.AlreadyIssued:
+                        # the issue committed but an on_commit hook then hit a busy database
+                        issue = Issue.objects.get(reader=reader, book=book, returned_date__isnull=True)
+                    except OperationalError:
+                        bump('busy')
+                        continue
+                    bump('issued')
+                    while True:
+                        try:
+                            circulation.return_issue(issue)
+                            break
+                        except OperationalError:
+                            bump('busy')
+                    bump('returned')
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(reader,)) for reader in readers]
+        started = time.perf_counter()
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        book.refresh_from_db()
+        active = Issue.objects.filter(book=book, returned_date__isnull=True).count()
+        if book.number_in_stock < 0 or book.number_in_stock + active != stock:
+            raise CommandError(f"Stock invariant violated: stock {book.number_in_stock}, open issues {active}")
+        self.stdout.write(
+            f"{threads} threads x {iterations} attempts in {elapsed:.2f}s: "
+            f"{counts['issued'] / elapsed:.0f} issues/s, {counts['returned'] / elapsed:.0f} returns/s "
+            f"({counts['out_of_stock']} out of stock, {counts['busy']} busy retries)"
+        )
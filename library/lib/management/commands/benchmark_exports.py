@@ -0,0 +1,155 @@
+import csv
+import io
+import re
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lib.exports import render_export, stream_csv
+from lib.models import Book, Issue, Reader
+
+
+def _legacy_issue_dicts():
+    data = []
+    for issue in Issue.objects.select_related('reader', 'book').all().order_by('-issued_date'):
+        data.append({
+            'Reader Name': issue.reader.name,
+            'Reader ID': issue.reader.reader_id,
+            'Book Name': issue.book.name,
+            'ISBN': issue.book.isbn,
+            'Issued Date': issue.issued_date,
+            'Due Date': issue.due_date,
+            'Returned Date': issue.returned_date or 'Not Returned',
+            'Status': 'Returned' if issue.returned_date else 'Not Returned',
+        })
+    return data
+
+
+def legacy_issues_csv():
+    """The previous export_issues CSV path: full instances into a list of dicts, then one buffer."""
+    data = _legacy_issue_dicts()
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=data[0].keys())
+    writer.writeheader()
+    writer.writerows(data)
+    return len(out.getvalue())
+
+
+def legacy_issues_xlsx():
+    """The previous XLSX path: list of dicts, then a DataFrame, then a BytesIO copied out."""
+    df = pd.DataFrame(_legacy_issue_dicts())
+    with io.BytesIO() as buffer:
+        df.to_excel(buffer, index=False)
+        return len(buffer.getvalue())
+
+
+def _pages(pdf):
+    return len(re.findall(rb'/Type /Page\b', pdf))
+
+
+def legacy_issues_pdf():
+    """The previous PDF path: every row in one Table, measured and split by reportlab as a whole."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Table, TableStyle
+
+    data = _legacy_issue_dicts()
+    table = Table([list(data[0])] + [[str(value) for value in item.values()] for item in data])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ]))
+    out = io.BytesIO()
+    SimpleDocTemplate(out, pagesize=A4).build([Paragraph('Issues Report', getSampleStyleSheet()['Title']), table])
+    return len(out.getvalue()), _pages(out.getvalue())
+
+
+def streamed_issues_pdf():
+    with tempfile.TemporaryFile() as out:
+        render_export('issues', 'pdf', out)
+        out.seek(0)
+        pdf = out.read()
+    return len(pdf), _pages(pdf)
+
+
+def streamed_issues_csv():
+    return sum(len(chunk) for chunk in stream_csv('issues'))
+
+
+def streamed_issues_xlsx():
+    with tempfile.TemporaryFile() as out:
+        render_export('issues', 'xlsx', out)
+        return out.tell()
+
+
+RUNS = {
+    'csv': (('streaming', streamed_issues_csv), ('legacy', legacy_issues_csv)),
+    'xlsx': (('write-only', streamed_issues_xlsx), ('legacy', legacy_issues_xlsx)),
+    'pdf': (('long-table', streamed_issues_pdf), ('legacy', legacy_issues_pdf)),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure time and Python memory peak of the streaming issues export (CSV, XLSX or PDF, with "
+        "pages/second for PDF) against the previous list-of-dicts export as the table grows. "
+        "Synthetic rows are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10000, 100000, 500000])
+        parser.add_argument('--format', choices=sorted(RUNS), default='csv')
+        parser.add_argument('--legacy-limit', type=int, default=None,
+                            help="skip the previous export above this many rows (the single-Table PDF takes minutes)")
+        parser.add_argument('--skip-memory', action='store_true', help="do not measure the memory peak")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            readers = Reader.objects.bulk_create(
+                Reader(reader_id=f'EXP{i}', name=f'Export Reader {i}', date_of_birth=date(1990, 1, 1),
+                       phone_number=f'7{i:09d}', address='-')
+                for i in range(1000)
+            )
+            books = Book.objects.bulk_create(
+                Book(name=f'Export Book {i}', author='Bench', isbn=f'E{i:012d}') for i in range(1000)
+            )
+            created = 0
+            for size in options['sizes']:
+                Issue.objects.bulk_create((
+                    Issue(reader=readers[i % 1000], book=books[i // 1000 % 1000], returned_date=date.today())
+                    for i in range(created, size)
+                ), batch_size=5000)
+                created = max(created, size)
+                self.stdout.write(f"{size} issues:")
+                for label, run in RUNS[options['format']]:
+                    if label == 'legacy' and options['legacy_limit'] is not None and size > options['legacy_limit']:
+                        self.stdout.write(f"  {label:<10} skipped")
+                        continue
+                    started = time.perf_counter()
+                    result = run()
+                    elapsed = time.perf_counter() - started
+                    length, pages = result if isinstance(result, tuple) else (result, None)
+                    line = f"  {label:<10} {elapsed:7.2f}s  ({length / 1e6:.1f} MB file)"
+                    if pages:
+                        line += f"  {pages} pages, {pages / elapsed:.0f} pages/s"
+                    if not options['skip_memory']:
+                        # separate pass: tracing allocations slows the export down several times
+                        tracemalloc.start()
+                        run()
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                        line += f"  peak {peak / 1e6:.1f} MB"
+                    self.stdout.write(line)
+            transaction.set_rollback(True)
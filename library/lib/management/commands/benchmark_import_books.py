@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from openpyxl import Workbook
+
+from lib.importers import BOOK_COLUMNS, import_books_xlsx
+from lib.models import Book, Category
+
+
+def legacy_import(path):
+    """The previous import_books loop: pandas DataFrame plus update_or_create per row."""
+    df = pd.read_excel(path)
+    created = updated = 0
+    for _, row in df.iterrows():
+        category_name = row.get("category")
+        category_obj = None
+        if category_name and str(category_name).strip():
+            category_obj, _ = Category.objects.get_or_create(name=str(category_name).strip())
+        _, was_created = Book.objects.update_or_create(
+            isbn=str(row["isbn"]).strip(),
+            defaults={
+                "name": row["name"],
+                "author": row["author"],
+                "category": category_obj,
+                "number_in_stock": int(row["number_in_stock"] or 0),
+                "description": row.get("description") or "No description available",
+                "rating": float(row.get("rating") or 4.0),
+                "status": str(row.get("status") or "available").lower(),
+            }
+        )
+        created += int(was_created)
+        updated += int(not was_created)
+    return created, updated
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare wall time and Python memory peak of the streaming book importer with the previous "
+        "pandas/update_or_create loop on a synthetic workbook. All writes are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--skip-legacy', action='store_true', help="only run the new importer")
+        parser.add_argument('--skip-memory', action='store_true', help="do not measure the memory peak")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        fd, path = tempfile.mkstemp(suffix='.xlsx')
+        os.close(fd)
+        try:
+            workbook = Workbook(write_only=True)
+            sheet = workbook.create_sheet()
+            sheet.append(BOOK_COLUMNS)
+            for i in range(options['rows']):
+                sheet.append([
+                    f'Book {i}', f'97{i:011d}', f'Author {rng.randrange(5000)}',
+                    f'Category {rng.randrange(options["categories"])}', rng.randrange(10),
+                    'Synthetic book', round(rng.uniform(1, 5), 1), 'available',
+                ])
+            workbook.save(path)
+            self.stdout.write(f"{options['rows']} rows, {os.path.getsize(path) / 1e6:.1f} MB workbook")
+
+            runs = [('streaming', lambda: tuple(import_books_xlsx(path))[:2])]
+            if not options['skip_legacy']:
+                runs.append(('legacy', lambda: legacy_import(path)))
+            for label, run in runs:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    created, updated = run()
+                    elapsed = time.perf_counter() - started
+                    transaction.set_rollback(True)
+                line = f"  {label:<9} {elapsed:7.2f}s  created={created} updated={updated}"
+                if not options['skip_memory']:
+                    # separate pass: tracing allocations slows the import down several times
+                    with transaction.atomic():
+                        tracemalloc.start()
+                        run()
+                        peak = tracemalloc.get_traced_memory()[1]
+                        tracemalloc.stop()
+                        transaction.set_rollback(True)
+                    line += f"  peak {peak / 1e6:.1f} MB"
+                self.stdout.write(line)
+        finally:
+            os.remove(path)
@@ -0,0 +1,59 @@
+import csv
+import io
+import random
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lib.importers import import_issues_csv
+from lib.models import Book, Issue, Reader
+from lib.storage import job_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the issue CSV importer on a synthetic file. Readers, books and issues are created "
+        "inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--readers', type=int, default=25000)
+        parser.add_argument('--books', type=int, default=5000)
+        parser.add_argument('--bad-rows', type=float, default=0.01, help="fraction of rows with an unknown ISBN")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        n_readers, n_books = options['readers'], options['books']
+        with transaction.atomic():
+            Reader.objects.bulk_create((
+                Reader(reader_id=f'BENCH{i}', name=f'Reader {i}', date_of_birth=date(1990, 1, 1),
+                       phone_number=f'8{i:09d}', address='-')
+                for i in range(n_readers)
+            ), batch_size=5000)
+            Book.objects.bulk_create((
+                Book(name=f'Book {i}', author='Bench', isbn=f'I{i:012d}', number_in_stock=options['rows'])
+                for i in range(n_books)
+            ), batch_size=5000)
+
+            out = io.StringIO()
+            writer = csv.writer(out)
+            writer.writerow(['reader_id', 'isbn', 'issued_date', 'due_date'])
+            for _ in range(options['rows']):
+                isbn = 'MISSING' if rng.random() < options['bad_rows'] else f'I{rng.randrange(n_books):012d}'
+                writer.writerow([f'BENCH{rng.randrange(n_readers)}', isbn, '', ''])
+            upload = io.BytesIO(out.getvalue().encode('utf-8'))
+
+            started = time.perf_counter()
+            result = import_issues_csv(upload)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"{options['rows']} rows in {elapsed:.2f}s ({options['rows'] / elapsed:.0f} rows/s): "
+                f"created={result.created} skipped={result.skipped} errors={result.errors} "
+                f"(issues in db: {Issue.objects.count()})"
+            )
+            if result.report_name:
+                job_storage().delete(result.report_name)
+            transaction.set_rollback(True)
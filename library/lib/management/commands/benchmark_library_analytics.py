@@ -0,0 +1,65 @@
+import time
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lib.analytics import get_library_analytics, library_analytics, library_analytics_cache_key
+from lib.models import Book, Category, Issue, Reader
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the library-wide dashboard analytics as the Issue table grows: the first computation of the "
+        "day and the cached reads after it. Synthetic issues spread over --span days are rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100000, 1000000])
+        parser.add_argument('--days', nargs='+', type=int, default=[30, 90, 365], help="analytics windows to time")
+        parser.add_argument('--span', type=int, default=730, help="days the synthetic issue dates cover")
+
+    def handle(self, *args, **options):
+        today, span = date.today(), options['span']
+        with transaction.atomic():
+            categories = Category.objects.bulk_create(Category(name=f'Analytics Category {i}') for i in range(20))
+            readers = Reader.objects.bulk_create(
+                Reader(reader_id=f'ANL{i}', name=f'Analytics Reader {i}', date_of_birth=date(1990, 1, 1),
+                       phone_number=f'6{i:09d}', address='-')
+                for i in range(1000)
+            )
+            books = Book.objects.bulk_create(
+                Book(name=f'Analytics Book {i}', author='Bench', isbn=f'A{i:012d}', category=categories[i % 20])
+                for i in range(1000)
+            )
+            created = 0
+            for size in options['sizes']:
+                for i in range(created, size, 10000):
+                    # issued_date is auto_now_add, so each chunk gets one date and is moved there afterwards
+                    issued = today - timedelta(days=i * span // max(options['sizes']))
+                    due = issued + timedelta(days=14)
+                    chunk = Issue.objects.bulk_create(
+                        Issue(reader=readers[j % 1000], book=books[j // 1000 % 1000], due_date=due,
+                              returned_date=None if j % 50 == 0 else min(issued + timedelta(days=j % 25 + 1), today))
+                        for j in range(i, min(i + 10000, size))
+                    )
+                    Issue.objects.filter(pk__in=[issue.pk for issue in chunk]).update(issued_date=issued)
+                created = max(created, size)
+                self.stdout.write(f"{Issue.objects.count()} issues:")
+                for days in options['days']:
+                    started = time.perf_counter()
+                    data = library_analytics(days)
+                    computed = time.perf_counter() - started
+                    cache.delete(library_analytics_cache_key(days))
+                    get_library_analytics(days)
+                    started = time.perf_counter()
+                    get_library_analytics(days)
+                    cached = time.perf_counter() - started
+                    self.stdout.write(
+                        f"  {days:>4} days  {data['total_issued']:>8} issued  computed {computed:6.2f}s  "
+                        f"cached {cached * 1000:6.2f}ms  ({data['resolution']}, {len(data['dates'])} points)"
+                    )
+            transaction.set_rollback(True)
+        for days in options['days']:
+            cache.delete(library_analytics_cache_key(days))
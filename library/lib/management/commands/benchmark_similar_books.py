@@ -0,0 +1,54 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from lib.models import Book, Category
+from lib.similar import get_similar_books
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare get_similar_books against ORDER BY RANDOM() as a category grows. "
+        "Synthetic books are created inside a transaction that is rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 1000, 10000, 100000])
+        parser.add_argument('--calls', type=int, default=200)
+
+    def handle(self, *args, **options):
+        calls = options['calls']
+        with transaction.atomic():
+            category = Category.objects.create(name='__benchmark_similar_books__')
+            created = 0
+            for size in options['sizes']:
+                batch = [
+                    Book(name=f"Benchmark {i}", author="Bench", isbn=f"S{i:012d}", category=category)
+                    for i in range(created, size)
+                ]
+                Book.objects.bulk_create(batch, batch_size=5000)
+                created = max(created, size)
+                cache.clear()
+                book = Book.objects.filter(category=category).first()
+
+                started = time.perf_counter()
+                for _ in range(calls):
+                    list(Book.objects.filter(category=category).exclude(pk=book.pk).order_by('?')[:4])
+                random_ms = (time.perf_counter() - started) * 1000 / calls
+
+                started = time.perf_counter()
+                get_similar_books(book)
+                cold_ms = (time.perf_counter() - started) * 1000
+
+                started = time.perf_counter()
+                for _ in range(calls):
+                    get_similar_books(book)
+                sampled_ms = (time.perf_counter() - started) * 1000 / calls
+
+                self.stdout.write(
+                    f"{size:>7} books: order_by('?') {random_ms:.2f}ms/call, "
+                    f"cached sample {sampled_ms:.2f}ms/call (first call {cold_ms:.2f}ms)"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,54 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from lib.models import Issue, IssueRequest, Notification
+
+
+def hot_queries():
+    """The circulation filters run on most admin/reader page loads, keyed by a short label."""
+    today = date.today()
+    return {
+        'active issues of a reader': Issue.objects.filter(reader_id=1, returned_date__isnull=True),
+        'active issue of reader+book': Issue.objects.filter(reader_id=1, book_id=1, returned_date__isnull=True),
+        'overdue issues': Issue.objects.filter(due_date__lt=today, returned_date__isnull=True).order_by('due_date'),
+        'due soon issues': Issue.objects.filter(due_date=today + timedelta(days=2), returned_date__isnull=True),
+        'requests of a reader': IssueRequest.objects.filter(reader_id=1, approved=False, rejected=False),
+        'pending requests': IssueRequest.objects.filter(approved=False, rejected=False).order_by('request_date'),
+        'unread notifications': Notification.objects.filter(reader_id=1, read=False),
+        'notification of an issue': Notification.objects.filter(issue_id=1, notification_type='overdue').order_by(),
+    }
+
+
+def is_index_driven(plan):
+    """True unless the plan scans a table without an index or sorts in a temp b-tree."""
+    for line in plan.splitlines():
+        if 'USE TEMP B-TREE' in line:
+            return False
+        if 'SCAN ' in line and 'USING' not in line:
+            return False
+    return True
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN QUERY PLAN over the circulation hot queries and fail if any is not index-driven."
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("EXPLAIN QUERY PLAN checks are only implemented for SQLite.")
+
+        failures = []
+        for label, queryset in hot_queries().items():
+            plan = queryset.explain()
+            ok = is_index_driven(plan)
+            style = self.style.SUCCESS if ok else self.style.ERROR
+            self.stdout.write(style(f"[{'ok' if ok else 'SCAN'}] {label}"))
+            for line in plan.splitlines():
+                self.stdout.write(f"    {line}")
+            if not ok:
+                failures.append(label)
+
+        if failures:
+            raise CommandError(f"Not index-driven: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All hot queries use indexes."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from lib.exports import EXPORT_TOMBSTONE_RETENTION_DAYS, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete deletion records older than the delta export retention window (run daily from cron)."
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {deleted} tombstone(s) older than {EXPORT_TOMBSTONE_RETENTION_DAYS} day(s)."
+        ))
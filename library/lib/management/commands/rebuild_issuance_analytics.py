@@ -0,0 +1,40 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lib.analytics import REBUILD_BATCH_SIZE, rebuild_from_issues
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Not a YYYY-MM-DD date: {value}")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the daily issuance counters (BookIssuanceRecord) and the weekly/monthly rollups from the "
+        "Issue table. The counts come from one GROUP BY book, issued_date query, so issues are never loaded "
+        "into Python. Recording continues meanwhile, so run it when few books are being issued."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_date, help="first issue date to recount (YYYY-MM-DD)")
+        parser.add_argument('--end', type=_date, help="last issue date to recount (YYYY-MM-DD)")
+        parser.add_argument('--book', type=int, action='append', dest='books', help="book id; repeat for several")
+        parser.add_argument('--batch-size', type=int, default=REBUILD_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end']
+        if start and end and start > end:
+            raise CommandError("--start is after --end")
+        started = time.perf_counter()
+
+        def progress(model, written):
+            self.stdout.write(f"  {model.__name__}: {written} rows written ({time.perf_counter() - started:.1f}s)")
+
+        written = rebuild_from_issues(start, end, options['books'], options['batch_size'], progress)
+        summary = ', '.join(f"{model.__name__} {rows}" for model, rows in written.items())
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt in {time.perf_counter() - started:.1f}s: {summary}"))
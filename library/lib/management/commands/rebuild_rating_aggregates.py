@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from lib.models import Book, BookRating
+
+
+class Command(BaseCommand):
+    help = "Recompute Book.reader_rating_sum/reader_rating_count from BookRating and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report books whose stored totals drifted; do not fix them.",
+        )
+
+    def handle(self, *args, **options):
+        actual = {
+            row['book']: (row['total'], row['count'])
+            for row in BookRating.objects.values('book').annotate(total=Sum('rating'), count=Count('id'))
+        }
+
+        drifted = []
+        stored = Book.objects.values_list('pk', 'reader_rating_sum', 'reader_rating_count')
+        for pk, rating_sum, rating_count in stored.iterator(chunk_size=2000):
+            total, count = actual.get(pk, (Decimal('0'), 0))
+            if rating_sum != total or rating_count != count:
+                drifted.append((pk, total, count))
+                self.stdout.write(
+                    f"Book {pk}: stored sum={rating_sum} count={rating_count}, actual sum={total} count={count}"
+                )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("Rating totals are in sync."))
+            return
+        if options['check']:
+            self.stdout.write(self.style.WARNING(f"{len(drifted)} book(s) have drifted rating totals."))
+            return
+
+        with transaction.atomic():
+            for pk, total, count in drifted:
+                Book.objects.filter(pk=pk).update(reader_rating_sum=total, reader_rating_count=count)
+        self.stdout.write(self.style.SUCCESS(f"Repaired rating totals for {len(drifted)} book(s)."))
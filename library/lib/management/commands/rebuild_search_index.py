@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from lib import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text catalog search index from the Book table."
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            self.stdout.write(self.style.WARNING(
+                "Full-text index is not available on this database; searches use icontains."
+            ))
+            return
+        total = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {total} book(s)."))
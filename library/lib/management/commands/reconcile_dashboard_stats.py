@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from lib.dashboard import COUNTERS, count_all, get_stats, reconcile
+
+
+class Command(BaseCommand):
+    help = "Recount the admin dashboard counters (DashboardStats) from the tables and report drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Only report counters that drifted; do not fix them.",
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stats = get_stats()
+            actual = count_all()
+            drift = {name: (getattr(stats, name), actual[name]) for name in COUNTERS if getattr(stats, name) != actual[name]}
+        else:
+            _, drift = reconcile()
+
+        for name, (stored, value) in drift.items():
+            self.stdout.write(f"{name}: stored {stored}, actual {value}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("Dashboard counters are in sync."))
+        elif options['check']:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} dashboard counter(s) have drifted."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Repaired {len(drift)} dashboard counter(s)."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from lib.popularity import POPULAR_BOOKS_MIN_RATING, refresh_popular_books
+
+
+class Command(BaseCommand):
+    help = "Rebuild the popular books pool used by the book detail pages (run from cron)."
+
+    def handle(self, *args, **options):
+        total = refresh_popular_books()
+        self.stdout.write(self.style.SUCCESS(
+            f"Popular books pool refreshed: {total} book(s) rated {POPULAR_BOOKS_MIN_RATING} or higher."
+        ))
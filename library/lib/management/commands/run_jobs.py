@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from lib.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = "Run queued background imports and exports. Keep one or more of these running alongside the web server."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="jobs run at the same time (default: 1 on SQLite, otherwise 2)")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="seconds between checks of an empty queue")
+        parser.add_argument('--once', action='store_true', help="exit when the queue is empty")
+
+    def handle(self, *args, **options):
+        run_worker(workers=options['workers'], poll_interval=options['poll_interval'], once=options['once'])
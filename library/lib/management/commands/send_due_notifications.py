@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from lib.notifications import check_and_create_due_soon_notifications, check_and_create_overdue_notifications
+
+
+class Command(BaseCommand):
+    help = "Create due-soon and overdue notifications for all readers (run daily from cron)."
+
+    def handle(self, *args, **options):
+        due_soon = check_and_create_due_soon_notifications()
+        overdue = check_and_create_overdue_notifications()
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {due_soon} due-soon and {overdue} overdue notification(s)."
+        ))
@@ -1,5 +1,7 @@
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 
+from lib import exports
 from lib.models import Reader
 
 
@@ -12,7 +14,8 @@ class Command(BaseCommand):
         self.stdout.write(f"Total readers: {total}, currently marked staff: {staff_count}")
 
         # Update all readers to student (is_staff_member=False)
-        updated = Reader.objects.update(is_staff_member=False)
+        updated = Reader.objects.update(is_staff_member=False, updated_at=timezone.now())
+        exports.touch(Reader)
 
         new_staff_count = Reader.objects.filter(is_staff_member=True).count()
         self.stdout.write(self.style.SUCCESS(
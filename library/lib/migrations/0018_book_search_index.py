@@ -0,0 +1,32 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    # FTS5 trigram index mirroring Book name/author/isbn (SQLite only; see lib/search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS lib_book_fts "
+        "USING fts5(name, author, isbn, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        "INSERT INTO lib_book_fts(rowid, name, author, isbn) "
+        "SELECT id, name, author, isbn FROM lib_book"
+    )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS lib_book_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0017_reader_is_active'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_totals(apps, schema_editor):
+    Book = apps.get_model('lib', 'Book')
+    BookRating = apps.get_model('lib', 'BookRating')
+    totals = BookRating.objects.values('book').annotate(total=Sum('rating'), count=Count('id'))
+    for row in totals.iterator():
+        Book.objects.filter(pk=row['book']).update(
+            reader_rating_sum=row['total'],
+            reader_rating_count=row['count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0018_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='reader_rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='reader_rating_sum',
+            field=models.DecimalField(decimal_places=1, default=0, max_digits=10),
+        ),
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
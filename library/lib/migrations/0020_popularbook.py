@@ -0,0 +1,20 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0019_book_reader_rating_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularBook',
+            fields=[
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='lib.book')),
+                ('combined_score', models.DecimalField(decimal_places=1, max_digits=3)),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def close_duplicate_open_issues(apps, schema_editor):
+    """Keep the first open issue of each reader and book; close the others and put their copies back."""
+    Book = apps.get_model('lib', 'Book')
+    Issue = apps.get_model('lib', 'Issue')
+    duplicates = (
+        Issue.objects.filter(returned_date__isnull=True)
+        .values('reader', 'book')
+        .annotate(total=Count('id'), keep=Min('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        extra = Issue.objects.filter(
+            reader=row['reader'], book=row['book'], returned_date__isnull=True
+        ).exclude(pk=row['keep'])
+        # returned the day they were issued, so the closed duplicates are never overdue
+        closed = extra.update(returned_date=F('issued_date'))
+        Book.objects.filter(pk=row['book']).update(number_in_stock=F('number_in_stock') + closed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0020_popularbook'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_issues, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='issue',
+            constraint=models.UniqueConstraint(condition=models.Q(('returned_date__isnull', True)), fields=('reader', 'book'), name='unique_active_issue'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(condition=models.Q(('returned_date__isnull', True)), fields=['due_date'], name='issue_active_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(condition=models.Q(('approved', False), ('rejected', False)), fields=['reader'], name='issuerequest_reader_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issuerequest',
+            index=models.Index(condition=models.Q(('approved', False), ('rejected', False)), fields=['request_date'], name='issuerequest_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read', False)), fields=['reader', '-created_at'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['issue', 'notification_type'], name='notification_issue_type_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_notifications(apps, schema_editor):
+    Notification = apps.get_model('lib', 'Notification')
+    duplicates = (
+        Notification.objects.filter(issue__isnull=False)
+        .values('issue', 'notification_type')
+        .annotate(total=Count('id'), keep=Min('id'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        Notification.objects.filter(
+            issue=row['issue'], notification_type=row['notification_type']
+        ).exclude(pk=row['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0021_circulation_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_notifications, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='notification',
+            name='notification_issue_type_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(fields=('issue', 'notification_type'), name='unique_issue_notification'),
+        ),
+    ]
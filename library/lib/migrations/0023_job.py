@@ -0,0 +1,35 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0022_notification_unique_issue_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=50)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('input_file', models.FileField(blank=True, null=True, upload_to='jobs/input/')),
+                ('artifact', models.FileField(blank=True, null=True, upload_to='jobs/output/')),
+                ('artifact_filename', models.CharField(blank=True, max_length=100)),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('errors', models.PositiveIntegerField(default=0)),
+                ('message', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='lib.admin')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'queued')), fields=['created_at'], name='job_queued_idx')],
+            },
+        ),
+    ]
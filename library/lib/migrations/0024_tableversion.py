@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0023_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TableVersion',
+            fields=[
+                ('table', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
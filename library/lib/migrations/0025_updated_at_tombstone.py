@@ -0,0 +1,38 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0024_tableversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fine',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='issue',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='reader',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(max_length=100)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['table', 'deleted_at'], name='tombstone_table_deleted_idx')],
+            },
+        ),
+    ]
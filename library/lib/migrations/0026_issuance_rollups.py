@@ -0,0 +1,59 @@
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth, TruncWeek
+
+
+def backfill_rollups(apps, schema_editor):
+    BookIssuanceRecord = apps.get_model('lib', 'BookIssuanceRecord')
+    for model_name, trunc in (('BookIssuanceWeek', TruncWeek), ('BookIssuanceMonth', TruncMonth)):
+        model = apps.get_model('lib', model_name)
+        totals = (
+            BookIssuanceRecord.objects.order_by()
+            .values('book_id', period=trunc('date'))
+            .annotate(total=Sum('quantity_issued'))
+        )
+        model.objects.bulk_create(
+            (model(book_id=row['book_id'], period_start=row['period'], quantity_issued=row['total'])
+             for row in totals.iterator()),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0025_updated_at_tombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookIssuanceMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('quantity_issued', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lib.book')),
+            ],
+            options={
+                'ordering': ['period_start'],
+                'abstract': False,
+                'unique_together': {('book', 'period_start')},
+            },
+        ),
+        migrations.CreateModel(
+            name='BookIssuanceWeek',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period_start', models.DateField()),
+                ('quantity_issued', models.PositiveIntegerField(default=0)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lib.book')),
+            ],
+            options={
+                'ordering': ['period_start'],
+                'abstract': False,
+                'unique_together': {('book', 'period_start')},
+            },
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def backfill_dashboard_stats(apps, schema_editor):
+    Book = apps.get_model('lib', 'Book')
+    DashboardStats = apps.get_model('lib', 'DashboardStats')
+    Fine = apps.get_model('lib', 'Fine')
+    Issue = apps.get_model('lib', 'Issue')
+    IssueRequest = apps.get_model('lib', 'IssueRequest')
+    Reader = apps.get_model('lib', 'Reader')
+    open_issues = Issue.objects.filter(returned_date__isnull=True)
+    today = date.today()
+    DashboardStats.objects.create(
+        pk=1,
+        total_books=Book.objects.count(),
+        total_readers=Reader.objects.count(),
+        active_issues=open_issues.count(),
+        overdue_issues=open_issues.filter(due_date__lt=today).count(),
+        overdue_as_of=today,
+        pending_requests=IssueRequest.objects.filter(approved=False, rejected=False).count(),
+        unpaid_fines=Fine.objects.filter(paid=False).aggregate(total=Sum('amount'))['total'] or Decimal('0'),
+        reconciled_at=timezone.now(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0026_issuance_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_books', models.BigIntegerField(default=0)),
+                ('total_readers', models.BigIntegerField(default=0)),
+                ('active_issues', models.BigIntegerField(default=0)),
+                ('overdue_issues', models.BigIntegerField(default=0)),
+                ('overdue_as_of', models.DateField(blank=True, null=True)),
+                ('pending_requests', models.BigIntegerField(default=0)),
+                ('unpaid_fines', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('reconciled_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('number_in_stock__lte', 1)), fields=['number_in_stock', 'name'], name='book_low_stock_idx'),
+        ),
+        migrations.RunPython(backfill_dashboard_stats, migrations.RunPython.noop),
+    ]
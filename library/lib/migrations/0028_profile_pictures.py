@@ -0,0 +1,27 @@
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0027_dashboard_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='admin',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, upload_to='profile_pictures/'),
+        ),
+        migrations.AddField(
+            model_name='reader',
+            name='profile_picture',
+            field=models.ImageField(blank=True, null=True, upload_to='profile_pictures/'),
+        ),
+        migrations.AlterField(
+            model_name='reader',
+            name='phone_number',
+            field=models.CharField(max_length=10, unique=True, validators=[django.core.validators.RegexValidator('^\\d{10}$', 'Phone number must be exactly 10 digits.')]),
+        ),
+    ]
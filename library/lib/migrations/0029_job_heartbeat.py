@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0028_profile_pictures'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['heartbeat_at'], name='job_running_idx'),
+        ),
+    ]
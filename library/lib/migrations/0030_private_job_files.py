@@ -0,0 +1,43 @@
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+import lib.storage
+
+
+def move_job_files(apps, schema_editor):
+    """Move job files out of MEDIA_ROOT; inputs of finished jobs are deleted instead."""
+    Job = apps.get_model('lib', 'Job')
+    storage = lib.storage.job_storage()
+    for job in Job.objects.exclude(input_file__isnull=True, artifact__isnull=True).iterator():
+        for field in ('input_file', 'artifact'):
+            name = getattr(job, field).name
+            if not name or not default_storage.exists(name):
+                continue
+            if field == 'input_file' and job.status in ('done', 'failed'):
+                setattr(job, field, None)
+            else:
+                with default_storage.open(name, 'rb') as f:
+                    setattr(job, field, storage.save(name, f))
+            default_storage.delete(name)
+        job.save(update_fields=['input_file', 'artifact'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0029_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='artifact',
+            field=models.FileField(blank=True, null=True, storage=lib.storage.job_storage, upload_to='jobs/output/'),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='input_file',
+            field=models.FileField(blank=True, null=True, storage=lib.storage.job_storage, upload_to='jobs/input/'),
+        ),
+        migrations.RunPython(move_job_files, migrations.RunPython.noop),
+    ]
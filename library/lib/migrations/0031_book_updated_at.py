@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lib', '0030_private_job_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
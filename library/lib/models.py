@@ -1,7 +1,11 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
 from datetime import date, timedelta
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
 
+from .storage import job_storage
+
     
 
 
@@ -14,6 +18,28 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class BookQuerySet(models.QuerySet):
+    def with_ratings(self):
+        """Annotate ``reader_rating_avg`` and ``combined_score`` as SQL arithmetic on the row.
+
+        Both come from the maintained ``reader_rating_sum``/``reader_rating_count``
+        columns, so they can be used to sort and filter in the database.
+        """
+        rating = Cast('rating', models.FloatField())
+        reader_avg = Cast('reader_rating_sum', models.FloatField()) / NullIf('reader_rating_count', 0)
+        return self.annotate(
+            reader_rating_avg=reader_avg,
+            combined_score=Round((rating + Coalesce(reader_avg, rating)) / 2.0, 1),
+        )
+
+    def adjust_reader_rating(self, book_id, sum_delta, count_delta):
+        """Atomically apply a change in reader ratings to a book's running totals."""
+        return self.filter(pk=book_id).update(
+            reader_rating_sum=F('reader_rating_sum') + sum_delta,
+            reader_rating_count=F('reader_rating_count') + count_delta,
+        )
+
+
 class Book(models.Model):
     STATUS_CHOICES = [
         ('available', 'Available'),
@@ -29,18 +55,31 @@ class Book(models.Model):
     description = models.TextField(blank=True, null=True, default="No description available")
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=4.0, validators=[MinValueValidator(1.0), MaxValueValidator(5.0)])  # Rating with 1 decimal place
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
+    # Running totals of BookRating rows, maintained by rate_book and the BookRating
+    # post_delete signal; `manage.py rebuild_rating_aggregates` repairs drift.
+    reader_rating_sum = models.DecimalField(max_digits=10, decimal_places=1, default=0)
+    reader_rating_count = models.PositiveIntegerField(default=0)
+    # Set on every save; bulk updates of the book's details set it themselves, while the stock
+    # and rating counters do not (issue and fine delta exports show the name and ISBN, lib/exports.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # the admin dashboard's low-stock list reads the first rows of this index
+            models.Index(fields=['number_in_stock', 'name'], condition=models.Q(number_in_stock__lte=1),
+                         name='book_low_stock_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.isbn})"
     
     def avg_reader_rating(self):
         """Return average rating given by readers for this book (float). If none, fall back to admin rating."""
-        from django.db.models import Avg
-        avg = self.reader_ratings.aggregate(avg=Avg('rating'))['avg']
-        try:
-            return float(avg) if avg is not None else float(self.rating)
-        except (TypeError, ValueError):
+        if not self.reader_rating_count:
             return float(self.rating)
+        return float(self.reader_rating_sum) / self.reader_rating_count
 
     def combined_rating(self):
         """Return combined rating: average of admin rating and reader average, rounded to 1 decimal."""
@@ -78,6 +117,8 @@ class Reader(models.Model):
     # Flag for college staff members who have different borrowing rules (e.g. longer due dates)
     is_staff_member = models.BooleanField(default=False)
     profile_picture = models.ImageField(upload_to='profile_pictures/', blank=True, null=True)
+    # Set on every save; bulk .update() calls set it themselves (delta exports, lib/exports.py)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
     def __str__(self):
@@ -90,6 +131,20 @@ class Issue(models.Model):
     issued_date = models.DateField(auto_now_add=True)
     due_date = models.DateField(default=default_due_date)
     returned_date = models.DateField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            # A reader can hold at most one unreturned copy of a given book
+            models.UniqueConstraint(
+                fields=['reader', 'book'],
+                condition=models.Q(returned_date__isnull=True),
+                name='unique_active_issue',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['due_date'], condition=models.Q(returned_date__isnull=True), name='issue_active_due_idx'),
+        ]
 
     def __str__(self):
         return f"{self.book.name} issued to {self.reader.name} on {self.issued_date}"
@@ -100,6 +155,7 @@ class Fine(models.Model):
     amount = models.DecimalField(max_digits=8, decimal_places=2, default=0.00)
     paid = models.BooleanField(default=False)
     calculated_date = models.DateField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Fine for {self.issue.book.name} ({self.amount})"
@@ -111,6 +167,20 @@ class IssueRequest(models.Model):
     approved = models.BooleanField(default=False)
     rejected = models.BooleanField(default=False)  # <-- new field
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['reader'],
+                condition=models.Q(approved=False, rejected=False),
+                name='issuerequest_reader_open_idx',
+            ),
+            models.Index(
+                fields=['request_date'],
+                condition=models.Q(approved=False, rejected=False),
+                name='issuerequest_pending_idx',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.book.name} requested by {self.reader.name}"
 
@@ -133,6 +203,13 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['reader', '-created_at'], condition=models.Q(read=False), name='notification_unread_idx'),
+        ]
+        constraints = [
+            # At most one notification of each type per issue (see lib/notifications.py)
+            models.UniqueConstraint(fields=['issue', 'notification_type'], name='unique_issue_notification'),
+        ]
 
     def __str__(self):
         return f"Notification for {self.reader.name}: {self.title}"
@@ -152,6 +229,29 @@ class BookIssuanceRecord(models.Model):
         return f"{self.book.name} - {self.date}: {self.quantity_issued} issued"
 
 
+class IssuanceRollup(models.Model):
+    """Issuance counts per book summed over a week or month, kept next to the daily records (see lib/analytics.py)."""
+    book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='+')
+    period_start = models.DateField()
+    quantity_issued = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        unique_together = ('book', 'period_start')
+        ordering = ['period_start']
+
+    def __str__(self):
+        return f"{self.book.name} - {self.period_start}: {self.quantity_issued} issued"
+
+
+class BookIssuanceWeek(IssuanceRollup):
+    """Weekly totals; ``period_start`` is the Monday."""
+
+
+class BookIssuanceMonth(IssuanceRollup):
+    """Monthly totals; ``period_start`` is the first of the month."""
+
+
 class BookRating(models.Model):
     """Per-reader rating for a book."""
     book = models.ForeignKey('Book', on_delete=models.CASCADE, related_name='reader_ratings')
@@ -167,3 +267,90 @@ class BookRating(models.Model):
         return f"{self.reader.name} -> {self.book.name}: {self.rating}"
     
 
+
+
+class PopularBook(models.Model):
+    """Materialized pool of highly rated books that detail pages sample from (see lib/popularity.py)."""
+    book = models.OneToOneField('Book', on_delete=models.CASCADE, primary_key=True, related_name='popularity')
+    combined_score = models.DecimalField(max_digits=3, decimal_places=1)
+    refreshed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.book.name}: {self.combined_score}"
+
+
+class Job(models.Model):
+    """A long import or export run by ``manage.py run_jobs`` (see lib/jobs.py)."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    # private storage outside MEDIA_ROOT (see lib/storage.py); the input is deleted once the job finishes
+    input_file = models.FileField(upload_to='jobs/input/', storage=job_storage, blank=True, null=True)
+    artifact = models.FileField(upload_to='jobs/output/', storage=job_storage, blank=True, null=True)
+    artifact_filename = models.CharField(max_length=100, blank=True)
+    total = models.PositiveIntegerField(blank=True, null=True)
+    processed = models.PositiveIntegerField(default=0)
+    errors = models.PositiveIntegerField(default=0)
+    message = models.TextField(blank=True)
+    created_by = models.ForeignKey('Admin', on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    # touched by the worker while the job runs; a running job whose heartbeat stops was orphaned
+    heartbeat_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(status='queued'), name='job_queued_idx'),
+            models.Index(fields=['heartbeat_at'], condition=models.Q(status='running'), name='job_running_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+
+class TableVersion(models.Model):
+    """Write counter per table, bumped after each commit; keys the cached exports (see lib/exports.py)."""
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+
+
+class Tombstone(models.Model):
+    """A deleted Issue, Fine or Reader, reported by delta exports (see lib/exports.py)."""
+    table = models.CharField(max_length=100)
+    object_id = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['table', 'deleted_at'], name='tombstone_table_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.table} #{self.object_id} deleted {self.deleted_at}"
+
+
+class DashboardStats(models.Model):
+    """The admin dashboard counters, kept in a single row that writes adjust (see lib/dashboard.py)."""
+    total_books = models.BigIntegerField(default=0)
+    total_readers = models.BigIntegerField(default=0)
+    active_issues = models.BigIntegerField(default=0)
+    # open issues due before overdue_as_of; the first read on a later day catches up
+    overdue_issues = models.BigIntegerField(default=0)
+    overdue_as_of = models.DateField(null=True, blank=True)
+    pending_requests = models.BigIntegerField(default=0)
+    unpaid_fines = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    reconciled_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Dashboard stats (reconciled {self.reconciled_at})"
@@ -0,0 +1,97 @@
+"""Reader notifications.
+
+Due-soon and overdue notifications are generated in bulk by
+``manage.py send_due_notifications`` (run it daily from cron), never on a
+page view.  Each query finds the issues that still lack a notification of
+that type with a single ``NOT EXISTS`` and inserts them with one
+``bulk_create``; the unique constraint on ``(issue, notification_type)``
+makes concurrent or repeated runs harmless.
+"""
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Issue, Notification
+
+DUE_SOON_DAYS = 2
+
+
+def _issue_notification(issue):
+    return Notification(
+        reader=issue.reader,
+        issue=issue,
+        notification_type='issued',
+        title=f"Book Issued: {issue.book.name}",
+        message=f"You have been issued '{issue.book.name}' by {issue.book.author}. Due date: {issue.due_date}"
+    )
+
+
+def create_issue_notification(issue):
+    """Create a notification when a book is issued to a reader."""
+    _issue_notification(issue).save()
+
+
+def create_issue_notifications(issues):
+    """Bulk variant of ``create_issue_notification`` for batch approvals."""
+    return Notification.objects.bulk_create(
+        [_issue_notification(issue) for issue in issues], batch_size=500, ignore_conflicts=True
+    )
+
+
+def create_request_rejected_notifications(issue_requests):
+    """Tell each reader that their request was rejected, in one insert."""
+    return Notification.objects.bulk_create([
+        Notification(
+            reader_id=req.reader_id,
+            issue=None,
+            notification_type='request_rejected',
+            title=f"Request Rejected: {req.book.name}",
+            message=f"Your request to issue '{req.book.name}' was rejected by the library administrator."
+        )
+        for req in issue_requests
+    ], batch_size=500)
+
+
+def _issues_without(notification_type, **filters):
+    already_notified = Notification.objects.filter(issue=OuterRef('pk'), notification_type=notification_type)
+    return Issue.objects.filter(returned_date__isnull=True, **filters).filter(
+        ~Exists(already_notified)
+    ).values_list('pk', 'reader_id', 'book__name', 'due_date')
+
+
+def check_and_create_due_soon_notifications():
+    """Create notifications for books due in 2 days. Returns how many issues were notified."""
+    today = timezone.now().date()
+    issues = _issues_without('due_soon', due_date=today + timedelta(days=DUE_SOON_DAYS))
+    created = Notification.objects.bulk_create([
+        Notification(
+            reader_id=reader_id,
+            issue_id=issue_id,
+            notification_type='due_soon',
+            title=f"Due Soon: {book_name}",
+            message=f"'{book_name}' is due on {due_date}. Please return it on time to avoid fines."
+        )
+        for issue_id, reader_id, book_name, due_date in issues
+    ], batch_size=500, ignore_conflicts=True)
+    return len(created)
+
+
+def check_and_create_overdue_notifications():
+    """Create notifications for overdue books. Returns how many issues were notified."""
+    today = timezone.now().date()
+    issues = _issues_without('overdue', due_date__lt=today)
+    created = Notification.objects.bulk_create([
+        Notification(
+            reader_id=reader_id,
+            issue_id=issue_id,
+            notification_type='overdue',
+            title=f"Overdue: {book_name}",
+            message=(
+                f"'{book_name}' is {(today - due_date).days} day(s) overdue. "
+                f"Please return it immediately to avoid additional fines."
+            )
+        )
+        for issue_id, reader_id, book_name, due_date in issues
+    ], batch_size=500, ignore_conflicts=True)
+    return len(created)
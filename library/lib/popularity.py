@@ -0,0 +1,108 @@
+"""Precomputed pool of popular books for the "Popular books" panel.
+
+Book detail pages show a random sample of books whose combined rating is at
+least ``POPULAR_BOOKS_MIN_RATING``.  Instead of rating every book on each
+page view, the qualifying books are stored in the ``PopularBook`` table:
+
+* ``refresh_popular_books()`` (also ``manage.py refresh_popular_books``)
+  rebuilds the table with one query over the catalog;
+* ``update_book()`` adds or removes a single book when its rating changes;
+* ``get_popular_books()`` samples from the pool ids, which are cached for
+  ``POPULAR_BOOKS_REFRESH_SECONDS``.  If the oldest pool row is older than
+  ``POPULAR_BOOKS_MAX_STALENESS`` the stale pool is still served and a
+  ``refresh_popular_books`` background job is queued (at most one at a
+  time; ``manage.py refresh_popular_books`` from cron keeps it from going
+  stale at all).  Only an empty pool is rebuilt on the request path, by
+  the one request that wins a cache lock.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Book, Job, PopularBook
+
+POPULAR_BOOKS_MIN_RATING = getattr(settings, 'POPULAR_BOOKS_MIN_RATING', 4.5)
+POPULAR_BOOKS_REFRESH_SECONDS = getattr(settings, 'POPULAR_BOOKS_REFRESH_SECONDS', 300)
+POPULAR_BOOKS_MAX_STALENESS = getattr(settings, 'POPULAR_BOOKS_MAX_STALENESS', 24 * 60 * 60)
+
+POOL_CACHE_KEY = 'lib:popular_book_ids'
+REBUILD_LOCK_KEY = 'lib:popular_books_rebuilding'
+REBUILD_LOCK_SECONDS = 60
+REFRESH_JOB = 'refresh_popular_books'
+
+
+def refresh_popular_books():
+    """Rebuild the whole pool. Returns the number of popular books."""
+    now = timezone.now()
+    scored = Book.objects.with_ratings().filter(
+        combined_score__gte=POPULAR_BOOKS_MIN_RATING
+    ).values_list('pk', 'combined_score')
+    with transaction.atomic():
+        PopularBook.objects.all().delete()
+        PopularBook.objects.bulk_create(
+            (PopularBook(book_id=pk, combined_score=score, refreshed_at=now)
+             for pk, score in scored.iterator(chunk_size=2000)),
+            batch_size=1000,
+        )
+    cache.delete(POOL_CACHE_KEY)
+    return PopularBook.objects.count()
+
+
+def update_book(book):
+    """Add, refresh or drop a single book after its rating changed."""
+    score = book.combined_rating()
+    if score >= POPULAR_BOOKS_MIN_RATING:
+        PopularBook.objects.update_or_create(
+            book_id=book.pk,
+            defaults={'combined_score': score, 'refreshed_at': timezone.now()},
+        )
+    else:
+        PopularBook.objects.filter(book_id=book.pk).delete()
+    cache.delete(POOL_CACHE_KEY)
+
+
+def _schedule_refresh():
+    """Queue a background rebuild of the pool unless one is already queued or running."""
+    from .jobs import enqueue
+
+    if not Job.objects.filter(kind=REFRESH_JOB, status__in=('queued', 'running')).exists():
+        enqueue(REFRESH_JOB)
+
+
+def _rebuild_empty_pool():
+    """Rebuild an empty pool in this request. Returns False if another request is already rebuilding it."""
+    if not cache.add(REBUILD_LOCK_KEY, True, REBUILD_LOCK_SECONDS):
+        return False
+    try:
+        refresh_popular_books()
+    finally:
+        cache.delete(REBUILD_LOCK_KEY)
+    return True
+
+
+def _pool_ids():
+    ids = cache.get(POOL_CACHE_KEY)
+    if ids is None:
+        rows = list(PopularBook.objects.values_list('book_id', 'refreshed_at'))
+        if not rows:
+            if not _rebuild_empty_pool():
+                # serve no popular books until the other request has filled the pool
+                return []
+            rows = list(PopularBook.objects.values_list('book_id', 'refreshed_at'))
+        elif timezone.now() - min(refreshed for _, refreshed in rows) > timedelta(seconds=POPULAR_BOOKS_MAX_STALENESS):
+            _schedule_refresh()
+        ids = [book_id for book_id, _ in rows]
+        cache.set(POOL_CACHE_KEY, ids, POPULAR_BOOKS_REFRESH_SECONDS)
+    return ids
+
+
+def get_popular_books(limit=4, exclude_book_id=None):
+    """Get random popular books with combined rating >= POPULAR_BOOKS_MIN_RATING."""
+    ids = [pk for pk in _pool_ids() if pk != exclude_book_id]
+    sample = random.sample(ids, min(limit, len(ids)))
+    found = Book.objects.in_bulk(sample)
+    return [found[pk] for pk in sample if pk in found]
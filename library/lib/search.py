@@ -0,0 +1,121 @@
+"""Catalog search backed by a full-text index.
+
+On SQLite the books are mirrored into an FTS5 table using the ``trigram``
+tokenizer, so a MATCH against it answers the same substring question as
+``icontains`` without scanning every row of ``lib_book``.  The ranking
+(name starts-with, name contains, author, ISBN) is then computed only for
+the matched candidates.  Other database backends, and queries shorter than
+a trigram, fall back to the plain ``icontains`` filter.
+"""
+from django.db import connection
+from django.db.models import Q, Case, When, Value, IntegerField
+from django.db.models.expressions import RawSQL
+
+from .models import Category
+
+FTS_TABLE = 'lib_book_fts'
+
+# The trigram tokenizer cannot match anything shorter than three characters.
+MIN_FTS_QUERY_LENGTH = 3
+
+_fts_available = None
+
+
+def fts_available():
+    """Return True if the FTS5 book index exists on the default database."""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = (
+            connection.vendor == 'sqlite'
+            and FTS_TABLE in connection.introspection.table_names()
+        )
+    return _fts_available
+
+
+def index_book(book):
+    """Insert or refresh a single book in the search index."""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, author, isbn) VALUES (%s, %s, %s, %s)",
+            [book.pk, book.name, book.author, book.isbn],
+        )
+
+
+def index_books(book_ids):
+    """Refresh many books at once, e.g. after a bulk import that bypassed the signals."""
+    if not fts_available() or not book_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(book_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", list(book_ids))
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, author, isbn) "
+            f"SELECT id, name, author, isbn FROM lib_book WHERE id IN ({placeholders})",
+            list(book_ids),
+        )
+
+
+def unindex_book(book_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [book_id])
+
+
+def rebuild_index():
+    """Drop and repopulate the whole index. Returns the number of books indexed."""
+    if not fts_available():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, author, isbn) "
+            f"SELECT id, name, author, isbn FROM lib_book"
+        )
+        cursor.execute(f"SELECT COUNT(*) FROM {FTS_TABLE}")
+        return cursor.fetchone()[0]
+
+
+def _fts_phrase(q):
+    # Quote the whole query as one FTS phrase so operators in user input are literal
+    return '"' + q.replace('"', '""') + '"'
+
+
+def matching_ids(q):
+    """Subquery yielding the ids of books whose name, author or ISBN contain ``q``."""
+    return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [_fts_phrase(q)])
+
+
+def search_books(books, q, include_category=False):
+    """Filter ``books`` to those matching ``q`` and order them by match priority.
+
+    Priority: name starts with query (0) > name contains (1) > author starts
+    with (2) > author contains (3) > ISBN starts with (4) > ISBN contains (5),
+    then alphabetically by name.  With ``include_category`` a match on the
+    category name is also accepted (ranked last).
+    """
+    if fts_available() and len(q) >= MIN_FTS_QUERY_LENGTH:
+        match = Q(pk__in=matching_ids(q))
+    else:
+        match = Q(name__icontains=q) | Q(author__icontains=q) | Q(isbn__icontains=q)
+    if include_category:
+        # category ids resolved first: an OR across the join would make SQLite scan lib_book
+        category_ids = list(Category.objects.filter(name__icontains=q).values_list('pk', flat=True))
+        if category_ids:
+            match |= Q(category_id__in=category_ids)
+
+    return books.filter(match).annotate(
+        match_priority=Case(
+            When(name__istartswith=q, then=Value(0)),
+            When(name__icontains=q, then=Value(1)),
+            When(author__istartswith=q, then=Value(2)),
+            When(author__icontains=q, then=Value(3)),
+            When(isbn__istartswith=q, then=Value(4)),
+            When(isbn__icontains=q, then=Value(5)),
+            default=Value(6),
+            output_field=IntegerField()
+        )
+    ).order_by('match_priority', 'name')
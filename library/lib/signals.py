@@ -0,0 +1,76 @@
+from django.core.signals import request_finished
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Book, BookRating, Fine, Issue, IssueRequest, Reader, Tombstone
+from . import analytics, autocomplete, dashboard, exports, popularity, search, similar
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, update_fields=None, **kwargs):
+    search.index_book(instance)
+    autocomplete.index_book(instance)
+    if created:
+        # Moved or deleted books are filtered out when sampling, so only new books need this
+        similar.invalidate_category(instance.category_id)
+    if update_fields is None or 'rating' in update_fields:
+        popularity.update_book(instance)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    search.unindex_book(instance.pk)
+    autocomplete.unindex_book(instance.pk)
+
+
+@receiver(post_delete, sender=BookRating)
+def remove_rating_from_book_totals(sender, instance, **kwargs):
+    Book.objects.adjust_reader_rating(instance.book_id, -instance.rating, -1)
+
+
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Reader)
+@receiver([post_save, post_delete], sender=Issue)
+@receiver([post_save, post_delete], sender=Fine)
+def exported_table_changed(sender, **kwargs):
+    exports.touch(sender)
+
+
+@receiver(post_delete, sender=Reader)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Fine)
+def record_tombstone(sender, instance, **kwargs):
+    # delta exports list deleted rows from here
+    Tombstone.objects.create(table=sender._meta.db_table, object_id=instance.pk)
+
+
+@receiver(pre_save, sender=Issue)
+@receiver(pre_save, sender=IssueRequest)
+@receiver(pre_save, sender=Fine)
+def remember_dashboard_counts(sender, instance, update_fields=None, **kwargs):
+    dashboard.remember(instance, update_fields)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=Reader)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=IssueRequest)
+@receiver(post_save, sender=Fine)
+def dashboard_row_saved(sender, instance, created, update_fields=None, **kwargs):
+    dashboard.row_saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Book)
+@receiver(post_delete, sender=Reader)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=IssueRequest)
+@receiver(post_delete, sender=Fine)
+def dashboard_row_deleted(sender, instance, **kwargs):
+    dashboard.row_deleted(instance)
+
+
+@receiver(request_finished)
+def flush_issuance_buffer(sender, **kwargs):
+    # with no flush interval, buffered analytics counts are written once per request
+    if analytics.ANALYTICS_BUFFER_ISSUANCES and not analytics.issuance_buffer.flush_seconds:
+        analytics.issuance_buffer.flush()
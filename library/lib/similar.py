@@ -0,0 +1,44 @@
+"""Random "similar books" (same category) without ``ORDER BY RANDOM()``.
+
+The ids of each category's books are cached for
+``SIMILAR_BOOKS_CACHE_SECONDS`` and sampled in Python, so a detail page
+costs one small ``pk IN (...)`` query however large the category is.  New
+books drop their category's cached ids; the sample is re-checked against
+the category when hydrating, so a book deleted or moved to another category
+in the meantime is never shown.
+"""
+import random
+from array import array
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Book
+
+SIMILAR_BOOKS_CACHE_SECONDS = getattr(settings, 'SIMILAR_BOOKS_CACHE_SECONDS', 300)
+
+
+def _cache_key(category_id):
+    return f'lib:category_book_ids:{category_id}'
+
+
+def category_book_ids(category_id):
+    ids = cache.get(_cache_key(category_id))
+    if ids is None:
+        # a packed array keeps the cached value cheap to (un)pickle for large categories
+        ids = array('q', Book.objects.filter(category_id=category_id).values_list('pk', flat=True))
+        cache.set(_cache_key(category_id), ids, SIMILAR_BOOKS_CACHE_SECONDS)
+    return ids
+
+
+def invalidate_category(category_id):
+    cache.delete(_cache_key(category_id))
+
+
+def get_similar_books(book, limit=4):
+    """Get random books from the same category."""
+    ids = category_book_ids(book.category_id)
+    # Oversample a little so stale ids dropped below still leave `limit` books
+    sample = random.sample(ids, min(len(ids), limit * 2 + 1))
+    found = Book.objects.filter(category_id=book.category_id).exclude(pk=book.pk).in_bulk(sample)
+    return [found[pk] for pk in sample if pk in found][:limit]
@@ -0,0 +1,28 @@
+"""Private file storage for background job uploads, artifacts and import reports.
+
+Job files hold personal data (reader phone numbers and addresses in
+exports, reader ids in import reports), so they are kept out of
+``MEDIA_ROOT``, which is served to anyone under ``MEDIA_URL``.  They live
+in ``JOB_FILES_DIR`` instead, created readable by the server user only, and
+are downloaded only through the admin-only ``job_download`` view.  The
+directory defaults to one under the system temp directory; point it at a
+persistent private directory in production.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+JOB_FILES_DIR = getattr(settings, 'JOB_FILES_DIR', os.path.join(tempfile.gettempdir(), 'library-job-files'))
+
+_job_storage = FileSystemStorage(
+    location=JOB_FILES_DIR,
+    directory_permissions_mode=0o700,
+    file_permissions_mode=0o600,
+)
+
+
+def job_storage():
+    """The storage of ``Job`` files (a callable, so migrations do not record the location)."""
+    return _job_storage
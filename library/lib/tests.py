@@ -1,3 +1,745 @@
-from django.test import TestCase
+import csv
+import io
+import os
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import OperationalError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import Workbook
+
+from lib import analytics, approvals, autocomplete, circulation, dashboard, exports, fines, importers, jobs, popularity, search, similar, views
+from lib.models import (
+    Admin, Book, BookIssuanceRecord, Category, DashboardStats, Fine, Issue, IssueRequest, Job, Notification, PopularBook,
+    Reader, Tombstone,
+)
+from lib.storage import JOB_FILES_DIR, job_storage
+
+
+def make_reader(i):
+    return Reader.objects.create(reader_id=f'R{i}', name=f'Reader {i}', date_of_birth=date(1990, 1, 1),
+                                 phone_number=f'5{i:09d}', address='-')
+
+
+class AdminClientMixin:
+    def login_admin(self):
+        session = self.client.session
+        session['admin_id'] = Admin.objects.create(admin_id='admin', name='Admin').pk
+        session.save()
+
+
+def run_concurrently(threads, iterations, action):
+    """Call ``action()`` ``iterations`` times from each of ``threads`` threads started together.
+
+    SQLite reports a busy or locked database as OperationalError; the call is
+    retried, so ``action`` must not have committed anything when it raises.
+    """
+    start = threading.Barrier(threads)
+    errors = []
+
+    def worker():
+        try:
+            start.wait()
+            for _ in range(iterations):
+                while True:
+                    try:
+                        action()
+                        break
+                    except OperationalError:
+                        continue
+        except Exception as e:
+            errors.append(e)
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return errors
+
+
+class IssuanceCountConcurrencyTests(TransactionTestCase):
+    """Concurrent approvals of one book must not lose issuance counts (lib/analytics.py)."""
+    threads = 8
+    iterations = 50
+
+    def setUp(self):
+        self.book = Book.objects.create(name='Concurrent', author='Test', isbn='CONC00000001')
+        self.today = date.today()
+
+    def assertAllCounted(self):
+        expected = self.threads * self.iterations
+        for model, field, period_of in analytics.TABLES.values():
+            stored = model.objects.get(book=self.book, **{field: period_of(self.today)})
+            self.assertEqual(stored.quantity_issued, expected, model.__name__)
+
+    def test_atomic_upserts(self):
+        def record():
+            with transaction.atomic():
+                analytics.record_issuances({self.book.pk: 1}, self.today)
+
+        self.assertEqual(run_concurrently(self.threads, self.iterations, record), [])
+        self.assertAllCounted()
+
+    def test_buffered(self):
+        # a short interval so timer flushes run while the threads are still adding
+        buffer = analytics.IssuanceBuffer(flush_seconds=0.001)
+        errors = run_concurrently(self.threads, self.iterations, lambda: buffer.add(self.book.pk, self.today))
+        buffer.flush()
+        self.assertEqual(errors, [])
+        self.assertAllCounted()
+
+
+class StockConcurrencyTests(TransactionTestCase):
+    """Concurrent issues and returns of one book never take stock below zero (lib/circulation.py)."""
+    threads = 8
+    iterations = 25
+    stock = 3
+
+    def test_stock_never_negative(self):
+        book = Book.objects.create(name='Contended', author='Test', isbn='CONC00000002', number_in_stock=self.stock)
+        readers = iter([make_reader(i) for i in range(self.threads)])
+        local = threading.local()
+        violations = []
+        running = True
+
+        def issue_and_return():
+            if not hasattr(local, 'reader'):
+                local.reader = next(readers)
+            try:
+                issue = circulation.issue_copy(local.reader, book)
+            except circulation.OutOfStock:
+                return
+            except circulation.AlreadyIssued:
+                # a retried attempt whose issue committed before the busy error of an on_commit hook
+                issue = Issue.objects.get(reader=local.reader, book=book, returned_date__isnull=True)
+            while True:
+                try:
+                    circulation.return_issue(issue)
+                    return
+                except OperationalError:
+                    continue
+
+        def monitor():
+            try:
+                while running:
+                    try:
+                        in_stock = Book.objects.filter(pk=book.pk).values_list('number_in_stock', flat=True).get()
+                        active = Issue.objects.filter(book=book, returned_date__isnull=True).count()
+                    except OperationalError:
+                        continue
+                    if in_stock < 0 or active > self.stock:
+                        violations.append((in_stock, active))
+            finally:
+                connection.close()
+
+        watcher = threading.Thread(target=monitor)
+        watcher.start()
+        try:
+            errors = run_concurrently(self.threads, self.iterations, issue_and_return)
+        finally:
+            running = False
+            watcher.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(violations, [])
+        book.refresh_from_db()
+        self.assertGreaterEqual(book.number_in_stock, 0)
+        self.assertEqual(book.number_in_stock + Issue.objects.filter(book=book, returned_date__isnull=True).count(), self.stock)
+
+
+class DeltaExportRetentionTests(AdminClientMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+        self.kept = make_reader(1)
+        make_reader(2).delete()
+        self.expired = Tombstone.objects.create(table=Reader._meta.db_table, object_id=99)
+        Tombstone.objects.filter(pk=self.expired.pk).update(
+            deleted_at=timezone.now() - timedelta(days=exports.EXPORT_TOMBSTONE_RETENTION_DAYS + 1)
+        )
+
+    def export(self, since):
+        response = self.client.get(reverse('export_readers'), {'since': since.isoformat()})
+        return response, b''.join(response.streaming_content).decode().splitlines()
+
+    def test_prune_keeps_tombstones_within_retention(self):
+        self.assertEqual(exports.prune_tombstones(), 1)
+        self.assertFalse(Tombstone.objects.filter(pk=self.expired.pk).exists())
+        self.assertEqual(Tombstone.objects.count(), 1)
+
+    def test_recent_since_gets_changes(self):
+        response, lines = self.export(timezone.now() - timedelta(days=1))
+        self.assertEqual(response['X-Export-Delta'], 'changes')
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['upsert', 'delete'])
+
+    def test_renamed_reader_or_book_shows_up_in_related_deltas(self):
+        book = Book.objects.create(name='Old title', author='Test', isbn='DELT00000001')
+        fined = Issue.objects.create(reader=self.kept, book=book, due_date=date.today())
+        untouched = Issue.objects.create(reader=make_reader(3), book=Book.objects.create(
+            name='Other', author='Test', isbn='DELT00000002'), due_date=date.today())
+        fine = Fine.objects.create(issue=fined, amount=1)
+        since = timezone.now() + timedelta(seconds=1)
+        past = since - timedelta(minutes=1)
+        for model in (Reader, Book, Issue, Fine):
+            model.objects.update(updated_at=past)
+        Book.objects.filter(pk=book.pk).update(name='New title', updated_at=since)
+
+        response = self.client.get(reverse('export_issues'), {'since': since.isoformat()})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(fined.pk)])
+        self.assertIn('New title', lines[1])
+        self.assertNotIn(str(untouched.pk), [line.split(',')[0] for line in lines[1:]])
+
+        Reader.objects.filter(pk=self.kept.pk).update(name='Renamed reader', updated_at=since + timedelta(seconds=1))
+        response = self.client.get(reverse('export_fines'), {'since': since.isoformat()})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(fine.pk)])
+        self.assertIn('Renamed reader', lines[1])
+        self.assertIn((since + timedelta(seconds=1)).isoformat()[:19], lines[1])
+
+    def test_since_before_retention_gets_full_export(self):
+        response, lines = self.export(timezone.now() - timedelta(days=exports.EXPORT_TOMBSTONE_RETENTION_DAYS + 1))
+        self.assertEqual(response['X-Export-Delta'], 'full')
+        self.assertNotIn('Change', lines[0])
+        self.assertEqual(len(lines), 2)
+
+
+class PopularPoolTests(TestCase):
+    def setUp(self):
+        cache.delete(popularity.POOL_CACHE_KEY)
+        self.book = Book.objects.create(name='Popular', author='Test', isbn='POP000000001')
+        self.addCleanup(cache.delete, popularity.POOL_CACHE_KEY)
+
+    def test_stale_pool_is_served_and_refresh_queued_once(self):
+        PopularBook.objects.create(book=self.book, combined_score=5,
+                                   refreshed_at=timezone.now() - timedelta(seconds=popularity.POPULAR_BOOKS_MAX_STALENESS + 1))
+        self.assertEqual(popularity._pool_ids(), [self.book.pk])
+        cache.delete(popularity.POOL_CACHE_KEY)
+        popularity._pool_ids()
+        self.assertEqual(Job.objects.filter(kind=popularity.REFRESH_JOB, status='queued').count(), 1)
+        self.assertTrue(PopularBook.objects.filter(book=self.book).exists())
+
+    def test_empty_pool_is_rebuilt_by_the_lock_holder_only(self):
+        cache.add(popularity.REBUILD_LOCK_KEY, True)
+        self.addCleanup(cache.delete, popularity.REBUILD_LOCK_KEY)
+        self.assertEqual(popularity._pool_ids(), [])
+        self.assertIsNone(cache.get(popularity.POOL_CACHE_KEY))
+        cache.delete(popularity.REBUILD_LOCK_KEY)
+        self.assertEqual(popularity._pool_ids(), [])
+        self.assertEqual(cache.get(popularity.POOL_CACHE_KEY), [])
+        self.assertFalse(Job.objects.exists())
+
+
+class KeysetCursorTests(TestCase):
+    def setUp(self):
+        self.readers = [make_reader(i) for i in range(3)]
+
+    def page(self, **params):
+        request = RequestFactory().get('/', params)
+        return views.keyset_paginate(request, Reader.objects.all(), ['name', 'id'], per_page=2)
+
+    def test_cursor_values_are_converted(self):
+        cursor = self.page().next_cursor
+        self.assertEqual(views._decode_cursor(cursor, Reader, ['name', 'id']), ['Reader 1', self.readers[1].pk])
+        self.assertEqual([r.pk for r in self.page(after=cursor)], [self.readers[2].pk])
+
+    def test_invalid_cursor_restarts_from_first_page(self):
+        for values in (['Reader 1', 'abc'], ['Reader 1', [1]], 'not a list'):
+            cursor = views.base64.urlsafe_b64encode(views.json.dumps(values).encode()).decode()
+            self.assertEqual([r.pk for r in self.page(after=cursor)], [r.pk for r in self.readers[:2]], values)
+
+
+class BookImportValidationTests(TestCase):
+    def workbook(self, *rows):
+        workbook = Workbook()
+        workbook.active.append(importers.BOOK_COLUMNS)
+        for row in rows:
+            workbook.active.append(row)
+        out = io.BytesIO()
+        workbook.save(out)
+        out.seek(0)
+        return out
+
+    def test_bad_rows_are_reported_and_the_rest_imported(self):
+        result = importers.import_books_xlsx(self.workbook(
+            ['Good', '9780000000001', 'Author', 'Fiction', 3, None, 4.5, 'available'],
+            [None, '9780000000002', 'Author', None, 1, None, None, None],
+            ['Bad stock', '9780000000003', 'Author', None, 'many', None, None, None],
+            ['Bad rating', '9780000000004', 'Author', None, 1, None, 'high', None],
+            ['Half copy', '9780000000005', 'Author', None, 1.5, None, 9, None],
+        ))
+        self.addCleanup(job_storage().delete, result.report_name)
+        self.assertEqual((result.created, result.updated, result.errors), (1, 0, 4))
+        self.assertEqual(list(Book.objects.values_list('isbn', 'number_in_stock')), [('9780000000001', 3)])
+        with job_storage().open(result.report_name) as f:
+            report = list(csv.reader(io.TextIOWrapper(f, encoding='utf-8')))
+        self.assertEqual(report[0], importers.BOOK_REPORT_COLUMNS)
+        self.assertEqual([(row[0], row[1], row[3]) for row in report[1:]],
+                         [(str(line), f'978000000000{line - 1}', 'error') for line in range(3, 7)])
+        self.assertIn('name', report[1][4])
+
+
+class StaleJobTests(TestCase):
+    def running_job(self, heartbeat_age):
+        started = timezone.now() - timedelta(seconds=heartbeat_age)
+        return Job.objects.create(kind='export', status='running', started_at=started, heartbeat_at=started)
+
+    def test_claim_fails_orphaned_running_jobs(self):
+        orphaned = self.running_job(jobs.JOB_STALE_AFTER + 1)
+        alive = self.running_job(jobs.JOB_HEARTBEAT_INTERVAL)
+        queued = Job.objects.create(kind='export')
+        self.assertEqual(jobs.claim_next(), queued)
+        orphaned.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((orphaned.status, alive.status), ('failed', 'running'))
+        self.assertIsNotNone(orphaned.finished_at)
+
+
+class LibraryAnalyticsTests(TestCase):
+    def test_top_categories_follow_the_issued_books(self):
+        fiction = Category.objects.create(name='Fiction')
+        books = [
+            Book.objects.create(name=f'Book {i}', author='Test', isbn=f'ANL00000000{i}', category=category)
+            for i, category in enumerate([fiction, fiction, None])
+        ]
+        readers = [make_reader(i) for i in range(3)]
+        for reader in readers:
+            Issue.objects.create(reader=reader, book=books[0], due_date=date.today())
+        Issue.objects.create(reader=readers[0], book=books[1], due_date=date.today())
+        Issue.objects.create(reader=readers[0], book=books[2], due_date=date.today())
+
+        data = analytics.library_analytics(30)
+        self.assertEqual([(c['id'], c['name'], c['issues']) for c in data['top_categories']],
+                         [(fiction.pk, 'Fiction', 4), (0, 'Uncategorized', 1)])
+        self.assertEqual([(b['id'], b['issues']) for b in data['top_books']][0], (books[0].pk, 3))
+
+
+class AutocompleteBuildTests(TestCase):
+    def setUp(self):
+        self.index = autocomplete.AutocompleteIndex()
+
+    def test_edits_during_build_are_replayed(self):
+        def rows():
+            yield 1, 'Alpha', 'Author', '111', None
+            # saved and deleted while the build is still reading
+            self.index.add(3, 'Gamma', 'Author', '333', None)
+            self.index.remove(2)
+            yield 2, 'Beta', 'Author', '222', None
+
+        self.index.build(rows())
+        self.assertEqual(self.index.query('a', limit=10), [1, 3])
+        self.assertFalse(self.index.building)
+
+    def test_invalidate_during_build_forces_another(self):
+        def rows():
+            yield 1, 'Alpha', 'Author', '111', None
+            self.index.invalidate()
+
+        self.index.build(rows())
+        self.assertIsNone(self.index.built_at)
+
+    def test_one_thread_builds_at_a_time(self):
+        builds = []
+
+        def build(rows):
+            builds.append(threading.get_ident())
+            time.sleep(0.05)
+            self.index.built_at = time.monotonic()
+
+        started = threading.Barrier(8)
+        served = []
+
+        def query():
+            started.wait()
+            served.append(autocomplete.get_index())
+
+        with mock.patch.object(autocomplete, '_index', self.index), mock.patch.object(self.index, 'build', build):
+            pool = [threading.Thread(target=query) for _ in range(8)]
+            for t in pool:
+                t.start()
+            for t in pool:
+                t.join()
+        self.assertEqual(len(builds), 1)
+        self.assertEqual(served, [self.index] * 8)
+
+
+class DashboardUpdateFieldsTests(TestCase):
+    def setUp(self):
+        dashboard.reconcile()
+        self.fine = Fine.objects.create(issue=Issue.objects.create(
+            reader=make_reader(1), book=Book.objects.create(name='Fined', author='Test', isbn='FINE00000001'),
+            due_date=date.today(),
+        ), amount=5)
+
+    def unpaid(self):
+        return DashboardStats.objects.get().unpaid_fines
+
+    def test_save_without_counted_fields_skips_the_stored_row_read(self):
+        self.fine.amount = 7  # not saved below, so the counters must not see it
+        with self.assertNumQueries(1):
+            self.fine.save(update_fields=['updated_at'])
+        self.assertEqual(self.unpaid(), 5)
+
+    def test_save_of_counted_fields_still_adjusts(self):
+        self.fine.paid = True
+        self.fine.save(update_fields=['paid'])
+        self.assertEqual(self.unpaid(), 0)
+
+
+class JobFileTests(AdminClientMixin, TestCase):
+    def test_files_are_private_and_the_input_is_deleted(self):
+        job = jobs.enqueue('import_issues', input_file=SimpleUploadedFile('issues.csv', b'reader_id,isbn\nNOPE,123\n'))
+        input_path = job.input_file.path
+        self.assertTrue(input_path.startswith(JOB_FILES_DIR))
+        jobs.run_job(jobs.claim_next())
+        job.refresh_from_db()
+        self.addCleanup(job.artifact.delete, save=False)
+
+        self.assertEqual(job.status, 'done')
+        self.assertFalse(job.input_file)
+        self.assertFalse(os.path.exists(input_path))
+        self.assertTrue(job.artifact.path.startswith(JOB_FILES_DIR))
+        self.assertFalse(job.artifact.path.startswith(str(settings.MEDIA_ROOT)))
+
+        url = reverse('job_download', args=[job.pk])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.login_admin()
+        response = self.client.get(url)
+        self.assertIn(b'Unknown reader_id', b''.join(response.streaming_content))
+
+
+class AccrueFinesTests(TestCase):
+    today = date(2026, 3, 2)
+
+    def setUp(self):
+        self.reader = make_reader(1)
+        self.books = iter(Book.objects.create(name=f'Book {i}', author='Test', isbn=f'FINE0000000{i}') for i in range(10))
+
+    def issue(self, due, returned=None):
+        return Issue.objects.create(reader=self.reader, book=next(self.books), due_date=due, returned_date=returned)
+
+    def amount(self, issue):
+        return Fine.objects.get(issue=issue).amount
+
+    def test_overdue_days_counted_in_sql_across_a_month_end(self):
+        overdue = self.issue(date(2026, 2, 27))
+        self.assertEqual(fines.accrue_fines(self.today), (1, 1))
+        self.assertEqual(self.amount(overdue), 3 * fines.FINE_PER_DAY)
+        self.assertEqual(fines.accrue_fines(self.today + timedelta(days=1)), (0, 1))
+        self.assertEqual(self.amount(overdue), 4 * fines.FINE_PER_DAY)
+
+    def test_book_returned_late_between_runs_is_fined_up_to_the_return(self):
+        returned = self.issue(self.today - timedelta(days=3), returned=self.today - timedelta(days=1))
+        self.assertEqual(fines.accrue_fines(self.today), (1, 1))
+        self.assertEqual(self.amount(returned), 2 * fines.FINE_PER_DAY)
+        # frozen at the return date
+        self.assertEqual(fines.accrue_fines(self.today + timedelta(days=5)), (0, 0))
+        self.assertEqual(self.amount(returned), 2 * fines.FINE_PER_DAY)
+
+    def test_on_time_and_not_yet_due_issues_are_not_fined(self):
+        self.issue(self.today - timedelta(days=3), returned=self.today - timedelta(days=3))
+        self.issue(self.today - timedelta(days=3), returned=self.today - timedelta(days=5))
+        self.issue(self.today)
+        self.assertEqual(fines.accrue_fines(self.today), (0, 0))
+        self.assertFalse(Fine.objects.exists())
+
+    def test_paid_fines_stop_growing(self):
+        overdue = self.issue(self.today - timedelta(days=2))
+        fines.accrue_fines(self.today)
+        Fine.objects.filter(issue=overdue).update(paid=True)
+        self.assertEqual(fines.accrue_fines(self.today + timedelta(days=3)), (0, 0))
+        self.assertEqual(self.amount(overdue), 2 * fines.FINE_PER_DAY)
+
+
+class BulkUpdateBooksTests(AdminClientMixin, TestCase):
+    def setUp(self):
+        self.login_admin()
+        self.old, self.new = Category.objects.create(name='Old'), Category.objects.create(name='New')
+        self.book = Book.objects.create(name='Moved', author='Test', isbn='BULK00000001', category=self.old)
+        autocomplete.invalidate()
+        self.addCleanup(autocomplete.invalidate)
+
+    def search(self, category):
+        response = self.client.get(reverse('ajax_search_books'), {'q': 'moved', 'category': category.pk})
+        return [b['pk'] for b in response.json()['books']]
+
+    def move(self):
+        self.client.post(reverse('bulk_update_books'), {'book_ids': [self.book.pk], 'category_id': self.new.pk})
+
+    def test_autocomplete_follows_the_new_category(self):
+        self.assertEqual(self.search(self.old), [self.book.pk])
+        self.move()
+        self.assertEqual(self.search(self.old), [])
+        self.assertEqual(self.search(self.new), [self.book.pk])
+
+    def test_similar_books_of_both_categories_are_refreshed(self):
+        stays = Book.objects.create(name='Stays', author='Test', isbn='BULK00000002', category=self.old)
+        arrived = Book.objects.create(name='Arrived', author='Test', isbn='BULK00000003', category=self.new)
+        self.addCleanup(similar.invalidate_category, self.old.pk)
+        self.addCleanup(similar.invalidate_category, self.new.pk)
+        self.assertEqual(sorted(similar.category_book_ids(self.old.pk)), [self.book.pk, stays.pk])
+        self.assertEqual(list(similar.category_book_ids(self.new.pk)), [arrived.pk])
+        self.move()
+        self.assertEqual(list(similar.category_book_ids(self.old.pk)), [stays.pk])
+        self.assertEqual(sorted(similar.category_book_ids(self.new.pk)), [self.book.pk, arrived.pk])
+
+
+class EditBookTests(AdminClientMixin, TestCase):
+    def test_rating_totals_survive_an_edit(self):
+        self.login_admin()
+        category = Category.objects.create(name='Edited')
+        book = Book.objects.create(name='Rated', author='Test', isbn='EDIT00000001', number_in_stock=2, category=category)
+        Book.objects.adjust_reader_rating(book.pk, 4, 1)
+        is_valid = views.BookForm.is_valid
+
+        def rated_meanwhile(form):
+            # a reader's rating lands after the view loaded the book
+            Book.objects.adjust_reader_rating(book.pk, 5, 1)
+            return is_valid(form)
+
+        with mock.patch.object(views.BookForm, 'is_valid', rated_meanwhile):
+            response = self.client.post(reverse('edit_book', args=[book.pk]), {
+                'name': 'Renamed', 'isbn': book.isbn, 'author': 'Test', 'category': category.pk, 'number_in_stock': 2,
+                'description': '', 'rating': '4.0', 'status': 'available',
+            })
+        self.assertRedirects(response, reverse('view_books'), fetch_redirect_response=False)
+        book.refresh_from_db()
+        self.assertEqual(book.name, 'Renamed')
+        self.assertEqual((book.reader_rating_sum, book.reader_rating_count), (9, 2))
+
+
+class BulkApprovalTests(TestCase):
+    def setUp(self):
+        self.readers = [make_reader(i) for i in range(3)]
+        self.book = Book.objects.create(name='Wanted', author='Test', isbn='APPR00000001', number_in_stock=1)
+
+    def request(self, reader, book=None, **flags):
+        return IssueRequest.objects.create(reader=reader, book=book or self.book, **flags)
+
+    def decide(self, *requests):
+        return {o.request.pk: (o.approved, o.message) for o in approvals.approve_requests([r.pk for r in requests])}
+
+    def test_last_copy_goes_to_the_first_request(self):
+        first, second = self.request(self.readers[0]), self.request(self.readers[1])
+        outcomes = self.decide(first, second)
+
+        self.assertTrue(outcomes[first.pk][0])
+        self.assertEqual(outcomes[second.pk], (False, "No copies of 'Wanted' are available."))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.number_in_stock, 0)
+        issue = Issue.objects.get()
+        self.assertEqual((issue.reader, issue.returned_date), (self.readers[0], None))
+        self.assertTrue(Notification.objects.filter(issue=issue, notification_type='issued').exists())
+        self.assertEqual(BookIssuanceRecord.objects.get(book=self.book).quantity_issued, 1)
+        self.assertEqual(
+            list(IssueRequest.objects.order_by('pk').values_list('approved', 'rejected')),
+            [(True, False), (False, True)],
+        )
+
+    def test_reader_over_the_limit_is_refused(self):
+        reader = self.readers[0]
+        for i in range(circulation.MAX_ISSUED_PER_READER):
+            held = Book.objects.create(name=f'Held {i}', author='Test', isbn=f'APPR1000000{i}', number_in_stock=1)
+            Issue.objects.create(reader=reader, book=held, due_date=date.today())
+        req = self.request(reader)
+        approved, message = self.decide(req)[req.pk]
+        self.assertFalse(approved)
+        self.assertIn(f'limit of {circulation.MAX_ISSUED_PER_READER}', message)
+        self.assertFalse(Issue.objects.filter(book=self.book).exists())
+
+    def test_book_already_held_is_refused(self):
+        self.book.number_in_stock = 2
+        self.book.save()
+        Issue.objects.create(reader=self.readers[0], book=self.book, due_date=date.today())
+        req = self.request(self.readers[0])
+        self.assertEqual(self.decide(req)[req.pk], (False, "Reader 0 already has 'Wanted' issued."))
+
+    def test_decided_requests_are_left_alone(self):
+        approved = self.request(self.readers[0], approved=True)
+        rejected = self.request(self.readers[1], rejected=True)
+        pending = self.request(self.readers[2])
+        self.assertEqual(list(self.decide(approved, rejected, pending)), [pending.pk])
+        self.assertEqual(approvals.reject_requests([approved.pk, rejected.pk]), 0)
+        self.assertEqual(
+            list(IssueRequest.objects.order_by('pk').values_list('approved', 'rejected')),
+            [(True, False), (False, True), (True, False)],
+        )
+        self.assertEqual(Issue.objects.get().reader, self.readers[2])
+
+    def test_reject_requests_notifies_the_readers(self):
+        reqs = [self.request(reader) for reader in self.readers[:2]]
+        self.assertEqual(approvals.reject_requests([r.pk for r in reqs]), 2)
+        self.assertEqual(IssueRequest.objects.filter(rejected=True).count(), 2)
+        self.assertEqual(Notification.objects.filter(notification_type='request_rejected').count(), 2)
+
+
+class IssueImportTests(TestCase):
+    def setUp(self):
+        self.readers = [make_reader(i) for i in range(3)]
+        self.book = Book.objects.create(name='Imported', author='Test', isbn='IMPT00000001', number_in_stock=2)
+        self.held = Book.objects.create(name='Held', author='Test', isbn='IMPT00000002', number_in_stock=5)
+        Issue.objects.create(reader=self.readers[0], book=self.held, due_date=date.today())
+
+    def run_import(self, *rows):
+        lines = ['reader_id,isbn,issued_date,due_date'] + [','.join(row) for row in rows]
+        result = importers.import_issues_csv(io.BytesIO('\n'.join(lines).encode()))
+        if result.report_name:
+            self.addCleanup(job_storage().delete, result.report_name)
+        return result
+
+    def report(self, result):
+        with job_storage().open(result.report_name) as f:
+            return [(int(r[0]), r[3], r[4]) for r in list(csv.reader(io.TextIOWrapper(f, encoding='utf-8')))[1:]]
+
+    def test_valid_rows_are_issued_and_take_stock(self):
+        result = self.run_import(
+            ('R1', 'IMPT00000001', '', '2030-01-15'),
+            ('R2', 'IMPT00000001', '', ''),
+        )
+        self.assertEqual(result, importers.ImportResult(2, 0, 0, None))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.number_in_stock, 0)
+        issues = dict(Issue.objects.filter(book=self.book).values_list('reader__reader_id', 'due_date'))
+        self.assertEqual(issues['R1'], date(2030, 1, 15))
+        self.assertEqual(issues['R2'], circulation.loan_period_due_date(date.today(), False))
+        self.assertEqual(BookIssuanceRecord.objects.get(book=self.book).quantity_issued, 2)
+
+    def test_bad_rows_are_reported(self):
+        result = self.run_import(
+            ('', 'IMPT00000001', '', ''),
+            ('R1', 'IMPT00000001', '15/01/2030', ''),
+            ('NOPE', 'IMPT00000001', '', ''),
+            ('R1', 'NOPE', '', ''),
+            ('R0', 'IMPT00000002', '', ''),
+            ('R1', 'IMPT00000001', '', ''),
+            ('R1', 'IMPT00000001', '', ''),
+            ('R2', 'IMPT00000001', '', ''),
+            ('R0', 'IMPT00000001', '', ''),
+        )
+        self.assertEqual((result.created, result.skipped, result.errors), (2, 3, 4))
+        self.assertEqual(self.report(result), [
+            (2, 'skipped', 'Missing reader_id or isbn'),
+            (3, 'error', 'Dates must be YYYY-MM-DD'),
+            (4, 'error', 'Unknown reader_id'),
+            (5, 'error', 'Unknown isbn'),
+            (6, 'skipped', 'Reader already has this book issued'),
+            (8, 'skipped', 'Reader already has this book issued'),
+            (10, 'error', 'Book is out of stock'),
+        ])
+        self.book.refresh_from_db()
+        self.held.refresh_from_db()
+        self.assertEqual((self.book.number_in_stock, self.held.number_in_stock), (0, 5))
+        self.assertEqual(Issue.objects.filter(reader=self.readers[0], book=self.held).count(), 1)
+
+
+class BookSearchTests(TestCase):
+    def setUp(self):
+        self.assertTrue(search.fts_available())
+        self.gardening = Category.objects.create(name='Gardening')
+        self.books = {
+            key: Book.objects.create(name=name, author=author, isbn=isbn, category=self.gardening if key == 'cat' else None)
+            for key, name, author, isbn in [
+                ('name_prefix', 'Garden Paths', 'Someone', '1000000000001'),
+                ('name_inner', 'The Secret Garden', 'Someone', '1000000000002'),
+                ('author_prefix', 'Flowers', 'Gardener Jones', '1000000000003'),
+                ('author_inner', 'Trees', 'Ann Gardenia', '1000000000004'),
+                ('isbn', 'Rocks', 'Someone', 'GARDEN0000005'),
+                ('cat', 'Soil', 'Someone', '1000000000006'),
+                ('none', 'Unrelated', 'Someone', '1000000000007'),
+            ]
+        }
+
+    def found(self, q, **kwargs):
+        ids = {book.pk: key for key, book in self.books.items()}
+        return [ids[book.pk] for book in search.search_books(Book.objects.all(), q, **kwargs)]
+
+    def fts_ids(self, q):
+        return set(Book.objects.filter(pk__in=search.matching_ids(q)).values_list('pk', flat=True))
+
+    def test_matches_are_ranked_by_where_they_match(self):
+        self.assertEqual(self.found('garden'), ['name_prefix', 'name_inner', 'author_prefix', 'author_inner', 'isbn'])
+        self.assertEqual(self.found('garden', include_category=True)[-1], 'cat')
+
+    def test_short_queries_fall_back_to_icontains(self):
+        self.assertEqual(self.found('ga')[:2], ['name_prefix', 'name_inner'])
+
+    def test_index_follows_book_writes(self):
+        book = self.books['none']
+        self.assertEqual(self.fts_ids('unrelated'), {book.pk})
+        book.name = 'Renamed'
+        book.save()
+        self.assertEqual(self.fts_ids('unrelated'), set())
+        self.assertEqual(self.fts_ids('renamed'), {book.pk})
+        book.delete()
+        self.assertEqual(self.fts_ids('renamed'), set())
+        added = Book.objects.create(name='Brand new', author='Someone', isbn='1000000000008')
+        self.assertEqual(self.fts_ids('brand'), {added.pk})
+
+
+class IssuanceRollupTests(TestCase):
+    def setUp(self):
+        self.book = Book.objects.create(name='Counted', author='Test', isbn='ROLL00000001')
+        self.other = Book.objects.create(name='Also counted', author='Test', isbn='ROLL00000002')
+
+    def table(self, resolution):
+        model, field, _ = analytics.TABLES[resolution]
+        return sorted(model.objects.values_list('book_id', field, 'quantity_issued'))
+
+    def assertTables(self, b, o):
+        self.assertEqual(self.table('day'), [
+            (b, date(2026, 1, 30), 2), (b, date(2026, 2, 2), 1), (b, date(2026, 2, 3), 1), (o, date(2026, 1, 30), 1),
+        ])
+        self.assertEqual(self.table('week'), [(b, date(2026, 1, 26), 2), (b, date(2026, 2, 2), 2), (o, date(2026, 1, 26), 1)])
+        self.assertEqual(self.table('month'), [(b, date(2026, 1, 1), 2), (b, date(2026, 2, 1), 2), (o, date(2026, 1, 1), 1)])
+
+    def test_each_issuance_is_added_to_its_day_week_and_month(self):
+        analytics.record_issuances({self.book.pk: 2, self.other.pk: 1}, date(2026, 1, 30))
+        analytics.record_issuances({self.book.pk: 1}, date(2026, 2, 2))
+        analytics.record_issuances({self.book.pk: 1}, date(2026, 2, 3))
+        self.assertTables(self.book.pk, self.other.pk)
+
+    def test_rebuild_from_issues(self):
+        readers = iter(make_reader(i) for i in range(5))
+        for book, issued in [(self.book, date(2026, 1, 30)), (self.book, date(2026, 1, 30)), (self.other, date(2026, 1, 30)),
+                             (self.book, date(2026, 2, 2)), (self.book, date(2026, 2, 3))]:
+            issue = Issue.objects.create(reader=next(readers), book=book, due_date=issued + timedelta(days=14))
+            Issue.objects.filter(pk=issue.pk).update(issued_date=issued)
+        analytics.rebuild_from_issues()
+        self.assertTables(self.book.pk, self.other.pk)
+
+        # a partial rebuild recomputes the range and the weeks and months around it, nothing else
+        for model, _, _ in analytics.TABLES.values():
+            model.objects.update(quantity_issued=99)
+        analytics.rebuild_from_issues(start=date(2026, 2, 2), end=date(2026, 2, 3))
+        self.assertEqual(self.table('day')[0], (self.book.pk, date(2026, 1, 30), 99))
+        self.assertEqual(self.table('week')[1:], [(self.book.pk, date(2026, 2, 2), 2), (self.other.pk, date(2026, 1, 26), 99)])
+        self.assertEqual(self.table('month')[:2], [(self.book.pk, date(2026, 1, 1), 99), (self.book.pk, date(2026, 2, 1), 2)])
+
+    def test_resolution_keeps_series_within_max_points(self):
+        most = analytics.ANALYTICS_MAX_POINTS
+        self.assertEqual([analytics.pick_resolution(days) for days in (1, most, most + 1, most * 7, most * 7 + 1)],
+                         ['day', 'day', 'week', 'week', 'month'])
+        for days in (30, most, most + 1, 365, most * 7, most * 7 + 1, analytics.ANALYTICS_MAX_DAYS):
+            periods, counts, _ = analytics.issuance_series(self.book, days, end_date=date(2026, 2, 3))
+            # the window holds days + 1 dates, and its first and last periods may be partial
+            self.assertLessEqual(len(periods), most + 2, days)
+            self.assertEqual(len(periods), len(counts))
+
+    def test_weekly_series_reads_the_week_rollup(self):
+        analytics.record_issuances({self.book.pk: 2}, date(2026, 1, 30))
+        analytics.record_issuances({self.book.pk: 1}, date(2026, 2, 2))
+        analytics.record_issuances({self.book.pk: 1}, date(2026, 2, 3))
+        with self.assertNumQueries(1):
+            periods, counts, resolution = analytics.issuance_series(self.book, 10, 'week', end_date=date(2026, 2, 3))
+        self.assertEqual(resolution, 'week')
+        self.assertEqual(periods.tolist(), [date(2026, 1, 19), date(2026, 1, 26), date(2026, 2, 2)])
+        self.assertEqual(counts.tolist(), [0, 2, 2])
@@ -77,9 +77,15 @@ urlpatterns=[
     path('ajax/search-books/', views.ajax_search_books, name='ajax_search_books'),
     #analytics
     path('books/<int:pk>/analytics/', views.book_analytics_api, name='book_analytics_api'),
+    path('admin/analytics/', views.library_analytics_api, name='library_analytics_api'),
     
     # export functionality
     path('issues/export/', views.export_issues, name='export_issues'),
     path('fines/export/', views.export_fines, name='export_fines'),
     path('readers/export/', views.export_readers, name='export_readers'),
+
+    # background imports and exports
+    path('jobs/<int:pk>/', views.job_detail, name='job_detail'),
+    path('jobs/<int:pk>/status/', views.job_status, name='job_status'),
+    path('jobs/<int:pk>/download/', views.job_download, name='job_download'),
 ]
\ No newline at end of file
@@ -1,39 +1,42 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, JsonResponse
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from .forms import BookForm,ReaderForm,IssueForm,ReaderRegisterForm
-from .models import Book,Reader,Issue,Fine,IssueRequest,Admin,Category,Notification,BookIssuanceRecord, BookRating
-from django.db.models import Q, Count, Avg, Case, When, Value, F, IntegerField
+from .models import Book,Reader,Issue,Fine,IssueRequest,Admin,Category,Notification, BookRating, Job
+from django.db.models import Q
 from django.utils import timezone
 from django.utils.timezone import now
 from django.contrib.auth.hashers import make_password, check_password
 from datetime import timedelta,date
+from decimal import Decimal
 from django.contrib import messages
 from django.urls import reverse
-import pandas as pd
-from django.shortcuts import render, redirect
-from django.contrib import messages
 from django.db import transaction
 from .forms import UploadExcelForm
-from .models import Book, Category
+from .search import search_books
+from . import analytics, approvals, autocomplete, circulation, dashboard, exports, jobs, popularity, similar
+from .analytics import get_book_analytics_data
+from .popularity import get_popular_books
+from .similar import get_similar_books
+from .notifications import create_issue_notification
+import base64
+import hashlib
 import json
-import csv
-import io
-import random
 from functools import wraps
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+MAX_ISSUED_PER_READER = circulation.MAX_ISSUED_PER_READER
+
+# XLSX/PDF exports with more rows than this run as background jobs (see lib/jobs.py)
+EXPORT_BACKGROUND_ROWS = getattr(settings, 'EXPORT_BACKGROUND_ROWS', 5000)
 
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet
-    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
 
-# maximum number of books a reader can have at once (including pending requests)
-MAX_ISSUED_PER_READER = getattr(settings, 'MAX_ISSUED_PER_READER', 5)
+# Keyset (cursor) pagination for large listings; enabled per request with ?mode=keyset
+KEYSET_PAGINATION = getattr(settings, 'KEYSET_PAGINATION', False)
+KEYSET_COUNT_CACHE_SECONDS = getattr(settings, 'KEYSET_COUNT_CACHE_SECONDS', 60)
 
 
 def paginate_queryset(request, queryset, per_page=20):
@@ -44,10 +47,117 @@ def paginate_queryset(request, queryset, per_page=20):
 
 def pagination_querystring(request):
     params = request.GET.copy()
-    params.pop('page', None)
+    for key in ('page', 'after', 'before'):
+        params.pop(key, None)
     return params.urlencode()
 
 
+def use_keyset_pagination(request):
+    if 'after' in request.GET or 'before' in request.GET:
+        return True
+    return request.GET.get('mode', 'keyset' if KEYSET_PAGINATION else '') == 'keyset'
+
+
+class KeysetPage:
+    """One page of a keyset-paginated queryset, usable like a Paginator page in templates."""
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor, approximate_count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.approximate_count = approximate_count
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+
+def _encode_cursor(obj, fields):
+    values = [str(getattr(obj, f.lstrip('-'))) for f in fields]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor, model, fields):
+    """The cursor's values converted by each ordering field, or None (first page) if it is not valid."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(fields):
+        return None
+    try:
+        return [model._meta.get_field(f.lstrip('-')).to_python(value) for f, value in zip(fields, values)]
+    except (ValidationError, TypeError):
+        return None
+
+
+def _keyset_filter(fields, values, forward):
+    """Q selecting rows strictly after (or before) `values` in the `fields` ordering."""
+    condition = Q()
+    for i in reversed(range(len(fields))):
+        name = fields[i].lstrip('-')
+        descending = fields[i].startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        if i < len(fields) - 1:
+            step |= Q(**{name: values[i]}) & condition
+        condition = step
+    return condition
+
+
+def keyset_paginate(request, queryset, ordering, per_page=20, with_count=False):
+    """Paginate by the values of `ordering` (which must end with a unique column such as 'id').
+
+    Reads ?after=/?before= cursors instead of ?page=, so deep pages cost the same as the
+    first one and no COUNT(*) is issued.  With `with_count` (or ?count=1) an approximate
+    total, cached for KEYSET_COUNT_CACHE_SECONDS, is attached to the page.
+    """
+    after = _decode_cursor(request.GET['after'], queryset.model, ordering) if request.GET.get('after') else None
+    before = _decode_cursor(request.GET['before'], queryset.model, ordering) if request.GET.get('before') else None
+
+    if before is not None:
+        reverse_ordering = [f[1:] if f.startswith('-') else '-' + f for f in ordering]
+        rows = list(queryset.filter(_keyset_filter(ordering, before, False)).order_by(*reverse_ordering)[:per_page + 1])
+        has_more_before = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        previous_cursor = _encode_cursor(rows[0], ordering) if has_more_before else None
+        next_cursor = _encode_cursor(rows[-1], ordering) if rows else None
+    else:
+        page_qs = queryset.order_by(*ordering)
+        if after is not None:
+            page_qs = page_qs.filter(_keyset_filter(ordering, after, True))
+        rows = list(page_qs[:per_page + 1])
+        has_more_after = len(rows) > per_page
+        rows = rows[:per_page]
+        next_cursor = _encode_cursor(rows[-1], ordering) if has_more_after else None
+        previous_cursor = _encode_cursor(rows[0], ordering) if after is not None and rows else None
+
+    approximate_count = None
+    if with_count or request.GET.get('count'):
+        count_key = 'lib:keyset_count:' + hashlib.md5(str(queryset.query).encode()).hexdigest()
+        approximate_count = cache.get(count_key)
+        if approximate_count is None:
+            approximate_count = queryset.count()
+            cache.set(count_key, approximate_count, KEYSET_COUNT_CACHE_SECONDS)
+    return KeysetPage(rows, next_cursor, previous_cursor, approximate_count)
+
+
+def paginate_listing(request, queryset, ordering, per_page=20):
+    """Paginate with keyset cursors when requested, otherwise with page numbers."""
+    if use_keyset_pagination(request):
+        return keyset_paginate(request, queryset, ordering, per_page)
+    return paginate_queryset(request, queryset.order_by(*ordering), per_page)
+
+
 def admin_login_required(view_func):
     @wraps(view_func)
     def _wrapped(request, *args, **kwargs):
@@ -117,27 +227,10 @@ def public_books(request):
     q = request.GET.get('q', '').strip()
     category_id = request.GET.get('category', '').strip()
 
-    books = Book.objects.all()
+    books = Book.objects.select_related('category')
     if q:
-        # Search across name, author, ISBN only (NOT category)
-        books = books.filter(
-            Q(name__icontains=q) |
-            Q(author__icontains=q) |
-            Q(isbn__icontains=q)
-        ).annotate(
-            # Prioritize: book name that starts with query first (so "A" shows "Atomic Habits" before others),
-            # then name contains, then author, ISBN.
-            match_priority=Case(
-                When(name__istartswith=q, then=Value(0)),
-                When(name__icontains=q, then=Value(1)),
-                When(author__istartswith=q, then=Value(2)),
-                When(author__icontains=q, then=Value(3)),
-                When(isbn__istartswith=q, then=Value(4)),
-                When(isbn__icontains=q, then=Value(5)),
-                default=Value(6),
-                output_field=IntegerField()
-            )
-        ).order_by('match_priority', 'name')
+        # Search across name, author, ISBN only (NOT category), ranked by match priority
+        books = search_books(books, q)
     else:
         books = books.order_by('name')  # sorted alphabetically
     
@@ -180,7 +273,10 @@ def edit_book(request, pk):
     if request.method == 'POST':
         form = BookForm(request.POST, request.FILES, instance=book)
         if form.is_valid():
-            form.save()
+            book = form.save(commit=False)
+            # only the form's columns: a full save would write back reader rating totals
+            # read before the post and undo rate_book increments made since
+            book.save(update_fields=form.Meta.fields)
             return redirect('view_books')
     else:
         form = BookForm(instance=book)
@@ -201,17 +297,14 @@ def view_books(request):
     """
     Display all books in the library with advanced filters.
     """
-    books = Book.objects.select_related('category').all()
+    books = Book.objects.select_related('category')
     q = request.GET.get('q', '').strip()
     category_id = request.GET.get('category', '').strip()
 
     if q:
-        books = books.filter(
-            Q(name__icontains=q) |
-            Q(author__icontains=q) |
-            Q(isbn__icontains=q) |
-            Q(category__name__icontains=q)
-        )
+        books = search_books(books, q, include_category=True)
+    else:
+        books = books.order_by('name')
     if category_id:
         try:
             cid = int(category_id)
@@ -219,7 +312,6 @@ def view_books(request):
         except ValueError:
             pass
 
-    books = books.order_by('name')
     page_obj = paginate_queryset(request, books, 20)
     context = {
         'books': page_obj,
@@ -301,8 +393,8 @@ def add_reader(request):
     return render(request, 'add_reader.html', {'form': form})
 
 def view_readers(request):
-    readers = Reader.objects.all().order_by('name')
-    page_obj = paginate_queryset(request, readers, 20)
+    readers = Reader.objects.all()
+    page_obj = paginate_listing(request, readers, ['name', 'id'], 20)
     return render(request, 'view_readers.html', {
         'readers': page_obj,
         'page_obj': page_obj,
@@ -383,14 +475,16 @@ def issue_book(request):
 
                 # proceed if no due_date errors
                 if not form.errors:
-                    if issue.book.number_in_stock > 0:
-                        issue.book.number_in_stock -= 1
-                        issue.book.save()
-                        issue.save()
+                    try:
+                        issued = circulation.issue_copy(issue.reader, issue.book, issue.issued_date, issue.due_date)
+                    except circulation.OutOfStock:
+                        form.add_error('book', 'This book is out of stock!')
+                    except circulation.AlreadyIssued as e:
+                        form.add_error('book', str(e))
+                    else:
+                        record_book_issuance(issued.book, issued_date=issued.issued_date)
                         messages.success(request, f"'{issue.book.name}' issued to {issue.reader.name}.")
                         return redirect('view_issues')
-                    else:
-                        form.add_error('book', 'This book is out of stock!')
     else:
         form = IssueForm()
 
@@ -400,8 +494,8 @@ def issue_book(request):
 
 @admin_login_required
 def view_issues(request):
-    issues = Issue.objects.all().order_by('-issued_date')  # latest first
-    page_obj = paginate_queryset(request, issues, 20)
+    issues = Issue.objects.select_related('reader', 'book')
+    page_obj = paginate_listing(request, issues, ['-issued_date', '-id'], 20)  # latest first
     today = timezone.now().date()
     for issue in page_obj:
         issue.is_overdue = (not issue.returned_date) and issue.due_date and issue.due_date < today
@@ -416,11 +510,8 @@ def return_book(request, pk):
     issue = get_object_or_404(Issue, pk=pk)
     
     if request.method == 'POST':
-        if not issue.returned_date:  # only if not already returned
-            issue.returned_date = timezone.now().date()
-            issue.book.number_in_stock += 1  # increase book stock
-            issue.book.save()
-            issue.save()
+        # closes the issue and restocks the book only if it is not already returned
+        circulation.return_issue(issue, timezone.now().date())
         return redirect('view_issues')
     
     return render(request, 'return_book.html', {'issue': issue})
@@ -438,8 +529,8 @@ def overdue_books(request):
 ### for fines
 @admin_login_required
 def view_fines(request):
-    fines = Fine.objects.select_related('issue__reader', 'issue__book').all().order_by('-calculated_date')
-    page_obj = paginate_queryset(request, fines, 20)
+    fines = Fine.objects.select_related('issue__reader', 'issue__book').all()
+    page_obj = paginate_listing(request, fines, ['-calculated_date', '-id'], 20)
     return render(request, 'view_fines.html', {
         'fines': page_obj,
         'page_obj': page_obj,
@@ -548,19 +639,8 @@ def reader_dashboard(request):
     # All books issued to this reader
     issues = reader.issues.all().order_by('-issued_date')  # uses related_name='issues'
 
-    # Calculate fines for overdue books if not already created
-    today = timezone.now().date()
-    for issue in issues:
-        if not issue.returned_date and issue.due_date < today:
-            # Create fine if it doesn't exist
-            fine, created = Fine.objects.get_or_create(issue=issue, defaults={
-                'amount': (today - issue.due_date).days * 2  # example: $2 per overdue day
-            })
-    
-    # Check and create notifications for due soon and overdue books
-    check_and_create_due_soon_notifications()
-    check_and_create_overdue_notifications()
-    
+    # Fines and due-soon/overdue notifications are produced by the `accrue_fines` and
+    # `send_due_notifications` cron commands; the dashboard only reads them.
     fines = Fine.objects.filter(issue__reader=reader, paid=False)
     unread_notif_count = reader.notifications.filter(read=False).count()
 
@@ -621,14 +701,11 @@ def reader_view_books(request):
     q = request.GET.get('q', '').strip()
     category_id = request.GET.get('category', '').strip()
 
-    books = Book.objects.select_related('category').all()
+    books = Book.objects.select_related('category')
     if q:
-        books = books.filter(
-            Q(name__icontains=q) |
-            Q(author__icontains=q) |
-            Q(isbn__icontains=q) |
-            Q(category__name__icontains=q)
-        )
+        books = search_books(books, q, include_category=True)
+    else:
+        books = books.order_by('name')
     if category_id:
         try:
             cid = int(category_id)
@@ -636,7 +713,6 @@ def reader_view_books(request):
         except ValueError:
             pass
 
-    books = books.order_by('name')
     page_obj = paginate_queryset(request, books, 20)
     return render(request, 'books.html', {
         'books': page_obj,
@@ -656,14 +732,9 @@ def reader_book_detail(request, pk):
     analytics = get_book_analytics_data(book, days=90)
     popular_books = get_popular_books(limit=4, exclude_book_id=pk)
     similar_books = get_similar_books(book, limit=4)
-    # compute average rating given by readers
-    avg_reader_rating = BookRating.objects.filter(book=book).aggregate(avg=Avg('rating'))['avg']
-    if avg_reader_rating is None:
-        avg_reader_rating = float(book.rating)
-    else:
-        avg_reader_rating = float(avg_reader_rating)
-
-    combined_rating = round((float(book.rating) + avg_reader_rating) / 2.0, 1)
+    # average rating given by readers (kept as running totals on the book row)
+    avg_reader_rating = book.avg_reader_rating()
+    combined_rating = book.combined_rating()
 
     # current user's rating (if logged in)
     user_rating = None
@@ -707,15 +778,24 @@ def rate_book(request, pk):
     if rating < 1 or rating > 5:
         return JsonResponse({'error': 'rating out of range (1-5)'}, status=400)
 
-    br, created = BookRating.objects.update_or_create(
-        book=book,
-        reader=reader,
-        defaults={'rating': rating}
-    )
+    rating = Decimal(str(rating)).quantize(Decimal('0.1'))
 
-    avg_reader = BookRating.objects.filter(book=book).aggregate(avg=Avg('rating'))['avg'] or float(book.rating)
-    avg_reader = float(avg_reader)
-    combined = round((float(book.rating) + avg_reader) / 2.0, 1)
+    # Update the rating and the book's running totals together
+    with transaction.atomic():
+        br = BookRating.objects.select_for_update().filter(book=book, reader=reader).first()
+        if br is None:
+            br = BookRating.objects.create(book=book, reader=reader, rating=rating)
+            Book.objects.adjust_reader_rating(book.pk, rating, 1)
+        else:
+            delta = rating - br.rating
+            br.rating = rating
+            br.save(update_fields=['rating', 'updated_at'])
+            Book.objects.adjust_reader_rating(book.pk, delta, 0)
+
+    book.refresh_from_db(fields=['reader_rating_sum', 'reader_rating_count'])
+    popularity.update_book(book)
+    avg_reader = book.avg_reader_rating()
+    combined = book.combined_rating()
 
     return JsonResponse({
         'combined_rating': combined,
@@ -764,8 +844,8 @@ def reader_issued_books(request):
         return redirect('login_reader')
 
     reader = Reader.objects.get(id=reader_id)
-    issued_books = Issue.objects.filter(reader=reader).order_by('-issued_date')
-    page_obj = paginate_queryset(request, issued_books, 20)
+    issued_books = Issue.objects.filter(reader=reader).select_related('book')
+    page_obj = paginate_listing(request, issued_books, ['-issued_date', '-id'], 20)
 
     return render(request, 'reader_issued_books.html', {
         'reader': reader,
@@ -820,14 +900,15 @@ def login_admin(request):
 @admin_login_required
 def admin_dashboard(request):
     admin = request.admin_user
-    total_books = Book.objects.count()
-    total_readers = Reader.objects.count()
-    low_stock_books = Book.objects.filter(number_in_stock__lte=1).order_by('number_in_stock', 'name')[:8]
+    # counters come from the DashboardStats row (lib/dashboard.py); low stock from book_low_stock_idx
+    stats = dashboard.get_stats()
+    low_stock_books = (
+        Book.objects.filter(number_in_stock__lte=1).select_related('category').order_by('number_in_stock', 'name')[:8]
+    )
 
     return render(request, 'admin_dashboard.html', {
         'admin': admin,
-        'total_books': total_books,
-        'total_readers': total_readers,
+        'stats': stats,
         'low_stock_books': low_stock_books,
     })
 
@@ -946,19 +1027,16 @@ def approve_request(request, request_id):
     #  Approve request and issue the book
     # compute due_date depending on whether the reader is a staff member
     issued_date = date.today()
-    if getattr(reader, 'is_staff_member', False):
-        due = issued_date + timedelta(days=182)  # ~6 months
-    else:
-        due = issued_date + timedelta(days=14)
+    due = circulation.loan_period_due_date(issued_date, reader.is_staff_member)
 
-    issue = Issue.objects.create(
-        reader=reader,
-        book=book,
-        issued_date=issued_date,
-        due_date=due
-    )
-    book.number_in_stock -= 1
-    book.save()
+    try:
+        issue = circulation.issue_copy(reader, book, issued_date=issued_date, due_date=due)
+    except circulation.CirculationError as e:
+        # lost a race for the last copy, or the same book was issued meanwhile
+        messages.error(request, str(e))
+        req.rejected = True
+        req.save()
+        return redirect('admin_issue_requests')
 
     # Create a notification for the issued book
     create_issue_notification(issue)
@@ -1069,15 +1147,22 @@ def bulk_update_requests(request):
         messages.error(request, 'Please select at least one request and an action.')
         return redirect('admin_issue_requests')
 
-    for rid in ids:
+    ids = [rid for rid in ids if rid.isdigit()]
+    if action == 'approve':
         try:
-            rid_int = int(rid)
-        except (TypeError, ValueError):
-            continue
-        if action == 'approve':
-            approve_request(request, rid_int)
-        else:
-            reject_request(request, rid_int)
+            outcomes = approvals.approve_requests(ids)
+        except circulation.CirculationError as e:
+            messages.error(request, str(e))
+            return redirect('admin_issue_requests')
+        approved = sum(1 for outcome in outcomes if outcome.approved)
+        if approved:
+            messages.success(request, f"Approved {approved} request(s).")
+        for outcome in outcomes:
+            if not outcome.approved:
+                messages.error(request, outcome.message)
+    else:
+        rejected = approvals.reject_requests(ids)
+        messages.success(request, f"Rejected {rejected} request(s).")
 
     return redirect('admin_issue_requests')
 
@@ -1109,7 +1194,13 @@ def bulk_update_books(request):
         updates['status'] = status
 
     if updates:
-        qs.update(**updates)
+        old_category_ids = set(qs.values_list('category_id', flat=True)) if 'category' in updates else set()
+        qs.update(**updates, updated_at=timezone.now())
+        if 'category' in updates:
+            # update() skips the Book signals that keep the autocomplete index and similar-book ids current
+            autocomplete.invalidate()
+            for affected in old_category_ids | {updates['category'].pk}:
+                similar.invalidate_category(affected)
         messages.success(request, f'Updated {qs.count()} book(s).')
     else:
         messages.info(request, 'Nothing to update; category/status left unchanged.')
@@ -1130,101 +1221,12 @@ def import_issues(request):
                      as the single-issue form: staff ~6 months, others 14 days.
     """
     if request.method == 'POST' and request.FILES.get('file'):
-        uploaded = request.FILES['file']
-        try:
-            raw = uploaded.read()
-            try:
-                text = raw.decode('utf-8-sig')
-            except AttributeError:
-                text = raw
-            reader_csv = csv.DictReader(io.StringIO(text))
-            created = 0
-            skipped = 0
-            errors = 0
-
-            for row in reader_csv:
-                try:
-                    reader_code = (row.get('reader_id') or '').strip()
-                    isbn = (row.get('isbn') or '').strip()
-                    issued_str = (row.get('issued_date') or '').strip()
-                    due_str = (row.get('due_date') or '').strip()
-
-                    if not reader_code or not isbn:
-                        skipped += 1
-                        continue
-
-                    # Look up reader and book
-                    try:
-                        reader = Reader.objects.get(reader_id=reader_code)
-                    except Reader.DoesNotExist:
-                        errors += 1
-                        continue
-                    try:
-                        book = Book.objects.get(isbn=isbn)
-                    except Book.DoesNotExist:
-                        errors += 1
-                        continue
-
-                    # Prevent duplicate active issue
-                    if Issue.objects.filter(reader=reader, book=book, returned_date__isnull=True).exists():
-                        skipped += 1
-                        continue
-
-                    # Check stock
-                    if book.number_in_stock <= 0:
-                        errors += 1
-                        continue
-
-                    # Dates
-                    issued_date = None
-                    if issued_str:
-                        try:
-                            issued_date = date.fromisoformat(issued_str)
-                        except ValueError:
-                            errors += 1
-                            continue
-                    else:
-                        issued_date = date.today()
-
-                    if due_str:
-                        try:
-                            due_date = date.fromisoformat(due_str)
-                        except ValueError:
-                            errors += 1
-                            continue
-                    else:
-                        if getattr(reader, 'is_staff_member', False):
-                            due_date = issued_date + timedelta(days=182)
-                        else:
-                            due_date = issued_date + timedelta(days=14)
-
-                    Issue.objects.create(
-                        reader=reader,
-                        book=book,
-                        issued_date=issued_date,
-                        due_date=due_date
-                    )
-                    book.number_in_stock -= 1
-                    book.save()
-                    created += 1
-                except Exception:
-                    errors += 1
-                    continue
-
-            if created:
-                messages.success(request, f'Imported {created} issue(s) from CSV.')
-            if skipped:
-                messages.info(request, f'Skipped {skipped} row(s) (duplicates or missing required fields).')
-            if errors:
-                messages.error(request, f'{errors} row(s) failed due to invalid data.')
-
-        except Exception as e:
-            messages.error(request, f'Failed to import issues CSV: {e}')
-
-        return redirect('view_issues')
+        job = jobs.enqueue('import_issues', input_file=request.FILES['file'], created_by=request.admin_user)
+        return redirect('job_detail', pk=job.pk)
 
     return render(request, 'issue_book.html', {'form': IssueForm()})
 
+
 ### Searching books
 
 
@@ -1236,36 +1238,19 @@ def ajax_search_books(request):
     except (ValueError, TypeError):
         limit = 8
 
-    books = Book.objects.all()
-    # Search across book name, author, and ISBN only (NOT category)
-    if query:
-        books = books.filter(
-            Q(name__icontains=query) |
-            Q(author__icontains=query) |
-            Q(isbn__icontains=query)
-        ).annotate(
-            # Prioritize: book name starts with query (0) > name contains (1) >
-            # author starts with (2) > author contains (3) > ISBN
-            match_priority=Case(
-                When(name__istartswith=query, then=Value(0)),
-                When(name__icontains=query, then=Value(1)),
-                When(author__istartswith=query, then=Value(2)),
-                When(author__icontains=query, then=Value(3)),
-                When(isbn__istartswith=query, then=Value(4)),
-                When(isbn__icontains=query, then=Value(5)),
-                default=Value(6),
-                output_field=IntegerField()
-            )
-        ).order_by('match_priority', 'name')
-    else:
-        books = books.order_by('name')
-    
     # Category filter (separate from search - for filtering only)
-    if category_id:
-        books = books.filter(category_id=category_id)
-
-    # Apply limit for performance
-    books = books[:limit]
+    try:
+        category_id = int(category_id) if category_id else None
+    except ValueError:
+        category_id = None
+
+    # Search across book name, author, and ISBN only (NOT category) using the in-memory
+    # autocomplete index; it ranks book name starts with query (0) > name contains (1) >
+    # author starts with (2) > author contains (3) > ISBN, and only the top `limit`
+    # books are loaded from the database.
+    pks = autocomplete.get_index().query(query, limit=limit, category_id=category_id)
+    found = Book.objects.select_related('category').in_bulk(pks)
+    books = [found[pk] for pk in pks if pk in found]
 
     data = []
     for book in books:
@@ -1277,16 +1262,9 @@ def ajax_search_books(request):
         else:
             url = reverse('book_details', args=[book.pk])  # public/detail view for anonymous users
 
-        # Debug print
-        print(f"User: {request.user}, is_staff: {getattr(request.user, 'is_staff', False)}, Book URL: {url}")
-
-        # compute reader average and combined rating for this book
-        try:
-            avg_reader = BookRating.objects.filter(book=book).aggregate(avg=Avg('rating'))['avg'] or float(book.rating)
-            avg_reader = float(avg_reader)
-        except Exception:
-            avg_reader = float(book.rating)
-        combined = round((float(book.rating) + avg_reader) / 2.0, 1)
+        # reader average and combined rating are arithmetic on the book's running totals
+        avg_reader = book.avg_reader_rating()
+        combined = book.combined_rating()
         # include a short description snippet if available
         desc = ''
         try:
@@ -1318,63 +1296,6 @@ def ajax_search_books(request):
 
 ### Notification system
 
-def create_issue_notification(issue):
-    """Create a notification when a book is issued to a reader."""
-    Notification.objects.create(
-        reader=issue.reader,
-        issue=issue,
-        notification_type='issued',
-        title=f"Book Issued: {issue.book.name}",
-        message=f"You have been issued '{issue.book.name}' by {issue.book.author}. Due date: {issue.due_date}"
-    )
-
-
-def check_and_create_due_soon_notifications():
-    """Create notifications for books due in 2 days. Call this periodically (e.g., via cron/celery)."""
-    today = timezone.now().date()
-    target_date = today + timedelta(days=2)
-    
-    # Find issues that are due in 2 days and not yet notified
-    issues = Issue.objects.filter(
-        due_date=target_date,
-        returned_date__isnull=True
-    ).select_related('reader', 'book')
-    
-    for issue in issues:
-        # Check if notification already exists for this issue
-        if not Notification.objects.filter(issue=issue, notification_type='due_soon').exists():
-            Notification.objects.create(
-                reader=issue.reader,
-                issue=issue,
-                notification_type='due_soon',
-                title=f"Due Soon: {issue.book.name}",
-                message=f"'{issue.book.name}' is due on {issue.due_date}. Please return it on time to avoid fines."
-            )
-
-
-def check_and_create_overdue_notifications():
-    """Create notifications for overdue books. Call this periodically (e.g., via cron/celery)."""
-    today = timezone.now().date()
-    
-    # Find overdue issues (not returned and due date passed) and not yet notified
-    overdue_issues = Issue.objects.filter(
-        due_date__lt=today,
-        returned_date__isnull=True
-    ).select_related('reader', 'book')
-    
-    for issue in overdue_issues:
-        # Check if notification already exists for this issue
-        if not Notification.objects.filter(issue=issue, notification_type='overdue').exists():
-            days_overdue = (today - issue.due_date).days
-            Notification.objects.create(
-                reader=issue.reader,
-                issue=issue,
-                notification_type='overdue',
-                title=f"Overdue: {issue.book.name}",
-                message=f"'{issue.book.name}' is {days_overdue} day(s) overdue. Please return it immediately to avoid additional fines."
-            )
-
-
 def reader_notifications(request):
     """Display all notifications for the logged-in reader."""
     reader_id = request.session.get('reader_id')
@@ -1416,43 +1337,18 @@ def mark_all_notifications_read(request):
 ### Analytics
 
 def record_book_issuance(book, issued_date=None):
-    """Record a book issuance in the analytics."""
+    """Record a book issuance in the analytics (daily counter and weekly/monthly rollups)."""
     if issued_date is None:
         issued_date = date.today()
-    
-    record, created = BookIssuanceRecord.objects.get_or_create(
-        book=book,
-        date=issued_date,
-        defaults={'quantity_issued': 0}
-    )
-    record.quantity_issued += 1
-    record.save()
-
-
-def get_book_analytics_data(book, days=90):
-    """Get analytics data for a book over the last N days."""
-    end_date = date.today()
-    start_date = end_date - timedelta(days=days)
-    
-    records = BookIssuanceRecord.objects.filter(
-        book=book,
-        date__gte=start_date,
-        date__lte=end_date
-    ).order_by('date')
-    
-    dates = [str(r.date) for r in records]
-    quantities = [r.quantity_issued for r in records]
-    
-    return {
-        'dates': dates,
-        'quantities': quantities,
-        'total_issued': sum(quantities),
-        'avg_per_day': sum(quantities) / max(len(records), 1) if records else 0,
-    }
+    analytics.record_issuance(book.pk, issued_date)
 
 
 def book_analytics_api(request, pk):
-    """API endpoint to return analytics data as JSON."""
+    """API endpoint to return analytics data as JSON.
+
+    ?days= sets the window; ?resolution=day|week|month picks the series granularity, by default
+    the finest that keeps the series short (see lib/analytics.py).
+    """
     book = get_object_or_404(Book, pk=pk)
     days = request.GET.get('days', 90)
     
@@ -1460,99 +1356,41 @@ def book_analytics_api(request, pk):
         days = int(days)
     except (ValueError, TypeError):
         days = 90
-    
-    data = get_book_analytics_data(book, days=days)
+
+    resolution = request.GET.get('resolution') or None
+    if resolution is not None and resolution not in analytics.RESOLUTIONS:
+        return JsonResponse({'error': f"resolution must be one of {', '.join(analytics.RESOLUTIONS)}"}, status=400)
+
+    data = get_book_analytics_data(book, days=days, resolution=resolution)
     return JsonResponse(data)
 
 
-def get_popular_books(limit=4, exclude_book_id=None):
-    """Get random popular books with combined rating >= 4.5."""
-    # Get all books and calculate combined rating for each
-    all_books = Book.objects.all()
-    
-    if exclude_book_id:
-        all_books = all_books.exclude(pk=exclude_book_id)
-    
-    # Filter books by combined rating >= 4.5
-    popular = []
-    for book in all_books:
-        if book.combined_rating() >= 4.5:
-            popular.append(book)
-    
-    # Shuffle randomly and return limited results
-    import random
-    random.shuffle(popular)
-    return popular[:limit]
-
-
-def get_similar_books(book, limit=4):
-    """Get random books from the same category."""
-    books = Book.objects.filter(
-        category=book.category
-    ).exclude(
-        pk=book.pk
-    ).order_by('?')[:limit]
-    return books
+@admin_login_required
+def library_analytics_api(request):
+    """Library-wide circulation for the admin dashboard as JSON, computed once a day.
+
+    Takes the same ?days= and ?resolution= as book_analytics_api.
+    """
+    try:
+        days = int(request.GET.get('days', 90))
+    except (ValueError, TypeError):
+        days = 90
+    days = min(max(days, 1), analytics.ANALYTICS_MAX_DAYS)
+
+    resolution = request.GET.get('resolution') or None
+    if resolution is not None and resolution not in analytics.RESOLUTIONS:
+        return JsonResponse({'error': f"resolution must be one of {', '.join(analytics.RESOLUTIONS)}"}, status=400)
+
+    return JsonResponse(analytics.get_library_analytics(days, resolution))
+
+
 @admin_login_required
 def import_books(request):
     if request.method == "POST":
         form = UploadExcelForm(request.POST, request.FILES)
         if form.is_valid():
-            excel_file = request.FILES['excel_file']
-
-            try:
-                df = pd.read_excel(excel_file)
-            except Exception as e:
-                messages.error(request, f"Error reading Excel: {e}")
-                return redirect("import_books")
-
-            required_columns = [
-                "name",
-                "isbn",
-                "author",
-                "category",
-                "number_in_stock",
-                "description",
-                "rating",
-                "status",
-            ]
-
-            missing = [c for c in required_columns if c not in df.columns]
-            if missing:
-                messages.error(request, f"Missing required columns: {', '.join(missing)}")
-                return redirect("import_books")
-
-            created = 0
-            updated = 0
-
-            with transaction.atomic():
-                for idx, row in df.iterrows():
-
-                    category_name = row.get("category")
-                    category_obj = None
-                    if category_name and str(category_name).strip():
-                        category_obj, _ = Category.objects.get_or_create(
-                            name=str(category_name).strip()
-                        )
-
-                    book, was_created = Book.objects.update_or_create(
-                        isbn=str(row["isbn"]).strip(),
-                        defaults={
-                            "name": row["name"],
-                            "author": row["author"],
-                            "category": category_obj,
-                            "number_in_stock": int(row["number_in_stock"] or 0),
-                            "description": row.get("description") or "No description available",
-                            "rating": float(row.get("rating") or 4.0),
-                            "status": str(row.get("status") or "available").lower(),
-                        }
-                    )
-
-                    created += int(was_created)
-                    updated += int(not was_created)
-
-            messages.success(request, f"Books Imported Successfully! Created: {created}, Updated: {updated}")
-            return redirect("import_books")
+            job = jobs.enqueue('import_books', input_file=request.FILES['excel_file'], created_by=request.admin_user)
+            return redirect('job_detail', pk=job.pk)
 
     else:
         form = UploadExcelForm()
@@ -1562,281 +1400,143 @@ def import_books(request):
 
 ### Export Functions
 
+def _delta_export_response(request, name):
+    """Rows of a report changed since ?since= (ISO date or date-time) or ?cursor=, and deletions, as CSV.
+
+    A since or cursor older than the tombstone retention gets the full report, marked
+    X-Export-Delta: full, which replaces the consumer's copy instead of updating it.
+    """
+    report = exports.REPORTS[name]
+    if request.GET.get('format', 'csv').lower() != 'csv':
+        messages.error(request, "Delta exports are only available as CSV.")
+        return redirect(report.list_view)
+    try:
+        if 'cursor' in request.GET:
+            since = exports.parse_cursor(request.GET['cursor'])
+        else:
+            since = exports.parse_since(request.GET['since'])
+    except ValueError:
+        messages.error(request, "Invalid since or cursor value.")
+        return redirect(report.list_view)
+
+    cursor = exports.next_cursor()
+    if exports.delta_expired(since):
+        # deletions before the tombstone retention window are gone: send everything instead
+        response = StreamingHttpResponse(exports.stream_csv(name), content_type=exports.FORMATS['csv'])
+        response['Content-Disposition'] = f'attachment; filename="{report.filename}.csv"'
+        response['X-Export-Delta'] = 'full'
+    else:
+        response = StreamingHttpResponse(exports.stream_delta_csv(name, since), content_type=exports.FORMATS['csv'])
+        response['Content-Disposition'] = f'attachment; filename="{report.filename}_delta.csv"'
+        response['X-Export-Delta'] = 'changes'
+    response['X-Export-Cursor'] = cursor
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def _export_response(request, name):
+    """Download a report, from the export cache when its tables are unchanged.
+
+    Uncached reports are rendered directly, or queued as a job when they are large or
+    ?background=1.  The cache stamp is the ETag, so an unchanged report answers
+    If-None-Match with 304.  ?since= or ?cursor= asks for a delta export instead, and every
+    download carries the cursor for the next delta in X-Export-Cursor.
+    """
+    report = exports.REPORTS[name]
+    if 'since' in request.GET or 'cursor' in request.GET:
+        return _delta_export_response(request, name)
+    format_type = request.GET.get('format', 'csv').lower()
+    if format_type not in exports.FORMATS:
+        messages.error(request, "Invalid format specified.")
+        return redirect(report.list_view)
+    if format_type == 'pdf' and not exports.REPORTLAB_AVAILABLE:
+        messages.error(request, "PDF export requires reportlab library.")
+        return redirect(report.list_view)
+
+    cursor = exports.next_cursor()
+    stamp = exports.version_stamp(name)
+    etag = f'W/"{name}-{format_type}-{stamp}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    filename = f"{report.filename}.{format_type}"
+    cached = exports.open_cached(name, format_type, stamp)
+
+    if cached is not None:
+        response = FileResponse(cached, as_attachment=True, filename=filename,
+                                content_type=exports.FORMATS[format_type])
+    else:
+        rows = report.queryset().count()
+        if not rows:
+            messages.warning(request, report.empty_message)
+            return redirect(report.list_view)
+        # CSV is streamed row by row, so only an explicit request sends it to the background
+        too_large = format_type != 'csv' and rows > EXPORT_BACKGROUND_ROWS
+        if request.GET.get('background') or too_large:
+            job = jobs.enqueue('export', {'report': name, 'format': format_type}, created_by=request.admin_user)
+            return redirect('job_detail', pk=job.pk)
+
+        if format_type == 'csv':
+            response = StreamingHttpResponse(exports.stream_csv(name, stamp), content_type=exports.FORMATS['csv'])
+            response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        else:
+            with exports.caching(name, format_type, stamp) as out:
+                exports.render_export(name, format_type, out)
+            response = FileResponse(out, as_attachment=True, filename=filename,
+                                    content_type=exports.FORMATS[format_type])
+    response['ETag'] = etag
+    response['X-Export-Cursor'] = cursor
+    # reports hold personal data: keep them out of shared caches and revalidate every time
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 @admin_login_required
 def export_issues(request):
     """Export issues data in different formats"""
-    format_type = request.GET.get('format', 'csv').lower()
-    
-    # Get all issues
-    issues = Issue.objects.select_related('reader', 'book').all().order_by('-issued_date')
-    
-    # Create data list
-    data = []
-    for issue in issues:
-        data.append({
-            'Reader Name': issue.reader.name,
-            'Reader ID': issue.reader.reader_id,
-            'Book Name': issue.book.name,
-            'ISBN': issue.book.isbn,
-            'Issued Date': issue.issued_date,
-            'Due Date': issue.due_date,
-            'Returned Date': issue.returned_date or 'Not Returned',
-            'Status': 'Returned' if issue.returned_date else 'Not Returned',
-        })
-    
-    if not data:
-        messages.warning(request, "No issues found to export.")
-        return redirect('view_issues')
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="issues.csv"'
-        
-        writer = csv.DictWriter(response, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-        return response
-    
-    elif format_type == 'xlsx':
-        df = pd.DataFrame(data)
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="issues.xlsx"'
-        
-        with io.BytesIO() as buffer:
-            df.to_excel(buffer, index=False)
-            response.write(buffer.getvalue())
-        return response
-    
-    elif format_type == 'pdf':
-        if not REPORTLAB_AVAILABLE:
-            messages.error(request, "PDF export requires reportlab library.")
-            return redirect('view_issues')
-        
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="issues.pdf"'
-        
-        doc = SimpleDocTemplate(response, pagesize=A4)
-        elements = []
-        
-        # Title
-        styles = getSampleStyleSheet()
-        title = Paragraph("Issues Report", styles['Title'])
-        elements.append(title)
-        
-        # Table data
-        table_data = [['Reader Name', 'Reader ID', 'Book Name', 'ISBN', 'Issued Date', 'Due Date', 'Returned Date', 'Status']]
-        for item in data:
-            table_data.append([
-                item['Reader Name'],
-                item['Reader ID'],
-                item['Book Name'],
-                item['ISBN'],
-                str(item['Issued Date']),
-                str(item['Due Date']),
-                str(item['Returned Date']),
-                item['Status'],
-            ])
-        
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-        
-        doc.build(elements)
-        return response
-    
-    messages.error(request, "Invalid format specified.")
-    return redirect('view_issues')
+    return _export_response(request, 'issues')
 
 
 @admin_login_required
 def export_fines(request):
     """Export fines data in different formats"""
-    format_type = request.GET.get('format', 'csv').lower()
-    
-    # Get all fines
-    fines = Fine.objects.select_related('issue__reader', 'issue__book').all().order_by('-calculated_date')
-    
-    # Create data list
-    data = []
-    for fine in fines:
-        data.append({
-            'Reader Name': fine.issue.reader.name,
-            'Reader ID': fine.issue.reader.reader_id,
-            'Book Name': fine.issue.book.name,
-            'Amount': float(fine.amount),
-            'Calculated Date': fine.calculated_date,
-            'Status': 'Paid' if fine.paid else 'Unpaid',
-        })
-    
-    if not data:
-        messages.warning(request, "No fines found to export.")
-        return redirect('view_fines')
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="fines.csv"'
-        
-        writer = csv.DictWriter(response, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-        return response
-    
-    elif format_type == 'xlsx':
-        df = pd.DataFrame(data)
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="fines.xlsx"'
-        
-        with io.BytesIO() as buffer:
-            df.to_excel(buffer, index=False)
-            response.write(buffer.getvalue())
-        return response
-    
-    elif format_type == 'pdf':
-        if not REPORTLAB_AVAILABLE:
-            messages.error(request, "PDF export requires reportlab library.")
-            return redirect('view_fines')
-        
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="fines.pdf"'
-        
-        doc = SimpleDocTemplate(response, pagesize=A4)
-        elements = []
-        
-        # Title
-        styles = getSampleStyleSheet()
-        title = Paragraph("Fines Report", styles['Title'])
-        elements.append(title)
-        
-        # Table data
-        table_data = [['Reader Name', 'Reader ID', 'Book Name', 'Amount', 'Calculated Date', 'Status']]
-        for item in data:
-            table_data.append([
-                item['Reader Name'],
-                item['Reader ID'],
-                item['Book Name'],
-                f"₹{item['Amount']}",
-                str(item['Calculated Date']),
-                item['Status'],
-            ])
-        
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-        
-        doc.build(elements)
-        return response
-    
-    messages.error(request, "Invalid format specified.")
-    return redirect('view_fines')
+    return _export_response(request, 'fines')
 
 
 @admin_login_required
 def export_readers(request):
     """Export readers data in different formats"""
-    format_type = request.GET.get('format', 'csv').lower()
-    
-    # Get all readers
-    readers = Reader.objects.all().order_by('name')
-    
-    # Create data list
-    data = []
-    for reader in readers:
-        data.append({
-            'Reader ID': reader.reader_id,
-            'Name': reader.name,
-            'Date of Birth': reader.date_of_birth,
-            'Phone': reader.phone_number,
-            'Address': reader.address,
-            'Status': 'Active' if reader.is_active else 'Inactive',
-            'Role': 'Staff/Teacher' if reader.is_staff_member else 'Student',
-        })
-    
-    if not data:
-        messages.warning(request, "No readers found to export.")
-        return redirect('view_readers')
-    
-    if format_type == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="readers.csv"'
-        
-        writer = csv.DictWriter(response, fieldnames=data[0].keys())
-        writer.writeheader()
-        writer.writerows(data)
-        return response
-    
-    elif format_type == 'xlsx':
-        df = pd.DataFrame(data)
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        response['Content-Disposition'] = 'attachment; filename="readers.xlsx"'
-        
-        with io.BytesIO() as buffer:
-            df.to_excel(buffer, index=False)
-            response.write(buffer.getvalue())
-        return response
-    
-    elif format_type == 'pdf':
-        if not REPORTLAB_AVAILABLE:
-            messages.error(request, "PDF export requires reportlab library.")
-            return redirect('view_readers')
-        
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="readers.pdf"'
-        
-        doc = SimpleDocTemplate(response, pagesize=A4)
-        elements = []
-        
-        # Title
-        styles = getSampleStyleSheet()
-        title = Paragraph("Readers Report", styles['Title'])
-        elements.append(title)
-        
-        # Table data
-        table_data = [['Reader ID', 'Name', 'Date of Birth', 'Phone', 'Address', 'Status', 'Role']]
-        for item in data:
-            table_data.append([
-                item['Reader ID'],
-                item['Name'],
-                str(item['Date of Birth']),
-                item['Phone'],
-                item['Address'][:20] + '...' if len(item['Address']) > 20 else item['Address'],
-                item['Status'],
-                item['Role'],
-            ])
-        
-        table = Table(table_data)
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ]))
-        elements.append(table)
-        
-        doc.build(elements)
-        return response
-    
-    messages.error(request, "Invalid format specified.")
-    return redirect('view_readers')
+    return _export_response(request, 'readers')
 
+
+### Background jobs
+
+@admin_login_required
+def job_detail(request, pk):
+    job = get_object_or_404(Job, pk=pk)
+    return render(request, 'job_detail.html', {'job': job})
+
+
+@admin_login_required
+def job_status(request, pk):
+    """Progress of a job as JSON, polled by job_detail.html."""
+    job = get_object_or_404(Job, pk=pk)
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'processed': job.processed,
+        'total': job.total,
+        'errors': job.errors,
+        'eta_seconds': jobs.eta_seconds(job),
+        'message': job.message,
+        'download_url': reverse('job_download', args=[job.pk]) if job.artifact else None,
+    })
+
+
+@admin_login_required
+def job_download(request, pk):
+    job = get_object_or_404(Job, pk=pk, status='done')
+    if not job.artifact:
+        raise Http404('This job has no file to download')
+    return FileResponse(job.artifact.open('rb'), as_attachment=True, filename=job.artifact_filename or None)